@@ -0,0 +1,78 @@
+"""
+Admission of the fountains requests by workload, so bulk requests (area, world) cannot take the worker threads
+and Overpass slots of the interactive requests (radius, bbox, batch)
+"""
+
+from typing import Any, AsyncIterator, Callable, Dict
+
+from os import getenv
+
+from fastapi import Request
+
+from app.services.admission import WorkloadPool
+from app.services.overpass_scheduler import Priority
+
+WORKLOADS = {
+    # workload: (concurrency, queue size, queue timeout seconds, concurrency per client)
+    Priority.INTERACTIVE: (32, 64, 10, 8),
+    Priority.BULK: (4, 8, 30, 1),
+}
+"""
+Default limits of each workload
+"""
+
+_pools: Dict[Priority, WorkloadPool] | None = None
+
+def admission_pools() -> Dict[Priority, WorkloadPool]:
+    """
+    Pools of each workload (lazy), from ADMISSION_<WORKLOAD>_CONCURRENCY, ADMISSION_<WORKLOAD>_QUEUE,
+    ADMISSION_<WORKLOAD>_QUEUE_TIMEOUT and ADMISSION_<WORKLOAD>_CLIENT environment variables
+    """
+    global _pools # pylint: disable=global-statement
+
+    if _pools is None:
+        _pools = {}
+
+        for workload, (concurrency, queue_size, queue_timeout, client_concurrency) in WORKLOADS.items():
+            name = workload.name.lower()
+            prefix = f'ADMISSION_{workload.name}'
+
+            _pools[workload] = WorkloadPool(name,
+                                            concurrency=int(getenv(f'{prefix}_CONCURRENCY', str(concurrency))),
+                                            queue_size=int(getenv(f'{prefix}_QUEUE', str(queue_size))),
+                                            queue_timeout=float(getenv(f'{prefix}_QUEUE_TIMEOUT', str(queue_timeout))),
+                                            client_concurrency=int(getenv(f'{prefix}_CLIENT', str(client_concurrency))))
+
+    return _pools
+
+def admission_threads() -> int:
+    """
+    Worker threads needed to run all the admitted requests at once
+    """
+    return sum(pool.concurrency for pool in admission_pools().values())
+
+def client_id(request: Request) -> str:
+    """
+    Client address (the forwarded address when uvicorn runs with --proxy-headers behind a trusted proxy)
+    """
+    return request.client.host if request.client else 'unknown'
+
+def admission(workload: Priority) -> Callable[[Request], AsyncIterator[None]]:
+    """
+    Dependency that holds a slot of the workload until the response is sent,
+    or rejects the request with 429 Too Many Requests and Retry-After
+    """
+    async def admit(request: Request) -> AsyncIterator[None]:
+        pool = admission_pools()[workload]
+        client = client_id(request)
+        admitted_at = await pool.acquire(client)
+
+        try:
+            yield
+        finally:
+            pool.release(client, admitted_at)
+
+    return admit
+
+def admission_stats() -> Dict[str, Any]:
+    return { workload.name.lower(): pool.stats() for workload, pool in admission_pools().items() }
@@ -1,24 +1,174 @@
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
 
-from fastapi import APIRouter, Depends, Request
-from fastapi.responses import JSONResponse
+from os import getenv
 
-from app.services.transform_fountains import transform_fountains_osm
-from app.services.openstreetmap_api import OpenStreetMapAPI
-from app.models.response import FountainsOpenStreetMapResponse
-from app.api.params import AreaQueryParams, RadiusQueryParams, BboxQueryParams
-from app.errors import ErrorResponse
+import json
+import os.path
+import threading
+
+from fastapi import APIRouter, Depends, Request, status as HTTPStatus
+from fastapi.responses import Response, StreamingResponse
+
+from app.services.transform_fountains import transform_fountains_osm, iter_fountains_osm
+from app.services.openstreetmap_api import OpenStreetMapAPI, query_cache
+from app.services.overpass_scheduler import Priority
+from app.services.prefetch import Prefetcher, HotQuery, HOT_QUERIES_FILE
+from app.services.snapshot import SnapshotStore
+from app.services.search import SearchIndex
+from app.services.changes import ChangeLog, HistoryExpiredError, changes_file
+from app.services.batch import search_filter, split_batch
+from app.services.deadline import start_deadline, check_deadline
+from app.services.dedup import merge_duplicates
+from app.services.filters import matches
+from app.services.route import Route, along_route
+from app.services.compression import EncodedBody, EncodedBodyCache, compression_levels, negotiate_encoding, compress_stream, CACHED_LEVELS
+from app.services.formats import ENCODERS, MEDIA_TYPES
+from app.models.fountain import FountainOpenStreetMap
+from app.models.filter import FountainFilter
+from app.models.response import OpenStreetMapResponse, FountainsOpenStreetMapResponse, FountainsChangesResponse, ResponseFormat
+from app.models.batch import FountainsBatchRequest, FountainsBatchResponse, BatchQueryResult
+from app.models.route import FountainsAlongRequest, FountainsAlongResponse, FountainAlongRoute
+from app.api.admission import admission
+from app.api.params import CommonQueryParams, AreaQueryParams, RadiusQueryParams, BboxQueryParams, SnapshotQueryParams, ChangesQueryParams, SearchQueryParams
+from app.errors import ErrorResponse, RequestError
+from app.profiling import profiled
+
+from app.config import logger
 
 router = APIRouter(
     prefix="/fountains",
     responses={
         408: { "description": "Request timed out", "model": ErrorResponse },
+        429: { "description": "Too many requests (see Retry-After header)", "model": ErrorResponse },
         502: { "description": "OpenStreetMap request error", "model": ErrorResponse }
     })
 
-osm_api = OpenStreetMapAPI()
+FORMAT_RESPONSES: Dict[int | str, Dict[str, Any]] = {
+    200: { "content": { MEDIA_TYPES[response_format]: {} for response_format in ENCODERS } },
+}
+"""
+Other media types of the fountains responses (format parameter)
+"""
+
+_osm_api: OpenStreetMapAPI | None = None
+
+def osm_api() -> OpenStreetMapAPI:
+    """
+    OpenStreetMap API (lazy, created on the first request)
+    """
+    global _osm_api # pylint: disable=global-statement
+
+    if _osm_api is None:
+        _osm_api = OpenStreetMapAPI(query_cache=query_cache())
+
+    return _osm_api
+
+_prefetcher: Prefetcher | None = None
+
+def prefetcher() -> Prefetcher | None:
+    """
+    Prefetcher of the most requested queries (lazy, started on creation), None unless PREFETCH_TOP is set
+    """
+    global _prefetcher # pylint: disable=global-statement
+
+    top = int(getenv('PREFETCH_TOP', '0'))
+
+    if _prefetcher is None and top > 0:
+        _prefetcher = Prefetcher(fetch_hot_query,
+                                 top=top,
+                                 ttl=float(getenv('PREFETCH_TTL', '600')),
+                                 stale_ttl=float(getenv('PREFETCH_STALE_TTL', '3600')),
+                                 concurrency=int(getenv('PREFETCH_CONCURRENCY', '1')),
+                                 hot_queries_file=getenv('PREFETCH_FILE', HOT_QUERIES_FILE),
+                                 min_score=float(getenv('PREFETCH_MIN_SCORE', '3')),
+                                 max_areas=int(getenv('PREFETCH_MAX_AREAS', '1')))
+        _prefetcher.start()
+
+    return _prefetcher
+
+def fetch_hot_query(query: HotQuery, timeout: int) -> Dict[str, Any]:
+    if query.kind == 'area':
+        area, = query.params
+        return osm_api().get_fountains_by_area(area, timeout=timeout, all_tags=query.all_tags, priority=Priority.PREFETCH)
+
+    if query.kind == 'radius':
+        lat, long, radius = query.params
+        return osm_api().get_fountains_by_radius(lat, long, radius, timeout=timeout, all_tags=query.all_tags, priority=Priority.PREFETCH)
+
+    return osm_api().get_fountains_by_bbox(*query.params, timeout=timeout, all_tags=query.all_tags, priority=Priority.PREFETCH)
+
+def get_hot_query(query: HotQuery, params: CommonQueryParams, fetch: Callable[[], Dict[str, Any]]) -> Tuple[Dict[str, Any], float | None]:
+    """
+    Query result from the prefetcher (queries without updated and attribute filters), or fetched now,
+    and the time it was prefetched (None if fetched now)
+    """
+    hot_queries = prefetcher()
+
+    if hot_queries is None or params.updated is not None or params.filters is not None:
+        return fetch(), None
+
+    return hot_queries.get(query, params.timeout, fetch)
 
-@router.get("/", response_model=FountainsOpenStreetMapResponse | Dict[str, Any])
+_encoded_bodies: EncodedBodyCache | None = None
+
+def encoded_bodies() -> EncodedBodyCache:
+    """
+    Compressed responses of the snapshot and prefetched results (lazy), from RESPONSE_CACHE_SIZE (responses)
+    and RESPONSE_CACHE_MB environment variables
+    """
+    global _encoded_bodies # pylint: disable=global-statement
+
+    if _encoded_bodies is None:
+        _encoded_bodies = EncodedBodyCache(size=int(getenv('RESPONSE_CACHE_SIZE', '32')),
+                                           max_bytes=int(getenv('RESPONSE_CACHE_MB', '256')) * 1024 * 1024)
+
+    return _encoded_bodies
+
+SNAPSHOT_FILE = "snapshots/fountains.snapshot"
+
+_snapshot_store: SnapshotStore | None = None
+
+def snapshot_store() -> SnapshotStore:
+    """
+    Store of the snapshot published in SNAPSHOT_FILE (lazy)
+    """
+    global _snapshot_store # pylint: disable=global-statement
+
+    if _snapshot_store is None:
+        _snapshot_store = SnapshotStore(getenv('SNAPSHOT_FILE', SNAPSHOT_FILE))
+
+    return _snapshot_store
+
+_search_index = SearchIndex()
+
+def update_search_index():
+    """
+    Index the changes of the current snapshot for search (fully indexed the first time)
+    """
+    snapshot = snapshot_store().current()
+
+    if snapshot is not None:
+        _search_index.update(snapshot)
+
+def index_snapshots(stop: threading.Event):
+    """
+    Keep the search index updated to the current snapshot until stopped.
+    Run in the background by the app, so searches never wait for the index to be updated.
+    """
+    while not stop.is_set():
+        try:
+            update_search_index()
+        except Exception as e: # pylint: disable=broad-exception-caught
+            logger.warning('search index update failed: %s', repr(e))
+
+        stop.wait(snapshot_store().check_interval)
+
+def search_stats() -> Dict[str, Any]:
+    return _search_index.stats()
+
+@router.get("/", response_model=FountainsOpenStreetMapResponse | Dict[str, Any], responses=FORMAT_RESPONSES,
+            dependencies=[Depends(admission(Priority.BULK))])
+@profiled
 def get_fountains_by_area(
     request: Request,
     params: AreaQueryParams = Depends(),
@@ -32,20 +182,32 @@ def get_fountains_by_area(
     - **updated**: Search only fountains updated since a specified datetime, in ISO 8601 format.
     - **raw**: Set to true to get the raw OSM data.
     - **osm**: Include OSM extra information (type, id, version, url, tags). Ignored if raw is true.
-    - **timeout**: Timeout in seconds for the OSM API request (maximum 30 minutes).
+    - **format**: Response format: json, msgpack (MessagePack), geojson (GeoJSON FeatureCollection) or fgb (FlatGeobuf with spatial index). Ignored if raw is true.
+    - **dedup**: Merge near-duplicate fountains within this distance in meters (maximum 100), keeping the merged provider ids in merged_ids. Ignored if raw is true.
+    - **type**, **safe_water**, **access**, **wheelchair**, **bottles**: Only fountains with any of the given values of each field (repeat type, safe_water and access for more values). Ignored if raw is true.
+    - **timeout**: Timeout in seconds for the request: geocoding, OSM API request and transform (maximum 30 minutes).
 
     Returns:
-    - JSON with fountains data either in raw OSM format or processed format.
+    - Fountains data either in raw OSM format (JSON) or processed format (in the requested format).
     """
+    start_deadline(params.timeout)
+
+    prefetched_at = None
+
     if params.area:
-        osm_data = osm_api.get_fountains_by_area(params.area,
-                                                 updated=params.updated, timeout=params.timeout)
+        area = params.area
+        osm_data, prefetched_at = get_hot_query(HotQuery('area', (area,), params.all_tags), params,
+                                 lambda: osm_api().get_fountains_by_area(area,
+                                                                         updated=params.updated, timeout=params.timeout, all_tags=params.all_tags,
+                                                                         filters=params.filters))
     else:
-        osm_data = osm_api.get_fountains(updated=params.updated, timeout=params.timeout)
+        osm_data = osm_api().get_fountains(updated=params.updated, timeout=params.timeout, all_tags=params.all_tags, filters=params.filters)
 
-    return build_fountains_response(request, osm_data, params.raw, params.osm)
+    return build_fountains_response(request, 'area', osm_data, params, prefetched_at)
 
-@router.get("/radius", response_model=FountainsOpenStreetMapResponse | Dict[str, Any])
+@router.get("/radius", response_model=FountainsOpenStreetMapResponse | Dict[str, Any], responses=FORMAT_RESPONSES,
+            dependencies=[Depends(admission(Priority.INTERACTIVE))])
+@profiled
 def get_fountains_by_radius(
     request: Request,
     params: RadiusQueryParams = Depends(),
@@ -60,17 +222,26 @@ def get_fountains_by_radius(
     - **updated**: Search only fountains updated since a specified datetime, in ISO 8601 format.
     - **raw**: Set to true to get the raw OSM data.
     - **osm**: Include OSM extra information (type, id, version, url, tags). Ignored if raw is true.
-    - **timeout**: Timeout in seconds for the OSM API request (maximum 30 minutes).
+    - **format**: Response format: json, msgpack (MessagePack), geojson (GeoJSON FeatureCollection) or fgb (FlatGeobuf with spatial index). Ignored if raw is true.
+    - **dedup**: Merge near-duplicate fountains within this distance in meters (maximum 100), keeping the merged provider ids in merged_ids. Ignored if raw is true.
+    - **type**, **safe_water**, **access**, **wheelchair**, **bottles**: Only fountains with any of the given values of each field (repeat type, safe_water and access for more values). Ignored if raw is true.
+    - **timeout**: Timeout in seconds for the request: OSM API request and transform (maximum 30 minutes).
 
     Returns:
-    - JSON with fountains data either in raw OSM format or processed format.
+    - Fountains data either in raw OSM format (JSON) or processed format (in the requested format).
     """
-    osm_data = osm_api.get_fountains_by_radius(params.lat, params.long, params.radius,
-                                               updated=params.updated, timeout=params.timeout)
+    start_deadline(params.timeout)
+
+    osm_data, prefetched_at = get_hot_query(HotQuery('radius', (params.lat, params.long, params.radius), params.all_tags), params,
+                             lambda: osm_api().get_fountains_by_radius(params.lat, params.long, params.radius,
+                                                                       updated=params.updated, timeout=params.timeout, all_tags=params.all_tags,
+                                                                       filters=params.filters))
 
-    return build_fountains_response(request, osm_data, params.raw, params.osm)
+    return build_fountains_response(request, 'radius', osm_data, params, prefetched_at)
 
-@router.get("/bbox", response_model=FountainsOpenStreetMapResponse | Dict[str, Any])
+@router.get("/bbox", response_model=FountainsOpenStreetMapResponse | Dict[str, Any], responses=FORMAT_RESPONSES,
+            dependencies=[Depends(admission(Priority.INTERACTIVE))])
+@profiled
 def get_fountains_by_bbox(
     request: Request,
     params: BboxQueryParams = Depends(),
@@ -86,37 +257,423 @@ def get_fountains_by_bbox(
     - **updated**: Search only fountains updated since a specified datetime, in ISO 8601 format.
     - **raw**: Set to true to get the raw OSM data.
     - **osm**: Include OSM extra information (type, id, version, url, tags). Ignored if raw is true.
-    - **timeout**: Timeout in seconds for the OSM API request (maximum 30 minutes).
+    - **format**: Response format: json, msgpack (MessagePack), geojson (GeoJSON FeatureCollection) or fgb (FlatGeobuf with spatial index). Ignored if raw is true.
+    - **dedup**: Merge near-duplicate fountains within this distance in meters (maximum 100), keeping the merged provider ids in merged_ids. Ignored if raw is true.
+    - **type**, **safe_water**, **access**, **wheelchair**, **bottles**: Only fountains with any of the given values of each field (repeat type, safe_water and access for more values). Ignored if raw is true.
+    - **timeout**: Timeout in seconds for the request: OSM API request and transform (maximum 30 minutes).
+
+    Returns:
+    - Fountains data either in raw OSM format (JSON) or processed format (in the requested format).
+    """
+    start_deadline(params.timeout)
+
+    bbox = (params.south_lat, params.west_long, params.north_lat, params.east_long)
+    osm_data, prefetched_at = get_hot_query(HotQuery('bbox', bbox, params.all_tags), params,
+                             lambda: osm_api().get_fountains_by_bbox(*bbox,
+                                                                     updated=params.updated, timeout=params.timeout, all_tags=params.all_tags,
+                                                                     filters=params.filters))
+
+    return build_fountains_response(request, 'bbox', osm_data, params, prefetched_at)
+
+@router.post("/batch", response_model=FountainsBatchResponse, dependencies=[Depends(admission(Priority.INTERACTIVE))])
+@profiled
+def get_fountains_batch(
+    request: Request,
+    batch: FountainsBatchRequest,
+):
+    """
+    Find fountains of many radius and bbox queries at once, with a single OpenStreetMap request.
+
+    Body:
+    - **queries**: List of radius (`type`: `radius`, `lat`, `long`, `radius`) and bbox (`type`: `bbox`, `south_lat`, `west_long`, `north_lat`, `east_long`) queries,
+      with an optional `id` (maximum 100 queries).
+    - **updated**: Search only fountains updated since a specified datetime, in ISO 8601 format.
+    - **osm**: Include OSM extra information (type, id, version, url, tags).
+    - **timeout**: Timeout in seconds for the request: OSM API request and transform (maximum 30 minutes).
 
     Returns:
-    - JSON with fountains data either in raw OSM format or processed format.
+    - JSON with the unique fountains of all the queries, and the provider ids of the fountains of each query (by id or index).
     """
-    osm_data = osm_api.get_fountains_by_bbox(params.south_lat, params.west_long, params.north_lat, params.east_long,
-                                             updated=params.updated, timeout=params.timeout)
+    start_deadline(batch.timeout)
+
+    osm_data = osm_api().get_fountains_batch([search_filter(query) for query in batch.queries],
+                                             updated=batch.updated, timeout=batch.timeout, all_tags=batch.osm)
+
+    fountains = transform_fountains_osm(osm_data, batch.osm)
+
+    check_deadline()
+
+    response = FountainsBatchResponse(
+        query_url=str(request.url),
+        count=len(fountains),
+        fountains=fountains,
+        queries={
+            key: BatchQueryResult(count=len(provider_ids), provider_ids=provider_ids)
+            for key, provider_ids in zip(batch.keys(), split_batch(batch.queries, fountains))
+        }
+    )
 
-    return build_fountains_response(request, osm_data, params.raw, params.osm)
+    return encoded_response(request, 'batch', EncodedBody(json_body(response.model_dump(
+        mode='json',
+        exclude_none=True,
+        exclude={
+            'fountains': {
+                '__all__': { 'provider_name' }
+            }
+        }
+    ))))
 
+@router.post("/along", response_model=FountainsAlongResponse, dependencies=[Depends(admission(Priority.INTERACTIVE))])
+@profiled
+def get_fountains_along(
+    request: Request,
+    along: FountainsAlongRequest,
+):
+    """
+    Find fountains along a route (e.g. a hiking or cycling track), with a single OpenStreetMap request.
 
-def build_fountains_response(request: Request, osm_data: Dict[str, Any], raw: bool, osm: bool) -> JSONResponse:
+    Body:
+    - **polyline**: Route as an encoded polyline, with its **precision** (5 by default, 6 for OSRM or Valhalla routes).
+    - **line**: Route as a GeoJSON LineString geometry (`coordinates` as longitude, latitude), instead of polyline.
+    - **buffer**: Maximum distance in meters from the route (1 to 5000).
+    - **updated**: Search only fountains updated since a specified datetime, in ISO 8601 format.
+    - **osm**: Include OSM extra information (type, id, version, url, tags).
+    - **timeout**: Timeout in seconds for the request: OSM API request and transform (maximum 30 minutes).
+
+    Returns:
+    - JSON with the fountains within the buffer of the route ordered by distance along the route,
+      with their distance along the route (`distance_along`) and to the route (`distance_to_route`) in meters.
+    """
+    start_deadline(along.timeout)
+
+    route = Route(along.points(), along.buffer)
+    line, radius = route.around()
+
+    osm_data = osm_api().get_fountains_along(line, radius, updated=along.updated, timeout=along.timeout, all_tags=along.osm)
+
+    fountains = [
+        FountainAlongRoute.model_construct(**fountain.__dict__, distance_along=round(distance_along, 1), distance_to_route=round(distance_to_route, 1))
+        for fountain, distance_along, distance_to_route in along_route(route, iter_fountains_osm(osm_data, along.osm))
+    ]
+
+    check_deadline()
+
+    response = FountainsAlongResponse(
+        query_url=str(request.url),
+        count=len(fountains),
+        length=round(route.length, 1),
+        fountains=fountains,
+    )
+
+    return encoded_response(request, 'along', EncodedBody(json_body(response.model_dump(
+        mode='json',
+        exclude_none=True,
+        exclude={
+            'fountains': {
+                '__all__': { 'provider_name' }
+            }
+        }
+    ))))
+
+@router.get("/snapshot", response_model=FountainsOpenStreetMapResponse, responses={
+    **FORMAT_RESPONSES,
+    404: { "description": "No snapshot available", "model": ErrorResponse },
+})
+@profiled
+def get_fountains_from_snapshot(
+    request: Request,
+    params: SnapshotQueryParams = Depends(),
+):
+    """
+    Find fountains in the latest snapshot published by the CLI (`--snapshot`), optionally within a bounding box.
+    Faster than querying OpenStreetMap, but only as recent as the snapshot.
+
+    Parameters:
+    - **south_lat**, **west_long**, **north_lat**, **east_long**: Bounding box (optional, all or none).
+    - **format**: Response format: json, msgpack (MessagePack), geojson (GeoJSON FeatureCollection) or fgb (FlatGeobuf with spatial index).
+
+    Returns:
+    - Fountains data in processed format (without OSM extra information). Supports range requests when uncompressed (e.g. FlatGeobuf clients).
+    """
+    snapshot = snapshot_store().current()
+
+    if snapshot is None:
+        raise RequestError(HTTPStatus.HTTP_404_NOT_FOUND, "No fountains snapshot available")
+
+    indices = None
+
+    if params.bbox is not None:
+        indices = list(snapshot.within_bbox(*params.bbox))
+
+    query_url = str(request.url)
+
+    def build() -> bytes:
+        if params.format == ResponseFormat.JSON:
+            return json_body(fountains_content(query_url, list(snapshot.fountains(indices))))
+
+        count = len(snapshot) if indices is None else len(indices)
+
+        return b''.join(encode_fountains(params.format, query_url, snapshot.fountains(indices), count))
+
+    body = encoded_bodies().get(('snapshot', snapshot.stat.st_ino, snapshot.stat.st_mtime_ns, query_url), build)
+
+    return encoded_response(request, 'snapshot', body, CACHED_LEVELS, media_type=MEDIA_TYPES[params.format], ranges=True)
+
+@router.get("/search", response_model=FountainsOpenStreetMapResponse, responses={
+    **FORMAT_RESPONSES,
+    404: { "description": "No snapshot available or area not found", "model": ErrorResponse },
+}, dependencies=[Depends(admission(Priority.INTERACTIVE))])
+@profiled
+def search_fountains(
+    request: Request,
+    params: SearchQueryParams = Depends(),
+):
+    """
+    Search fountains by name, description or address in the latest snapshot published by the CLI (`--snapshot`),
+    optionally within an area or a bounding box.
+
+    Parameters:
+    - **q**: Text to search. Accents and case are ignored, every word must match a word (or the beginning of a word) of the fountain.
+    - **area**: Search in a geographical region (geocode area: country, city, state...), as its bounding box.
+    - **south_lat**, **west_long**, **north_lat**, **east_long**: Bounding box (optional, all or none). Exclusive with area.
+    - **limit**: Maximum fountains (default 20).
+    - **format**: Response format: json, msgpack (MessagePack), geojson (GeoJSON FeatureCollection) or fgb (FlatGeobuf with spatial index).
+
+    Returns:
+    - Fountains data in processed format (without OSM extra information), by relevance: matches in the name first, then address and description.
+    """
+    bbox = params.bbox
+
+    if params.area and bbox is not None:
+        raise RequestError(HTTPStatus.HTTP_400_BAD_REQUEST, "area and bounding box cannot be combined")
+
+    if _search_index.snapshot is None:
+        raise RequestError(HTTPStatus.HTTP_404_NOT_FOUND, "No fountains snapshot indexed")
+
+    if params.area:
+        bbox = osm_api().geocoding_api.find_area_bbox(params.area)
+
+    snapshot, rows = _search_index.search(params.q, bbox, params.limit)
+    fountains = list(snapshot.fountains(rows)) if snapshot is not None else []
+    query_url = str(request.url)
+
+    if params.format == ResponseFormat.JSON:
+        body = json_body(fountains_content(query_url, fountains))
+    else:
+        body = b''.join(encode_fountains(params.format, query_url, fountains, len(fountains)))
+
+    return encoded_response(request, 'search', EncodedBody(body), media_type=MEDIA_TYPES[params.format])
+
+@router.get("/changes", response_model=FountainsChangesResponse, responses={
+    404: { "description": "No changes log available", "model": ErrorResponse },
+    410: { "description": "Changes no longer available, sync again from /fountains/snapshot", "model": ErrorResponse },
+})
+def get_fountains_changes(
+    request: Request,
+    params: ChangesQueryParams = Depends(),
+):
+    """
+    Find the fountains created, updated and deleted since a snapshot, to sync incrementally.
+    Changes are computed between the snapshots published by the CLI (`--snapshot`), deletions are only detected by full runs (without `--update`).
+
+    Parameters:
+    - **since**: Sequence of the synced snapshot (`until` of the previous sync) or the datetime when the snapshot was synced.
+    - **cursor**: `next_cursor` of the previous page, if any.
+    - **limit**: Maximum changes per page.
+
+    Returns:
+    - JSON with the provider ids of the created, updated and deleted fountains, and `until` for the next sync.
+    """
+    changes_path = changes_file(getenv('SNAPSHOT_FILE', SNAPSHOT_FILE))
+
+    if not os.path.exists(changes_path):
+        raise RequestError(HTTPStatus.HTTP_404_NOT_FOUND, "No fountains changes log available")
+
+    with ChangeLog(changes_path, read_only=True) as change_log:
+        since = params.since_sequence
+
+        if since is None:
+            since = change_log.sequence_at(params.since_datetime)
+
+        try:
+            if since is None:
+                raise HistoryExpiredError(f"No snapshot published before {params.since}")
+
+            changes = change_log.changes(since, cursor=params.cursor, limit=params.limit)
+        except HistoryExpiredError as e:
+            raise RequestError(HTTPStatus.HTTP_410_GONE, f"{e}, sync again from /fountains/snapshot") from e
+        except ValueError as e:
+            raise RequestError(HTTPStatus.HTTP_400_BAD_REQUEST, "Invalid cursor") from e
+
+    response = FountainsChangesResponse(
+        query_url=str(request.url),
+        since=changes.since,
+        until=changes.until,
+        count=len(changes.created) + len(changes.updated) + len(changes.deleted),
+        created=changes.created,
+        updated=changes.updated,
+        deleted=changes.deleted,
+        next_cursor=changes.next_cursor,
+    )
+
+    return encoded_response(request, 'changes', EncodedBody(json_body(response.model_dump(mode='json', exclude_none=True))))
+
+def build_fountains_response(request: Request, endpoint: str, osm_data: Dict[str, Any], params: CommonQueryParams,
+                            prefetched_at: float | None = None) -> Response:
+    """
+    Fountains response in the requested format, reusing the compressed body of a prefetched result while it is not refreshed
+    (prefetched_at identifies the prefetched result).
+    Other formats than JSON are streamed while encoding, unless prefetched. The fountains are transformed, filtered and
+    merged before the response starts, so a timeout or cancellation is still an error status.
+    """
+    query_url = str(request.url)
+    response_format = ResponseFormat.JSON if params.raw else params.format
+
+    def chunks() -> Iterator[bytes]:
+        fountains = list(iter_response_fountains(osm_data, params.osm, params.dedup, params.filters))
+
+        return encode_fountains(response_format, query_url, fountains, len(fountains),
+                                merged_count(fountains) if params.dedup else None)
+
+    if response_format != ResponseFormat.JSON and prefetched_at is None:
+        return streamed_response(request, endpoint, chunks(), MEDIA_TYPES[response_format])
+
+    def build() -> bytes:
+        if response_format == ResponseFormat.JSON:
+            return json_body(fountains_response_content(query_url, osm_data, params.raw, params.osm, params.dedup, params.filters))
+
+        return b''.join(chunks())
+
+    body = EncodedBody(build()) if prefetched_at is None else encoded_bodies().get(('prefetched', prefetched_at, query_url), build)
+
+    return encoded_response(request, endpoint, body, media_type=MEDIA_TYPES[response_format])
+
+def encode_fountains(response_format: ResponseFormat, query_url: str, fountains: Iterable[FountainOpenStreetMap], count: int,
+                     merged: int | None = None) -> Iterator[bytes]:
+    metadata = OpenStreetMapResponse(query_url=query_url).model_dump(mode='json')
+
+    if merged is not None:
+        metadata["merged"] = merged
+
+    return ENCODERS[response_format](metadata, fountains, count)
+
+def encoded_response(request: Request, endpoint: str, body: EncodedBody, default_levels: Dict[str, int] | None = None,
+                     media_type: str = "application/json", ranges: bool = False) -> Response:
+    """
+    Response compressed with the best encoding accepted by the client, at the levels of the endpoint.
+    With ranges (bodies cached unchanged between requests), a Range request gets the uncompressed bytes range.
+    """
+    headers = { "Vary": "Accept-Encoding" }
+
+    if ranges:
+        headers["Accept-Ranges"] = "bytes"
+
+        if request.headers.get('range'):
+            return range_response(request.headers['range'], body.body, media_type, headers)
+
+    levels = compression_levels(endpoint, default_levels)
+    encoding = negotiate_encoding(request.headers.get('accept-encoding'), levels)
+    content = body.encode(encoding, levels.get(encoding, 0) if encoding else 0)
+
+    if content is not body.body:
+        headers["Content-Encoding"] = encoding # type: ignore
+
+    return Response(content=content, media_type=media_type, headers=headers)
+
+def range_response(range_header: str, body: bytes, media_type: str, headers: Dict[str, str]) -> Response:
+    """
+    Partial response of a single bytes range (start-end, start- or -suffix)
+    """
+    size = len(body)
+    unit, _, byte_range = range_header.partition('=')
+    start_text, _, end_text = byte_range.strip().partition('-')
+
+    try:
+        if unit.strip() != 'bytes' or ',' in byte_range:
+            raise ValueError(range_header)
+
+        if start_text:
+            start, end = int(start_text), min(int(end_text) if end_text else size - 1, size - 1)
+        else:
+            start, end = max(size - int(end_text), 0), size - 1
+    except ValueError:
+        start, end = size, -1
+
+    if start > end or start >= size:
+        return Response(status_code=HTTPStatus.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                        headers={ **headers, "Content-Range": f"bytes */{size}" })
+
+    return Response(content=body[start:end + 1], status_code=HTTPStatus.HTTP_206_PARTIAL_CONTENT, media_type=media_type,
+                    headers={ **headers, "Content-Range": f"bytes {start}-{end}/{size}" })
+
+def streamed_response(request: Request, endpoint: str, chunks: Iterator[bytes], media_type: str) -> Response:
+    """
+    Response streamed while encoding, compressed chunk by chunk with the best encoding accepted by the client
+    """
+    levels = compression_levels(endpoint)
+    encoding = negotiate_encoding(request.headers.get('accept-encoding'), levels)
+
+    headers = { "Vary": "Accept-Encoding" }
+
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+        chunks = compress_stream(chunks, encoding, levels[encoding])
+
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
+
+def json_body(content: Dict[str, Any]) -> bytes:
+    """
+    Compact JSON, as JSONResponse renders it
+    """
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(',', ':')).encode('utf8')
+
+def iter_response_fountains(osm_data: Dict[str, Any], osm: bool, dedup: float | None = None,
+                            filters: FountainFilter | None = None) -> Iterator[FountainOpenStreetMap]:
+    """
+    Fountains of a response in every format: transformed and filtered lazily,
+    with their near-duplicates merged once every fountain is transformed (if dedup)
+    """
+    fountains: Iterable[FountainOpenStreetMap] = iter_fountains_osm(osm_data, osm)
+
+    if filters is not None:
+        fountains = (fountain for fountain in fountains if matches(filters, fountain))
+
+    if dedup:
+        fountains, _ = merge_duplicates(fountains, dedup)
+
+    yield from fountains
+
+def merged_count(fountains: Iterable[FountainOpenStreetMap]) -> int:
+    """
+    Near-duplicates merged into the fountains (a merged duplicate is never kept, so its ids are listed once)
+    """
+    return sum(len(fountain.merged_ids or []) for fountain in fountains)
+
+def fountains_response_content(query_url: str, osm_data: Dict[str, Any], raw: bool, osm: bool,
+                               dedup: float | None = None, filters: FountainFilter | None = None) -> Dict[str, Any]:
     if raw:
-        return JSONResponse(content=osm_data)
+        return osm_data
+
+    fountains = list(iter_response_fountains(osm_data, osm, dedup, filters))
 
-    fountains = transform_fountains_osm(osm_data, osm)
+    return fountains_content(query_url, fountains, merged_count(fountains) if dedup else None)
+
+def fountains_content(query_url: str, fountains: List[FountainOpenStreetMap], merged: int | None = None) -> Dict[str, Any]:
+    check_deadline()
 
     response = FountainsOpenStreetMapResponse(
-        query_url=str(request.url),
+        query_url=query_url,
         count=len(fountains),
+        merged=merged,
         fountains=fountains
     )
 
-    return JSONResponse(
-        content=response.model_dump(
-            mode='json',
-            exclude_none=True,
-            exclude={
-                'fountains': {
-                    '__all__': { 'provider_name' }
-                }
+    return response.model_dump(
+        mode='json',
+        exclude_none=True,
+        exclude={
+            'fountains': {
+                '__all__': { 'provider_name' }
             }
-        )
+        }
     )
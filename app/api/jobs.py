@@ -0,0 +1,113 @@
+from typing import Any, Dict
+
+from datetime import datetime, timezone
+from os import getenv
+
+from fastapi import APIRouter, Depends, Request, status as HTTPStatus
+from fastapi.responses import FileResponse, JSONResponse
+
+from app.api.fountains import osm_api, fountains_response_content
+from app.api.params import AreaQueryParams
+from app.services.jobs import JobManager, JOBS_DIR, job_id
+from app.models.job import Job, JobStatus
+from app.models.response import ResponseFormat
+from app.errors import ErrorResponse, RequestError
+
+router = APIRouter(
+    prefix="/fountains/jobs",
+    responses={
+        404: { "description": "Job not found", "model": ErrorResponse },
+    })
+
+_job_manager: JobManager | None = None
+
+def job_manager() -> JobManager:
+    """
+    Background jobs manager (lazy, created on the first request)
+    """
+    global _job_manager # pylint: disable=global-statement
+
+    if _job_manager is None:
+        _job_manager = JobManager(getenv('JOBS_DIR', JOBS_DIR), workers=int(getenv('JOBS_WORKERS', '2')))
+
+    return _job_manager
+
+@router.post("/", response_model=Job, status_code=HTTPStatus.HTTP_202_ACCEPTED)
+def create_fountains_job(
+    request: Request,
+    params: AreaQueryParams = Depends(),
+):
+    """
+    Find all fountains in an area in the background, for long-running queries (country or world).
+    Identical pending jobs are not duplicated.
+
+    Parameters: same as `/fountains` (only json format).
+
+    Returns:
+    - Job status. Poll `/fountains/jobs/{id}` until completed and download the result from `/fountains/jobs/{id}/result`.
+    """
+    if params.format != ResponseFormat.JSON:
+        raise RequestError(HTTPStatus.HTTP_400_BAD_REQUEST, "Job results are only available in json format")
+
+    job = Job(
+        id=job_id(params.area, params.updated, params.raw, params.osm, params.dedup, params.filters),
+        query_url=str(request.url),
+        area=params.area,
+        updated=params.updated,
+        raw=params.raw,
+        osm=params.osm,
+        dedup=params.dedup,
+        filters=params.filters,
+        timeout=params.timeout,
+        created_at=datetime.now(timezone.utc),
+    )
+
+    job = job_manager().submit(job, run_fountains_job)
+
+    return JSONResponse(
+        status_code=HTTPStatus.HTTP_202_ACCEPTED,
+        content=job.model_dump(mode='json', exclude_none=True),
+        headers={ "Location": str(request.url_for('get_fountains_job', job_id=job.id)) }
+    )
+
+@router.get("/{job_id}", response_model=Job)
+def get_fountains_job(job_id: str):
+    """
+    Get the status of a fountains job.
+    """
+    return JSONResponse(content=find_job(job_id).model_dump(mode='json', exclude_none=True))
+
+@router.get("/{job_id}/result", responses={
+    200: { "content": { "application/gzip": {} }, "description": "Gzip compressed JSON, supports range requests" },
+    409: { "description": "Job not completed", "model": ErrorResponse },
+})
+def get_fountains_job_result(job_id: str):
+    """
+    Download the result of a completed fountains job as gzip compressed JSON.
+    Supports range requests to resume downloads.
+    """
+    job = find_job(job_id)
+
+    if job.status != JobStatus.COMPLETED:
+        raise RequestError(HTTPStatus.HTTP_409_CONFLICT, f"Job {job_id} is {job.status.value}")
+
+    return FileResponse(job_manager().result_path(job_id), media_type="application/gzip", filename=f"fountains-{job_id}.json.gz")
+
+def find_job(job_id: str) -> Job:
+    job = job_manager().get(job_id)
+
+    if job is None:
+        raise RequestError(HTTPStatus.HTTP_404_NOT_FOUND, f"Job {job_id} not found")
+
+    return job
+
+def run_fountains_job(job: Job) -> Dict[str, Any]:
+    all_tags = job.raw or job.osm
+
+    if job.area:
+        osm_data = osm_api().get_fountains_by_area(job.area, updated=job.updated, timeout=job.timeout, all_tags=all_tags,
+                                                   filters=job.filters)
+    else:
+        osm_data = osm_api().get_fountains(updated=job.updated, timeout=job.timeout, all_tags=all_tags, filters=job.filters)
+
+    return fountains_response_content(job.query_url, osm_data, job.raw, job.osm, job.dedup, job.filters)
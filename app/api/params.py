@@ -1,13 +1,23 @@
-from typing import Optional
+from typing import List, Optional, Tuple
 from typing_extensions import Annotated
 
 from dataclasses import dataclass
 
 from datetime import datetime
 
-from fastapi import Query
+from fastapi import Query, status as HTTPStatus
 
-Timeout = Annotated[int, Query(description="Timeout in seconds for the OSM API request (maximum 30 minutes)", le=1800)]
+from app.models.response import ResponseFormat
+from app.models.fountain import FountainType, SafeWater, Access
+from app.models.filter import FountainFilter
+from app.services.dedup import MAX_MERGE_DISTANCE
+from app.errors import RequestError
+
+Format = Annotated[ResponseFormat, Query(description="Response format: json, msgpack (MessagePack), geojson (GeoJSON FeatureCollection) or fgb (FlatGeobuf with spatial index)")]
+
+Dedup = Annotated[Optional[float], Query(description="Merge near-duplicate fountains (e.g. a node and a way of the same fountain) within this distance in meters, keeping the provider ids of the merged fountains in merged_ids. Ignored if raw is true", gt=0, le=MAX_MERGE_DISTANCE)]
+
+Timeout = Annotated[int, Query(description="Timeout in seconds for the request: geocoding, OSM API request and transform (maximum 30 minutes)", le=1800)]
 
 @dataclass
 class AreaQueryParamsBase:
@@ -31,8 +41,34 @@ class CommonQueryParams:
     updated: Annotated[datetime | None, Query(description="Search only fountains updated since a specified datetime, in ISO 8601 format", alias="since")] = None
     raw: Annotated[bool, Query(description="Set to true to get the raw OSM data")] = False
     osm: Annotated[bool, Query(description="Include OSM extra information (type, id, version, url, tags). Ignored if raw is true")] = False
+    format: Format = ResponseFormat.JSON
+    dedup: Dedup = None
+    fountain_type: Annotated[Optional[List[FountainType]], Query(description="Only fountains of any of these types (repeat the parameter for more types). Ignored if raw is true", alias="type")] = None
+    safe_water: Annotated[Optional[List[SafeWater]], Query(description="Only fountains with any of these safe_water values. Ignored if raw is true")] = None
+    access: Annotated[Optional[List[Access]], Query(description="Only fountains with any of these access values. Ignored if raw is true")] = None
+    wheelchair: Annotated[Optional[bool], Query(description="Only wheelchair accessible fountains (true) or not accessible (false). Ignored if raw is true")] = None
+    bottles: Annotated[Optional[bool], Query(description="Only fountains where bottles can be filled (true) or cannot (false). Ignored if raw is true")] = None
     timeout: Timeout = 60
 
+    @property
+    def all_tags(self) -> bool:
+        """
+        Whether all OSM tags are needed (raw or osm), otherwise only the tags used to transform the fountains are requested
+        """
+        return self.raw or self.osm
+
+    @property
+    def filters(self) -> Optional[FountainFilter]:
+        """
+        Attribute filters of the fountains, None if there is no filter or raw is true
+        """
+        if self.raw or (not self.fountain_type and not self.safe_water and not self.access
+                        and self.wheelchair is None and self.bottles is None):
+            return None
+
+        return FountainFilter(type=self.fountain_type or None, safe_water=self.safe_water or None, access=self.access or None,
+                              access_wheelchair=self.wheelchair, access_bottles=self.bottles)
+
 @dataclass(kw_only=True)
 class AreaQueryParams(CommonQueryParams, AreaQueryParamsBase):
     ...
@@ -44,3 +80,48 @@ class RadiusQueryParams(CommonQueryParams, RadiusQueryParamsBase):
 @dataclass(kw_only=True)
 class BboxQueryParams(CommonQueryParams, BboxQueryParamsBase):
     timeout: Timeout = 30
+
+@dataclass
+class ChangesQueryParams:
+    since: Annotated[str, Query(description="Snapshot sequence (until of a previous response) or datetime in ISO 8601 format of the snapshot already synced")]
+    cursor: Annotated[Optional[str], Query(description="Cursor of the next page (next_cursor of the previous page)")] = None
+    limit: Annotated[int, Query(description="Maximum changes per page", gt=0, le=10000)] = 1000
+
+    @property
+    def since_sequence(self) -> Optional[int]:
+        """
+        Snapshot sequence, None if since is a datetime
+        """
+        return int(self.since) if self.since.isdigit() else None
+
+    @property
+    def since_datetime(self) -> datetime:
+        try:
+            return datetime.fromisoformat(self.since)
+        except ValueError as e:
+            raise RequestError(HTTPStatus.HTTP_400_BAD_REQUEST, "since must be a snapshot sequence or a datetime in ISO 8601 format") from e
+
+@dataclass
+class SnapshotQueryParams:
+    south_lat: Annotated[Optional[float], Query(description="South (minimum latitude) of the bounding box")] = None
+    west_long: Annotated[Optional[float], Query(description="West (minimum longitude) of the bounding box")] = None
+    north_lat: Annotated[Optional[float], Query(description="North (maximum latitude) of the bounding box")] = None
+    east_long: Annotated[Optional[float], Query(description="East (maximum longitude) of the bounding box")] = None
+    format: Format = ResponseFormat.JSON
+
+    @property
+    def bbox(self) -> Optional[Tuple[float, float, float, float]]:
+        bbox = (self.south_lat, self.west_long, self.north_lat, self.east_long)
+
+        if all(coordinate is None for coordinate in bbox):
+            return None
+
+        if any(coordinate is None for coordinate in bbox):
+            raise RequestError(HTTPStatus.HTTP_400_BAD_REQUEST, "Bounding box requires south_lat, west_long, north_lat and east_long")
+
+        return bbox # type: ignore
+
+@dataclass(kw_only=True)
+class SearchQueryParams(SnapshotQueryParams, AreaQueryParamsBase):
+    q: Annotated[str, Query(description="Text to search in the name, description and address of the fountains (accents and case are ignored, words also match the beginning of longer words)", min_length=1, max_length=200)]
+    limit: Annotated[int, Query(description="Maximum fountains, by relevance", gt=0, le=1000)] = 20
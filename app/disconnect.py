@@ -0,0 +1,79 @@
+"""
+Cancellation of the requests whose client disconnected
+
+Sync endpoints run in worker threads that keep working after the client is gone,
+so the middleware watches the connection and cancels the Deadline of the request,
+which the stages of the request (geocoding, Overpass, transform) check to stop early.
+"""
+
+from typing import Any, Dict, List
+
+import anyio
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.services.deadline import Deadline, request_deadline
+
+from app.config import logger
+
+class CancelOnDisconnectMiddleware:
+    """
+    ASGI middleware that reads the request body, then waits for the client disconnection while the app runs
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        messages: List[Message] = []
+
+        while True:
+            message = await receive()
+            messages.append(message)
+
+            if message["type"] != "http.request" or not message.get("more_body", False):
+                break
+
+        deadline = Deadline()
+        disconnected = anyio.Event()
+        response: Dict[str, Any] = { "complete": False }
+
+        if messages[-1]["type"] == "http.disconnect":
+            deadline.cancel()
+            disconnected.set()
+
+        async def replay_receive() -> Message:
+            if messages:
+                return messages.pop(0)
+
+            await disconnected.wait()
+
+            return { "type": "http.disconnect" }
+
+        async def watch_send(message: Message):
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                response["complete"] = True
+
+            await send(message)
+
+        async def watch_disconnect():
+            while not disconnected.is_set():
+                if (await receive())["type"] == "http.disconnect":
+                    if not response["complete"]:
+                        logger.info('client disconnected, cancelling %s %s', scope["method"], scope["path"])
+                        deadline.cancel()
+
+                    disconnected.set()
+
+        with request_deadline(deadline):
+            async with anyio.create_task_group() as task_group:
+                task_group.start_soon(watch_disconnect)
+
+                try:
+                    await self.app(scope, replay_receive, watch_send)
+                finally:
+                    task_group.cancel_scope.cancel()
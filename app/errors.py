@@ -6,6 +6,11 @@ from app.models.response import QueryResponse
 
 from app.config import logger
 
+CLIENT_CLOSED_REQUEST = 499
+"""
+Non-standard status of the requests cancelled because the client disconnected (never sent)
+"""
+
 class ErrorResponse(QueryResponse):
     error: str
 
@@ -18,6 +23,16 @@ class RequestTimeoutError(RequestError):
     def __init__(self, error: str = "Request timed out"):
         super().__init__(HTTPStatus.HTTP_408_REQUEST_TIMEOUT, error)
 
+class RequestCancelledError(RequestError):
+
+    def __init__(self, error: str = "Request cancelled: client disconnected"):
+        super().__init__(CLIENT_CLOSED_REQUEST, error)
+
+class TooManyRequestsError(RequestError):
+
+    def __init__(self, error: str = "Too many requests", retry_after: int = 1):
+        super().__init__(HTTPStatus.HTTP_429_TOO_MANY_REQUESTS, error, headers={ "Retry-After": str(retry_after) })
+
 class OpenStreetMapError(RequestError):
 
     def __init__(self, error: str = "OpenStreetMap error", status: int = HTTPStatus.HTTP_502_BAD_GATEWAY):
@@ -29,5 +44,6 @@ async def request_error_handler(request: Request, error: RequestError) -> Respon
 
     return JSONResponse(
         status_code=error.status_code,
-        content=ErrorResponse(query_url=str(request.url), error=error.detail).model_dump(mode='json')
+        content=ErrorResponse(query_url=str(request.url), error=error.detail).model_dump(mode='json'),
+        headers=error.headers
     )
@@ -2,24 +2,54 @@
 App entrypoint
 """
 
-from typing import Any, Dict
+from typing import Any, AsyncIterator, Dict
+
+from contextlib import asynccontextmanager
+
+import threading
+import anyio.to_thread
 
 from fastapi import FastAPI
 
-from app.api import fountains
+from app.api import fountains, jobs
+from app.api.admission import admission_stats, admission_threads
 from app.config import load_config, APP_NAME
 from app.services.openstreetmap_api import API_URL
+from app.disconnect import CancelOnDisconnectMiddleware
 from app.errors import RequestError, request_error_handler
 
 load_config()
 
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    hot_queries = fountains.prefetcher() # prefetch the hot queries of the previous run
+
+    # admitted requests always have a worker thread, with some spare for the other endpoints
+    thread_limiter = anyio.to_thread.current_default_thread_limiter()
+    thread_limiter.total_tokens = max(thread_limiter.total_tokens, admission_threads() + 8)
+
+    # index the current snapshot for /fountains/search, and each new snapshot, in the background
+    stop_indexing = threading.Event()
+    threading.Thread(target=fountains.index_snapshots, args=(stop_indexing,), name='search-index', daemon=True).start()
+
+    yield
+
+    stop_indexing.set()
+
+    if hot_queries is not None:
+        hot_queries.stop()
+
 app = FastAPI(
     title=APP_NAME,
     version='1.0',
-    description="Service to retrieve fountains from OpenStreetMap."
+    description="Service to retrieve fountains from OpenStreetMap.",
+    lifespan=lifespan
 )
 
 app.include_router(fountains.router, tags=["fountains"])
+app.include_router(jobs.router, tags=["jobs"])
+
+app.add_middleware(CancelOnDisconnectMiddleware)
 
 app.add_exception_handler(RequestError, request_error_handler) # type: ignore
 
@@ -28,6 +58,7 @@ INFO = {
         "version": app.version,
         "description": app.description,
         "docs": "/docs",
+        "metrics": "/metrics",
         "github": "https://github.com/Carleslc/fountains-osm",
         "osm": {
             "web": "https://www.openstreetmap.org/",
@@ -39,12 +70,19 @@ INFO = {
                 "/fountains/radius?lat=41.391111&long=2.180556&radius=2000",
                 "/fountains/radius?lat=41.391111&long=2.180556&radius=2000&osm=true",
                 "/fountains/radius?lat=41.391111&long=2.180556&radius=2000&raw=true",
+                "/fountains/radius?lat=41.391111&long=2.180556&radius=2000&safe_water=yes&access=yes&wheelchair=true",
             ],
             "Find fountains within a bounding box": [
                 "/fountains/bbox?south_lat=41.36792&west_long=2.098646&north_lat=41.42857&east_long=2.209196",
                 "/fountains/bbox?south_lat=41.36792&west_long=2.098646&north_lat=41.42857&east_long=2.209196&osm=true",
                 "/fountains/bbox?south_lat=41.36792&west_long=2.098646&north_lat=41.42857&east_long=2.209196&raw=true",
             ],
+            "Find fountains of many radius and bbox queries with a single request (POST)": [
+                "/fountains/batch",
+            ],
+            "Find fountains along a route (POST)": [
+                "/fountains/along",
+            ],
             "Find all fountains in a geographical area": [
                 "/fountains?area=Barcelona",
                 "/fountains?area=Spain",
@@ -54,6 +92,14 @@ INFO = {
                 "/fountains?timeout=1800",
                 "/fountains?timeout=1200&raw=true",
             ],
+            "Find all fountains in the world in the background (POST)": [
+                "/fountains/jobs?timeout=1800",
+                "/fountains/jobs?area=Spain",
+            ],
+            "Search fountains by name, description or address in the latest snapshot": [
+                "/fountains/search?q=canaletes",
+                "/fountains/search?q=font&area=Barcelona",
+            ],
             "Find updated fountains since a specified date and time": [
                 "/fountains/bbox?updated=2024-01-01T00:00:00%2B00:00&south_lat=41.36792&west_long=2.098646&north_lat=41.42857&east_long=2.209196",
                 "/fountains?updated=2024-06-15T00:00:00Z&timeout=1800",
@@ -75,3 +121,19 @@ async def get_root() -> Dict[str, Any]:
     Get useful information of this API.
     """
     return INFO
+
+@app.get("/metrics")
+async def get_metrics() -> Dict[str, Any]:
+    """
+    Get Overpass endpoints, scheduler (queue depth, wait times, rate limits), cache, prefetch, compressed responses,
+    admission (active, queued and rejected requests by workload) and search index metrics.
+    """
+    hot_queries = fountains.prefetcher()
+
+    return {
+        **fountains.osm_api().stats(),
+        "prefetch": hot_queries.stats() if hot_queries else None,
+        "responses": fountains.encoded_bodies().stats(),
+        "admission": admission_stats(),
+        "search": fountains.search_stats(),
+    }
@@ -0,0 +1,65 @@
+from typing import Dict, List, Literal, Optional, Union
+from typing_extensions import Annotated
+
+from datetime import datetime
+
+from pydantic import AliasChoices, BaseModel, Field, model_validator
+
+from app.models.response import OpenStreetMapResponse
+from app.models.fountain import FountainOpenStreetMap
+
+MAX_BATCH_QUERIES = 100
+
+class RadiusQuery(BaseModel):
+    type: Literal["radius"]
+    id: Optional[str] = Field(None, description="Key of the query in the response (index by default)")
+    lat: float = Field(description="Latitude of the center point")
+    long: float = Field(description="Longitude of the center point")
+    radius: int = Field(gt=0, description="Radius in meters to search for fountains")
+
+class BboxQuery(BaseModel):
+    type: Literal["bbox"]
+    id: Optional[str] = Field(None, description="Key of the query in the response (index by default)")
+    south_lat: float = Field(description="South (minimum latitude) of the bounding box")
+    west_long: float = Field(description="West (minimum longitude) of the bounding box")
+    north_lat: float = Field(description="North (maximum latitude) of the bounding box")
+    east_long: float = Field(description="East (maximum longitude) of the bounding box")
+
+BatchQuery = Annotated[Union[RadiusQuery, BboxQuery], Field(discriminator="type")]
+
+class FountainsBatchRequest(BaseModel):
+    queries: List[BatchQuery] = Field(min_length=1, max_length=MAX_BATCH_QUERIES)
+    updated: Optional[datetime] = Field(None, validation_alias=AliasChoices("updated", "since"),
+                                        description="Search only fountains updated since a specified datetime, in ISO 8601 format")
+    osm: bool = Field(False, description="Include OSM extra information (type, id, version, url, tags)")
+    timeout: int = Field(30, le=1800, description="Timeout in seconds for the request: OSM API request and transform (maximum 30 minutes)")
+
+    @model_validator(mode='after')
+    def check_unique_ids(self) -> 'FountainsBatchRequest':
+        keys = self.keys()
+
+        if len(set(keys)) != len(keys):
+            raise ValueError("Query ids must be unique")
+
+        return self
+
+    def keys(self) -> List[str]:
+        """
+        Key of each query in the response
+        """
+        return [query.id if query.id is not None else str(index) for index, query in enumerate(self.queries)]
+
+class BatchQueryResult(BaseModel):
+    count: int
+    provider_ids: List[str]
+    """
+    Fountains of the query, in the fountains list of the response
+    """
+
+class FountainsBatchResponse(OpenStreetMapResponse):
+    count: int
+    fountains: List[FountainOpenStreetMap]
+    """
+    Unique fountains of all the queries
+    """
+    queries: Dict[str, BatchQueryResult]
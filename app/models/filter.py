@@ -0,0 +1,15 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+from app.models.fountain import FountainType, SafeWater, Access
+
+class FountainFilter(BaseModel):
+    """
+    Fountains with any of the values of each set field (fields named as the fountain fields)
+    """
+    type: Optional[List[FountainType]] = Field(None, description="Fountain types")
+    safe_water: Optional[List[SafeWater]] = Field(None, description="Safe water values")
+    access: Optional[List[Access]] = Field(None, description="Access values")
+    access_wheelchair: Optional[bool] = Field(None, description="Wheelchair accessible (true) or not (false)")
+    access_bottles: Optional[bool] = Field(None, description="Bottles can be filled (true) or not (false)")
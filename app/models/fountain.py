@@ -1,9 +1,9 @@
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 from enum import Enum
 from datetime import datetime
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 class FountainType(str, Enum):
     NATURAL = "natural"
@@ -51,14 +51,24 @@ class Fountain(BaseModel):
     provider_id: str
     provider_updated_at: datetime
     provider_url: Optional[str] = None
+    merged_ids: Optional[List[str]] = None
+    """
+    Provider ids of the near-duplicates merged into this fountain (dedup)
+    """
 
 
 class FountainOpenStreetMap(Fountain):
     provider_name: str = "OpenStreetMap"
     osm: Optional['FountainOpenStreetMapInfo'] = None
+    osm_version: Optional[int] = Field(None, exclude=True)
+    """
+    Version of the OSM element, also without the OSM extra information (snapshots and change detection), not serialized
+    """
 
 class FountainOpenStreetMapInfo(BaseModel):
     type: str
     id: int
     version: int
     tags: Optional[Dict[str, Any]] = None
+
+FountainOpenStreetMap.model_rebuild() # resolve the osm forward reference, so other modules can extend the model
@@ -0,0 +1,33 @@
+from typing import Optional
+
+from enum import Enum
+from datetime import datetime
+
+from pydantic import BaseModel
+
+from app.models.filter import FountainFilter
+
+class JobStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+class Job(BaseModel):
+    id: str
+    status: JobStatus = JobStatus.PENDING
+    query_url: str
+    area: Optional[str] = None
+    updated: Optional[datetime] = None
+    raw: bool = False
+    osm: bool = False
+    dedup: Optional[float] = None
+    filters: Optional[FountainFilter] = None
+    timeout: int
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    count: Optional[int] = None
+    size: Optional[int] = None
+    error: Optional[str] = None
+    error_status: Optional[int] = None
@@ -1,12 +1,20 @@
 from typing import List, Optional
 
 from datetime import datetime, timezone
+from enum import Enum
 
 from pydantic import BaseModel, Field
 
 from app.models.fountain import FountainOpenStreetMap
 
 
+class ResponseFormat(str, Enum):
+    JSON = "json"
+    MSGPACK = "msgpack"
+    GEOJSON = "geojson"
+    FLATGEOBUF = "fgb"
+
+
 class QueryResponse(BaseModel):
     query_url: Optional[str] = None
     query_timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -18,4 +26,21 @@ class OpenStreetMapResponse(QueryResponse):
 
 class FountainsOpenStreetMapResponse(OpenStreetMapResponse):
     count: int
+    merged: Optional[int] = None
+    """
+    Near-duplicates merged into other fountains (dedup)
+    """
     fountains: List[FountainOpenStreetMap]
+
+
+class FountainsChangesResponse(OpenStreetMapResponse):
+    since: int
+    until: int
+    """
+    Sequence of the latest snapshot included, since of the next sync
+    """
+    count: int
+    created: List[str]
+    updated: List[str]
+    deleted: List[str]
+    next_cursor: Optional[str] = None
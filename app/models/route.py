@@ -0,0 +1,75 @@
+from typing import List, Literal, Optional, Tuple
+
+from datetime import datetime
+
+from pydantic import AliasChoices, BaseModel, Field, PrivateAttr, model_validator
+
+from app.models.response import OpenStreetMapResponse
+from app.models.fountain import FountainOpenStreetMap
+from app.services.geo import Point, decode_polyline
+from app.services.route import MIN_BUFFER, MAX_BUFFER
+
+MAX_ROUTE_POINTS = 100000
+
+class LineString(BaseModel):
+    type: Literal["LineString"]
+    coordinates: List[Tuple[float, float]] = Field(description="GeoJSON positions (longitude, latitude)")
+
+class FountainsAlongRequest(BaseModel):
+    polyline: Optional[str] = Field(None, description="Route as an encoded polyline")
+    precision: int = Field(5, ge=5, le=6, description="Precision of the encoded polyline: 5 (Google) or 6 (OSRM, Valhalla)")
+    line: Optional[LineString] = Field(None, description="Route as a GeoJSON LineString geometry")
+    buffer: float = Field(ge=MIN_BUFFER, le=MAX_BUFFER, description="Maximum distance in meters from the route")
+    updated: Optional[datetime] = Field(None, validation_alias=AliasChoices("updated", "since"),
+                                        description="Search only fountains updated since a specified datetime, in ISO 8601 format")
+    osm: bool = Field(False, description="Include OSM extra information (type, id, version, url, tags)")
+    timeout: int = Field(60, le=1800, description="Timeout in seconds for the request: OSM API request and transform (maximum 30 minutes)")
+
+    _points: List[Point] = PrivateAttr(default_factory=list)
+
+    @model_validator(mode='after')
+    def check_route(self) -> 'FountainsAlongRequest':
+        if (self.polyline is None) == (self.line is None):
+            raise ValueError("Route requires either polyline or line")
+
+        if self.line is not None:
+            points = [(lat, long) for long, lat in self.line.coordinates]
+        else:
+            points = decode_polyline(self.polyline or '', self.precision)
+
+        if not 2 <= len(points) <= MAX_ROUTE_POINTS:
+            raise ValueError(f"Route requires between 2 and {MAX_ROUTE_POINTS} points")
+
+        if any(not (-90 <= lat <= 90 and -180 <= long <= 180) for lat, long in points):
+            raise ValueError("Route coordinates out of range")
+
+        self._points = points
+
+        return self
+
+    def points(self) -> List[Point]:
+        """
+        Points (lat, long) of the route
+        """
+        return self._points
+
+class FountainAlongRoute(FountainOpenStreetMap):
+    distance_along: float
+    """
+    Distance in meters from the start of the route to the nearest point of the route
+    """
+    distance_to_route: float
+    """
+    Distance in meters from the fountain to the route
+    """
+
+class FountainsAlongResponse(OpenStreetMapResponse):
+    count: int
+    length: float
+    """
+    Length of the route in meters
+    """
+    fountains: List[FountainAlongRoute]
+    """
+    Fountains within the buffer of the route, by distance along the route
+    """
@@ -0,0 +1,124 @@
+"""
+On-demand request profiling
+
+A request is profiled only when the PROFILE_TOKEN environment variable is set (read once at startup)
+and the request sends the same value in the X-Profile-Token header. Without PROFILE_TOKEN the endpoints are not wrapped.
+The profile is written in folded stacks format (flamegraph.pl, speedscope, inferno).
+"""
+
+from typing import Any, Callable, Dict, Optional
+
+from datetime import datetime, timezone
+from functools import wraps
+from os import getenv
+
+import hmac
+import os.path
+import sys
+import threading
+
+from fastapi import Request
+from fastapi.responses import Response
+from dotenv import load_dotenv
+
+from app.config import logger
+
+PROFILE_HEADER = "X-Profile-Token"
+PROFILE_FILE_HEADER = "X-Profile-File"
+PROFILE_DIR = os.path.join("logs", "profiles")
+
+load_dotenv() # the endpoints are decorated at import, before the app loads its configuration
+
+PROFILE_TOKEN = getenv('PROFILE_TOKEN') or None
+
+class StackSampler:
+    """
+    Sampling profiler of a single thread, aggregated as folded stacks
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005, root: Optional[str] = None):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.root = root
+        self.stacks: Dict[str, int] = {}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id) # pylint: disable=protected-access
+
+            if frame is None:
+                continue
+
+            stack = []
+
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+                frame = frame.f_back
+
+            if self.root:
+                stack.append(self.root)
+
+            folded = ';'.join(reversed(stack))
+            self.stacks[folded] = self.stacks.get(folded, 0) + 1
+
+    def save(self, file_path: str):
+        with open(file_path, 'w', encoding='utf8') as profile_file:
+            for stack, samples in self.stacks.items():
+                profile_file.write(f"{stack} {samples}\n")
+
+def profiling_requested(request: Request, token: str) -> bool:
+    return hmac.compare_digest(request.headers.get(PROFILE_HEADER, '').encode('utf8'), token.encode('utf8'))
+
+def profiled(endpoint: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    Decorator for sync endpoints with a `request` parameter.
+    Runs the endpoint under a StackSampler if profiling is requested, otherwise calls it directly.
+    Returns the endpoint unchanged if PROFILE_TOKEN is not set.
+    """
+    token = PROFILE_TOKEN
+
+    if token is None:
+        return endpoint
+
+    @wraps(endpoint)
+    def profiled_endpoint(*args, **kwargs):
+        request: Request = kwargs['request']
+
+        if not profiling_requested(request, token):
+            return endpoint(*args, **kwargs)
+
+        tag = f"{request.method} {request.url.path}?{request.url.query}"
+        interval = float(getenv('PROFILE_INTERVAL', '5')) / 1000 # milliseconds
+
+        sampler = StackSampler(threading.get_ident(), interval=interval, root=tag)
+        sampler.start()
+
+        try:
+            response = endpoint(*args, **kwargs)
+        finally:
+            sampler.stop()
+
+            timestamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+            profile_file_path = os.path.join(getenv('PROFILE_DIR', PROFILE_DIR), f"{endpoint.__name__}-{timestamp}.folded")
+
+            os.makedirs(os.path.dirname(profile_file_path), exist_ok=True)
+            sampler.save(profile_file_path)
+
+            logger.info('profile %s saved to %s', tag, profile_file_path)
+
+        if isinstance(response, Response):
+            response.headers[PROFILE_FILE_HEADER] = profile_file_path
+
+        return response
+
+    return profiled_endpoint
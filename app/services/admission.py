@@ -0,0 +1,145 @@
+"""
+Admission control of the API requests by workload (interactive or bulk), with bounded queues and per-client quotas
+"""
+
+from typing import Any, Deque, Dict
+
+from collections import deque
+from time import monotonic
+
+import asyncio
+import math
+
+from app.errors import TooManyRequestsError
+
+class WorkloadPool:
+    """
+    Runs at most concurrency requests of a workload at once, queues up to queue_size more for up to queue_timeout seconds,
+    and rejects the rest (TooManyRequestsError with the estimated seconds to retry) instead of piling them up.
+    Each client can have at most client_concurrency requests of the workload in flight (running or queued).
+
+    Used from the event loop (async dependencies), so no lock is needed.
+    """
+
+    def __init__(self, name: str, concurrency: int, queue_size: int, queue_timeout: float, client_concurrency: int):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.client_concurrency = max(1, client_concurrency)
+
+        self._active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._clients: Dict[str, int] = {}
+
+        self.admitted = 0
+        self.completed = 0
+        self.rejected_queue_full = 0
+        self.rejected_queue_timeout = 0
+        self.rejected_client_quota = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_service = 0.0
+
+    async def acquire(self, client: str) -> float:
+        """
+        Wait for a free slot, returns the time when the request was admitted
+        """
+        if self._clients.get(client, 0) >= self.client_concurrency:
+            self.rejected_client_quota += 1
+            raise TooManyRequestsError(f"Too many concurrent {self.name} requests from this client (maximum {self.client_concurrency})",
+                                       retry_after=self.retry_after())
+
+        enqueued_at = monotonic()
+
+        if self._active < self.concurrency and not self._waiters:
+            self._active += 1
+        else:
+            if len(self._waiters) >= self.queue_size:
+                self.rejected_queue_full += 1
+                raise TooManyRequestsError(f"Too many {self.name} requests, try again later", retry_after=self.retry_after())
+
+            await self._wait(client)
+
+        self._clients[client] = self._clients.get(client, 0) + 1
+
+        wait = monotonic() - enqueued_at
+        self.admitted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+        return monotonic()
+
+    async def _wait(self, client: str):
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+
+        # the client quota counts queued requests too
+        self._clients[client] = self._clients.get(client, 0) + 1
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled(): # slot handed over while timing out or cancelled
+                self._release_slot()
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected_queue_timeout += 1
+                raise TooManyRequestsError(f"Timed out waiting for a {self.name} slot, try again later",
+                                           retry_after=self.retry_after()) from e
+            raise
+        finally:
+            self._release_client(client)
+
+    def release(self, client: str, admitted_at: float):
+        self.completed += 1
+        self.total_service += monotonic() - admitted_at
+
+        self._release_client(client)
+        self._release_slot()
+
+    def _release_client(self, client: str):
+        count = self._clients.get(client, 0) - 1
+
+        if count > 0:
+            self._clients[client] = count
+        else:
+            self._clients.pop(client, None)
+
+    def _release_slot(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+
+            if not waiter.done():
+                waiter.set_result(None) # hand over the slot
+                return
+
+        self._active -= 1
+
+    def retry_after(self) -> int:
+        """
+        Estimated seconds until a slot is available for a new request
+        """
+        average_service = self.total_service / self.completed if self.completed else 1
+
+        return max(1, math.ceil(average_service * (len(self._waiters) + 1) / self.concurrency))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.concurrency,
+            "active": self._active,
+            "queued": len(self._waiters),
+            "queue_size": self.queue_size,
+            "clients": len(self._clients),
+            "admitted": self.admitted,
+            "completed": self.completed,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_queue_timeout": self.rejected_queue_timeout,
+            "rejected_client_quota": self.rejected_client_quota,
+            "avg_wait": self.total_wait / self.admitted if self.admitted else 0,
+            "max_wait": self.max_wait,
+            "avg_service": self.total_service / self.completed if self.completed else 0,
+        }
@@ -0,0 +1,48 @@
+"""
+Batch of radius and bbox queries answered with a single Overpass query
+"""
+
+from typing import List
+
+from app.models.batch import BatchQuery, RadiusQuery
+from app.models.fountain import FountainOpenStreetMap
+from app.services.geo import distance, distance_to_bbox
+
+def search_filter(query: BatchQuery) -> str:
+    """
+    Overpass filter of the query region
+    """
+    if isinstance(query, RadiusQuery):
+        return f'around:{query.radius},{query.lat},{query.long}'
+
+    return f'{query.south_lat},{query.west_long},{query.north_lat},{query.east_long}'
+
+def region_distance(query: BatchQuery, lat: float, long: float) -> float:
+    """
+    Distance in meters from a point to the query region (0 if inside)
+    """
+    if isinstance(query, RadiusQuery):
+        return max(0, distance(query.lat, query.long, lat, long) - query.radius)
+
+    return distance_to_bbox(lat, long, (query.south_lat, query.west_long, query.north_lat, query.east_long))
+
+def split_batch(queries: List[BatchQuery], fountains: List[FountainOpenStreetMap]) -> List[List[str]]:
+    """
+    Provider ids of the fountains of each query.
+
+    Overpass matches ways and relations by their geometry, but fountains only have their center,
+    so a fountain outside every region is assigned to the nearest query.
+    """
+    results: List[List[str]] = [[] for _ in queries]
+
+    for fountain in fountains:
+        distances = [region_distance(query, fountain.lat, fountain.long) for query in queries]
+        matched = [index for index, query_distance in enumerate(distances) if query_distance == 0]
+
+        if not matched:
+            matched = [distances.index(min(distances))]
+
+        for index in matched:
+            results[index].append(fountain.provider_id)
+
+    return results
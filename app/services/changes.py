@@ -0,0 +1,196 @@
+"""
+Log of the fountains created, updated and deleted between published snapshots, in SQLite
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+
+import os.path
+import sqlite3
+
+from app.services.snapshot import FountainSnapshot, OSM_TYPES
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    sequence INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    base INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS changes (
+    sequence INTEGER NOT NULL,
+    provider_id TEXT NOT NULL,
+    change TEXT NOT NULL,
+    PRIMARY KEY (sequence, provider_id)
+);
+CREATE INDEX IF NOT EXISTS changes_provider_id ON changes (provider_id, sequence);
+"""
+
+CREATED = "created"
+UPDATED = "updated"
+DELETED = "deleted"
+
+RETENTION = 100
+"""
+Snapshots whose changes are kept, older clients must sync again from the snapshot
+"""
+
+def changes_file(snapshot_file: str) -> str:
+    """
+    Changes log of a snapshot file (e.g. snapshots/fountains.changes.sqlite3)
+    """
+    return f"{os.path.splitext(snapshot_file)[0]}.changes.sqlite3"
+
+def snapshot_versions(snapshot: FountainSnapshot) -> Dict[str, Tuple[int, int]]:
+    """
+    Version and update time of each fountain by provider id
+    """
+    columns = snapshot.columns
+    osm_types, osm_ids, versions, updated_at = columns["osm_type"], columns["osm_id"], columns["version"], columns["updated_at"]
+
+    return {
+        f"{OSM_TYPES[osm_types[index]]}:{osm_ids[index]}": (versions[index], updated_at[index])
+        for index in range(snapshot.count)
+    }
+
+@dataclass
+class Changes:
+    since: int
+    until: int
+    created: List[str] = field(default_factory=list)
+    updated: List[str] = field(default_factory=list)
+    deleted: List[str] = field(default_factory=list)
+    next_cursor: Optional[str] = None
+
+class HistoryExpiredError(ValueError):
+    """
+    The changes since the requested sequence are no longer (or not yet) in the log
+    """
+
+class ChangeLog:
+    """
+    Each published snapshot gets a sequence number and the diff with the previous snapshot.
+    A snapshot without previous snapshot (base) starts the history again.
+    """
+
+    def __init__(self, file_path: str, read_only: bool = False, timeout: float = 30):
+        if read_only:
+            self.connection = sqlite3.connect(f"file:{file_path}?mode=ro", uri=True, timeout=timeout, isolation_level=None)
+        else:
+            os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+
+            self.connection = sqlite3.connect(file_path, timeout=timeout, isolation_level=None)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self) -> 'ChangeLog':
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def record(self, previous: Optional[FountainSnapshot], current: FountainSnapshot, retention: int = RETENTION) -> Tuple[int, int]:
+        """
+        Record the changes between the previous and the current snapshot, returns the sequence and number of changes
+        """
+        current_versions = snapshot_versions(current)
+        changes: List[Tuple[str, str]] = []
+
+        if previous is not None:
+            previous_versions = snapshot_versions(previous)
+
+            for provider_id, version in current_versions.items():
+                previous_version = previous_versions.get(provider_id)
+
+                if previous_version is None:
+                    changes.append((provider_id, CREATED))
+                elif previous_version != version:
+                    changes.append((provider_id, UPDATED))
+
+            changes.extend((provider_id, DELETED) for provider_id in previous_versions if provider_id not in current_versions)
+
+        self.connection.execute("BEGIN IMMEDIATE")
+
+        try:
+            sequence = self.connection.execute(
+                "INSERT INTO snapshots (created_at, count, base) VALUES (?, ?, ?)",
+                (current.created_at.isoformat(), current.count, previous is None)).lastrowid
+
+            self.connection.executemany(
+                "INSERT INTO changes (sequence, provider_id, change) VALUES (?, ?, ?)",
+                ((sequence, provider_id, change) for provider_id, change in changes))
+
+            self.connection.execute("DELETE FROM changes WHERE sequence <= ?", (sequence - retention,))
+            self.connection.execute("DELETE FROM snapshots WHERE sequence < ?", (sequence - retention,))
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+
+        return sequence, len(changes) # type: ignore
+
+    def latest(self) -> Optional[int]:
+        return self.connection.execute("SELECT MAX(sequence) FROM snapshots").fetchone()[0]
+
+    def sequence_at(self, timestamp: datetime) -> Optional[int]:
+        """
+        Sequence of the latest snapshot created at or before the timestamp
+        """
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+
+        return self.connection.execute(
+            "SELECT MAX(sequence) FROM snapshots WHERE created_at <= ?", (timestamp.astimezone(timezone.utc).isoformat(),)).fetchone()[0]
+
+    def changes(self, since: int, cursor: Optional[str] = None, limit: int = 1000) -> Changes:
+        """
+        Net changes of each fountain after the since sequence, paged by provider id.
+        The cursor of the next page keeps the same until sequence, so pages are consistent while new snapshots are published.
+        """
+        if cursor:
+            until_text, after = cursor.split(':', 1)
+            until = int(until_text)
+        else:
+            until, after = self.latest() or 0, ''
+
+        latest_base = self.connection.execute(
+            "SELECT MAX(sequence) FROM snapshots WHERE base AND sequence <= ?", (until,)).fetchone()[0]
+        oldest = self.connection.execute("SELECT MIN(sequence) FROM snapshots").fetchone()[0]
+
+        if oldest is None or since < max(oldest, latest_base or 0) or since > until:
+            raise HistoryExpiredError(f"Changes since {since} are not available")
+
+        # latest change of each fountain, and whether it was created in the range
+        rows = self.connection.execute("""
+            SELECT provider_id, change, created
+            FROM (
+                SELECT provider_id, change,
+                       ROW_NUMBER() OVER (PARTITION BY provider_id ORDER BY sequence DESC) AS position,
+                       MAX(change = 'created') OVER (PARTITION BY provider_id) AS created
+                FROM changes
+                WHERE sequence > ? AND sequence <= ? AND provider_id > ?
+            )
+            WHERE position = 1
+            ORDER BY provider_id
+            LIMIT ?
+            """, (since, until, after, limit)).fetchall()
+
+        result = Changes(since=since, until=until)
+
+        for provider_id, change, created in rows:
+            if change == DELETED:
+                result.deleted.append(provider_id)
+            elif created:
+                result.created.append(provider_id)
+            else:
+                result.updated.append(provider_id)
+
+        if len(rows) == limit:
+            result.next_cursor = f"{until}:{rows[-1][0]}"
+
+        return result
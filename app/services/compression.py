@@ -0,0 +1,259 @@
+"""
+Response body compression with Accept-Encoding negotiation (gzip, and brotli or zstd if installed)
+"""
+
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Tuple
+
+from collections import OrderedDict
+from os import getenv
+
+import gzip
+import threading
+import zlib
+
+try:
+    import brotli # type: ignore
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard # type: ignore
+except ImportError:
+    zstandard = None
+
+MIN_SIZE = 1024
+"""
+Bodies smaller than this (bytes) are not compressed
+"""
+
+COMPRESSORS: Dict[str, Callable[[bytes, int], bytes]] = {
+    "gzip": lambda body, level: gzip.compress(body, compresslevel=level, mtime=0),
+}
+
+if brotli is not None:
+    COMPRESSORS["br"] = lambda body, level: brotli.compress(body, quality=level)
+
+if zstandard is not None:
+    COMPRESSORS["zstd"] = lambda body, level: zstandard.ZstdCompressor(level=level).compress(body)
+
+class _GzipStream:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS) # gzip container
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compressor.compress(chunk)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+class _BrotliStream:
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level) # type: ignore
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compressor.process(chunk)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+class _ZstdStream:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj() # type: ignore
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compressor.compress(chunk)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+STREAM_COMPRESSORS: Dict[str, Callable[[int], Any]] = { "gzip": _GzipStream }
+
+if brotli is not None:
+    STREAM_COMPRESSORS["br"] = _BrotliStream
+
+if zstandard is not None:
+    STREAM_COMPRESSORS["zstd"] = _ZstdStream
+
+def compress_stream(chunks: Iterable[bytes], encoding: str, level: int) -> Iterator[bytes]:
+    """
+    Compress a streamed body chunk by chunk
+    """
+    compressor = STREAM_COMPRESSORS[encoding](level)
+
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+
+        if compressed:
+            yield compressed
+
+    yield compressor.flush()
+
+PREFERENCE = ("zstd", "br", "gzip")
+"""
+Encodings by preference when the client accepts many with the same quality
+"""
+
+DEFAULT_LEVELS = { "gzip": 5, "br": 4, "zstd": 3 }
+"""
+Fast levels for responses compressed on every request
+"""
+
+CACHED_LEVELS = { "gzip": 9, "br": 9, "zstd": 15 }
+"""
+High levels for cached responses (e.g. snapshot), compressed once and sent many times
+"""
+
+def compression_levels(endpoint: str, default: Dict[str, int] | None = None) -> Dict[str, int]:
+    """
+    Levels of each encoding for an endpoint, from COMPRESSION_<ENDPOINT> or COMPRESSION environment variables
+    (comma separated encoding:level, e.g. gzip:6,br:5,zstd:3, level 0 disables the encoding)
+    """
+    levels = dict(default or DEFAULT_LEVELS)
+    config = getenv(f'COMPRESSION_{endpoint.upper()}') or getenv('COMPRESSION', '')
+
+    for item in config.split(','):
+        if ':' in item:
+            encoding, level = item.split(':', 1)
+            levels[encoding.strip()] = int(level)
+
+    return { encoding: level for encoding, level in levels.items() if encoding in COMPRESSORS and level > 0 }
+
+def parse_accept_encoding(accept_encoding: str) -> Dict[str, float]:
+    """
+    Quality of each encoding in an Accept-Encoding header
+    """
+    qualities: Dict[str, float] = {}
+
+    for item in accept_encoding.split(','):
+        encoding, *params = [part.strip() for part in item.split(';')]
+
+        if not encoding:
+            continue
+
+        quality = 1.0
+
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0
+
+        qualities[encoding.lower()] = quality
+
+    return qualities
+
+def negotiate_encoding(accept_encoding: str | None, levels: Dict[str, int]) -> str | None:
+    """
+    Best encoding accepted by the client among the enabled encodings (None to send the body uncompressed)
+    """
+    if not accept_encoding:
+        return None
+
+    qualities = parse_accept_encoding(accept_encoding)
+    wildcard = qualities.get('*', 0)
+
+    candidates: List[Tuple[float, int, str]] = [
+        (qualities.get(encoding, wildcard), -PREFERENCE.index(encoding), encoding)
+        for encoding in PREFERENCE if encoding in levels
+    ]
+    candidates = [candidate for candidate in candidates if candidate[0] > 0]
+
+    return max(candidates)[2] if candidates else None
+
+class EncodedBody:
+    """
+    Response body with its compressed variants, each compressed once on the first request that accepts it
+    """
+
+    def __init__(self, body: bytes, on_encoded: Callable[[], None] | None = None):
+        self.body = body
+        self.on_encoded = on_encoded
+        """
+        Called after a compressed variant is added (e.g. to evict cached bodies over the size limit)
+        """
+        self._encoded: Dict[Tuple[str, int], bytes] = {}
+        self._lock = threading.Lock()
+
+    def encode(self, encoding: str | None, level: int = 0) -> bytes:
+        if encoding is None or len(self.body) < MIN_SIZE:
+            return self.body
+
+        key = (encoding, level)
+        encoded = self._encoded.get(key)
+
+        if encoded is None:
+            added = False
+
+            with self._lock:
+                encoded = self._encoded.get(key)
+
+                if encoded is None:
+                    encoded = self._encoded[key] = COMPRESSORS[encoding](self.body, level)
+                    added = True
+
+            if added and self.on_encoded is not None:
+                self.on_encoded()
+
+        return encoded
+
+    @property
+    def size(self) -> int:
+        """
+        Bytes of the body and its compressed variants
+        """
+        return len(self.body) + sum(len(encoded) for encoded in list(self._encoded.values()))
+
+class EncodedBodyCache:
+    """
+    Encoded bodies of the responses built from a cached source (e.g. a snapshot or a prefetched result),
+    by a key of the content (e.g. the query and the version of the source), so repeated requests are not serialized
+    and compressed again. Least recently used bodies are evicted over size bodies or max_bytes, including the
+    compressed variants added after caching.
+    """
+
+    def __init__(self, size: int = 32, max_bytes: int = 256 * 1024 * 1024):
+        self.size = size
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[Hashable, EncodedBody] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, build: Callable[[], bytes]) -> EncodedBody:
+        with self._lock:
+            encoded_body = self._entries.get(key)
+
+            if encoded_body is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return encoded_body
+
+            self.misses += 1
+
+        encoded_body = EncodedBody(build(), on_encoded=self._evict)
+
+        with self._lock:
+            self._entries[key] = encoded_body
+
+        self._evict()
+
+        return encoded_body
+
+    def _evict(self):
+        with self._lock:
+            while len(self._entries) > 1 and (len(self._entries) > self.size or self._bytes() > self.max_bytes):
+                self._entries.popitem(last=False)
+
+    def _bytes(self) -> int:
+        return sum(encoded_body.size for encoded_body in self._entries.values())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "encodings": list(COMPRESSORS),
+            }
@@ -0,0 +1,139 @@
+"""
+Deadline of a request across its stages (geocoding, Overpass, transform), cancelled if the client disconnects
+"""
+
+from typing import Iterator, TypeVar
+
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import monotonic
+
+import math
+import threading
+
+from app.errors import RequestTimeoutError, RequestCancelledError
+
+T = TypeVar('T')
+
+POLL_INTERVAL = 0.25
+"""
+Seconds between cancellation checks while waiting for a blocking call
+"""
+
+class Deadline:
+    """
+    Time limit and cancellation of a request, shared by the threads working on it
+    """
+
+    expires_at: float | None
+    """
+    Monotonic time when the request times out (None without time limit)
+    """
+
+    def __init__(self, timeout: float | None = None):
+        self.expires_at = None if timeout is None else monotonic() + timeout
+        self.timeout = timeout
+        self._cancelled = threading.Event()
+
+    def limit(self, timeout: float):
+        """
+        Time out the request in timeout seconds from now, unless it already times out before
+        """
+        expires_at = monotonic() + timeout
+
+        if self.expires_at is None or expires_at < self.expires_at:
+            self.expires_at = expires_at
+            self.timeout = timeout
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def check(self):
+        """
+        Raise RequestCancelledError if the request is cancelled or RequestTimeoutError if it timed out
+        """
+        if self.cancelled:
+            raise RequestCancelledError()
+
+        if self.expires_at is not None and monotonic() >= self.expires_at:
+            raise RequestTimeoutError(f"Request timed out after {self.timeout:g} seconds")
+
+    def remaining(self) -> float | None:
+        """
+        Seconds until the request times out (None without time limit)
+        """
+        self.check()
+
+        return None if self.expires_at is None else self.expires_at - monotonic()
+
+    def wait(self, future: 'Future[T]') -> T:
+        """
+        Result of the future, or abandon it if the request is cancelled or times out before it is done
+        """
+        while True:
+            remaining = self.remaining()
+
+            try:
+                return future.result(timeout=POLL_INTERVAL if remaining is None else min(remaining, POLL_INTERVAL))
+            except FutureTimeoutError:
+                continue
+
+_deadline: ContextVar[Deadline | None] = ContextVar('deadline', default=None)
+
+def current_deadline() -> Deadline | None:
+    """
+    Deadline of the current request (None outside requests, e.g. in background jobs and the CLI)
+    """
+    return _deadline.get()
+
+@contextmanager
+def request_deadline(deadline: Deadline) -> Iterator[Deadline]:
+    """
+    Set the deadline of the current request (the threads of the request inherit it)
+    """
+    token = _deadline.set(deadline)
+
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+def start_deadline(timeout: float) -> Deadline:
+    """
+    Time out the current request in timeout seconds
+    """
+    deadline = _deadline.get()
+
+    if deadline is None:
+        deadline = Deadline()
+        _deadline.set(deadline)
+
+    deadline.limit(timeout)
+
+    return deadline
+
+def check_deadline():
+    """
+    Stop working on the current request if it is cancelled or timed out
+    """
+    deadline = _deadline.get()
+
+    if deadline is not None:
+        deadline.check()
+
+def remaining_timeout(timeout: float) -> int:
+    """
+    Timeout limited to the remaining seconds of the current request (at least 1)
+    """
+    deadline = _deadline.get()
+    remaining = deadline.remaining() if deadline is not None else None
+
+    if remaining is not None:
+        timeout = min(timeout, remaining)
+
+    return max(1, math.ceil(timeout))
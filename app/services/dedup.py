@@ -0,0 +1,85 @@
+"""
+Merge of near-duplicate fountains: the same physical fountain mapped twice in OpenStreetMap,
+e.g. a node and a way, or an amenity=drinking_water node next to a man_made=water_tap node
+
+Fountains are compared only with the fountains of the neighbor cells of a grid sized to the merge distance,
+so merging runs in near-linear time on world-scale results.
+"""
+
+from typing import Iterable, List, Optional, Tuple
+
+from app.models.fountain import FountainOpenStreetMap, SafeWater
+from app.services.geo import ProximityGrid, distance
+from app.services.transform_fountains import DERIVED_FIELDS, DEADLINE_CHECK_INTERVAL
+from app.services.deadline import check_deadline
+
+MAX_MERGE_DISTANCE = 100
+"""
+Maximum merge distance in meters
+"""
+
+def compatible(fountain: FountainOpenStreetMap, other: FountainOpenStreetMap) -> bool:
+    """
+    Whether two near fountains can be the same fountain: same type (or unknown),
+    and not a drinkable and a non-drinkable water source (e.g. a drinking fountain next to a non-potable tap)
+    """
+    if fountain.type is not None and other.type is not None and fountain.type != other.type:
+        return False
+
+    if fountain.safe_water is not None and other.safe_water is not None and \
+       (fountain.safe_water == SafeWater.NO) != (other.safe_water == SafeWater.NO):
+        return False
+
+    return True
+
+def merge_into(fountain: FountainOpenStreetMap, duplicate: FountainOpenStreetMap):
+    """
+    Complete the missing fields of a fountain with a duplicate, keeping the provider ids of both
+    """
+    for field in DERIVED_FIELDS:
+        if getattr(fountain, field) is None:
+            value = getattr(duplicate, field)
+
+            if value is not None:
+                setattr(fountain, field, value)
+
+    if duplicate.provider_updated_at > fountain.provider_updated_at:
+        fountain.provider_updated_at = duplicate.provider_updated_at
+
+    fountain.merged_ids = [*(fountain.merged_ids or []), duplicate.provider_id, *(duplicate.merged_ids or [])]
+
+def merge_duplicates(fountains: Iterable[FountainOpenStreetMap], merge_distance: float) -> Tuple[List[FountainOpenStreetMap], int]:
+    """
+    Fountains with their near-duplicates (within merge_distance meters, compatible) merged, and the number of merged duplicates.
+
+    Each fountain is merged into the nearest compatible fountain kept before it (Overpass returns nodes before ways,
+    so the exact position of a node is kept), and never chained through a merged one, so a row of close fountains
+    is not merged into a single fountain: if B is merged into A, a later C within merge_distance of B but not of A
+    is kept as another fountain.
+    """
+    grid = ProximityGrid(merge_distance)
+    kept: List[FountainOpenStreetMap] = []
+    merged = 0
+
+    for index, fountain in enumerate(fountains):
+        if index % DEADLINE_CHECK_INTERVAL == 0:
+            check_deadline()
+
+        nearest: Optional[int] = None
+        nearest_distance = merge_distance
+
+        for neighbor in grid.neighbors(fountain.lat, fountain.long):
+            candidate = kept[neighbor]
+            candidate_distance = distance(fountain.lat, fountain.long, candidate.lat, candidate.long)
+
+            if candidate_distance <= nearest_distance and compatible(candidate, fountain):
+                nearest, nearest_distance = neighbor, candidate_distance
+
+        if nearest is None:
+            grid.add(fountain.lat, fountain.long, len(kept))
+            kept.append(fountain)
+        else:
+            merge_into(kept[nearest], fountain)
+            merged += 1
+
+    return kept, merged
@@ -0,0 +1,129 @@
+"""
+Attribute filters of the fountains (type, safe_water, access, wheelchair, bottles)
+
+Filters are pushed down into the Overpass query as tag filters of each statement of the query template where the tags
+allow it, so less elements are returned, and applied exactly to the transformed fountains afterwards,
+as the determine_* functions derive the fields.
+"""
+
+from typing import Dict, List, Optional
+
+import re
+
+from app.models.filter import FountainFilter
+from app.models.fountain import FountainOpenStreetMap, FountainType, SafeWater, Access
+from app.services.transform_fountains import determine_type, determine_access
+
+ACCESS_TAG_VALUES = ('yes', 'public', 'permissive', 'customers', 'permit', 'private', 'military', 'no', 'unknown')
+"""
+Values of the access tag recognized by determine_access
+"""
+
+_STATEMENT_TAG = re.compile(r'^\s*nwr\["([^"]+)"="([^"]+)"\]')
+
+def matches(filters: FountainFilter, fountain: FountainOpenStreetMap) -> bool:
+    for field, value in filters:
+        if value is None:
+            continue
+
+        actual = getattr(fountain, field)
+
+        if isinstance(value, list):
+            if actual not in value:
+                return False
+        elif actual != value:
+            return False
+
+    return True
+
+def _type_tag_filters(fountain_type: FountainType, tags: Dict[str, str]) -> Optional[List[str]]:
+    # every fountain of a type is returned by the statement of the tag determining its type
+    return [] if determine_type(tags) == fountain_type else None
+
+def _safe_water_tag_filters(safe_water: SafeWater, tags: Dict[str, str]) -> Optional[List[str]]:
+    if safe_water == SafeWater.NO:
+        return ['["drinking_water"="no"]']
+
+    if safe_water == SafeWater.YES:
+        return ['["drinking_water"!="no"]']
+
+    if tags.get('amenity') == 'drinking_water':
+        return None # always yes, unless no
+
+    return ['["drinking_water"!="no"]', '["drinking_water"!="treated"]', '["drinking_water:legal"!="yes"]', '["amenity"!="drinking_water"]']
+
+def _access_tag_filters(access: List[Access]) -> List[str]:
+    values = [value for value in ACCESS_TAG_VALUES if determine_access({ 'access': value }) in access]
+
+    return [f'["access"~"^({"|".join(values)})$"]']
+
+def _bool_tag_filters(tag: str, value: bool) -> List[str]:
+    # true only for yes, false for any other value of the tag
+    return [f'["{tag}"="yes"]'] if value else [f'["{tag}"]', f'["{tag}"!="yes"]']
+
+def _any_of(alternatives: List[Optional[List[str]]]) -> Optional[List[str]]:
+    """
+    Tag filters of any of the alternatives: the filters common to all of them (None if no alternative is possible)
+    """
+    possible = [alternative for alternative in alternatives if alternative is not None]
+
+    if not possible:
+        return None
+
+    return [tag_filter for tag_filter in possible[0] if all(tag_filter in alternative for alternative in possible[1:])]
+
+def tag_filters(filters: FountainFilter, tags: Dict[str, str]) -> Optional[List[str]]:
+    """
+    Overpass tag filters of a query statement selecting the elements with the given tags (e.g. amenity=drinking_water),
+    matching at least every element that can pass the filters, None if no element of the statement can pass them
+    """
+    statement_filters: List[str] = []
+
+    if filters.type:
+        type_filters = _any_of([_type_tag_filters(fountain_type, tags) for fountain_type in filters.type])
+
+        if type_filters is None:
+            return None
+
+        statement_filters.extend(type_filters)
+
+    if filters.safe_water:
+        safe_water_filters = _any_of([_safe_water_tag_filters(safe_water, tags) for safe_water in filters.safe_water])
+
+        if safe_water_filters is None:
+            return None
+
+        statement_filters.extend(safe_water_filters)
+
+    if filters.access:
+        statement_filters.extend(_access_tag_filters(filters.access))
+
+    if filters.access_wheelchair is not None:
+        statement_filters.extend(_bool_tag_filters('wheelchair', filters.access_wheelchair))
+
+    if filters.access_bottles is not None:
+        statement_filters.extend(_bool_tag_filters('bottle', filters.access_bottles))
+
+    return statement_filters
+
+def filtered_query_template(query_template: str, filters: FountainFilter) -> str:
+    """
+    Query template with the tag filters added to each statement with a {search} filter,
+    without the statements whose elements cannot pass the filters
+    """
+    lines = []
+
+    for line in query_template.splitlines():
+        statement = _STATEMENT_TAG.match(line)
+
+        if statement is not None and '{search}' in line:
+            statement_filters = tag_filters(filters, { statement[1]: statement[2] })
+
+            if statement_filters is None:
+                continue
+
+            line = line.replace('{search}', ''.join(statement_filters) + '{search}')
+
+        lines.append(line)
+
+    return '\n'.join(lines)
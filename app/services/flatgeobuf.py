@@ -0,0 +1,293 @@
+"""
+FlatGeobuf writer of point features with a packed Hilbert R-tree spatial index
+https://flatgeobuf.org/ (schemas header.fbs and feature.fbs)
+"""
+
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from dataclasses import dataclass
+from enum import IntEnum
+
+import json
+import math
+import struct
+
+from app.services.geo import hilbert_key
+
+MAGIC = b'fgb\x03fgb\x00'
+
+INDEX_NODE_SIZE = 16
+"""
+Children of each node of the spatial index
+"""
+
+NODE_ITEM = struct.Struct('<ddddQ')
+"""
+Index node: min x, min y, max x, max y and offset (of the feature for leaves, of the first child otherwise)
+"""
+
+GEOMETRY_POINT = 1
+
+class ColumnType(IntEnum):
+    BYTE = 0
+    UBYTE = 1
+    BOOL = 2
+    SHORT = 3
+    USHORT = 4
+    INT = 5
+    UINT = 6
+    LONG = 7
+    ULONG = 8
+    FLOAT = 9
+    DOUBLE = 10
+    STRING = 11
+    JSON = 12
+    DATETIME = 13
+    BINARY = 14
+
+@dataclass(frozen=True)
+class Column:
+    name: str
+    type: ColumnType
+
+PointFeature = Tuple[float, float, Dict[str, Any]]
+"""
+Longitude, latitude and properties by column name
+"""
+
+_SCALARS = { 'bool': struct.Struct('<?'), 'u8': struct.Struct('<B'), 'u16': struct.Struct('<H'),
+             'i32': struct.Struct('<i'), 'u64': struct.Struct('<Q'), 'f64': struct.Struct('<d') }
+
+Field = Tuple[str, Any] | None
+"""
+Table field as (kind, value): a scalar kind of _SCALARS, str, f64s (vector of doubles), u8s (vector of bytes),
+table (list of fields) or tables (list of tables), None if absent
+"""
+
+class FlatBufferBuilder:
+    """
+    Minimal FlatBuffers serializer of a table tree, laid out front to back (every offset points forward),
+    as a size-prefixed buffer aligned from its size prefix (as the FlatBuffers builders align them)
+    """
+
+    def __init__(self):
+        self.buf = bytearray()
+
+    def finish(self, fields: List[Field]) -> bytes:
+        self.buf += bytes(8) # size prefix and root table offset
+        struct.pack_into('<I', self.buf, 4, self._table(fields) - 4)
+        struct.pack_into('<I', self.buf, 0, len(self.buf) - 4)
+        return bytes(self.buf)
+
+    def _pad(self, alignment: int, extra: int = 0):
+        self.buf += bytes(-(len(self.buf) + extra) % alignment)
+
+    def _table(self, fields: List[Field]) -> int:
+        while fields and fields[-1] is None:
+            fields = fields[:-1]
+
+        self._pad(2)
+
+        vtable_pos = len(self.buf)
+        vtable_size = 4 + 2 * len(fields)
+        table_pos = vtable_pos + vtable_size
+        table_pos += -table_pos % 4
+
+        position = table_pos + 4 # after the vtable soffset
+        field_offsets = [0] * len(fields)
+        inline: List[Tuple[int, str, Any]] = []
+
+        for index, field in enumerate(fields):
+            if field is None:
+                continue
+
+            kind, value = field
+            size = _SCALARS[kind].size if kind in _SCALARS else 4
+            position += -position % size
+
+            field_offsets[index] = position - table_pos
+            inline.append((position, kind, value))
+            position += size
+
+        table_size = position - table_pos
+
+        self.buf += struct.pack(f'<{2 + len(fields)}H', vtable_size, table_size, *field_offsets)
+        self.buf += bytes(table_pos - len(self.buf))
+        self.buf += struct.pack('<i', table_pos - vtable_pos)
+        self.buf += bytes(table_size - 4)
+
+        for position, kind, value in inline:
+            if kind in _SCALARS:
+                _SCALARS[kind].pack_into(self.buf, position, value)
+
+        for position, kind, value in inline:
+            if kind not in _SCALARS:
+                struct.pack_into('<I', self.buf, position, self._reference(kind, value) - position)
+
+        return table_pos
+
+    def _reference(self, kind: str, value: Any) -> int:
+        if kind == 'table':
+            return self._table(value)
+
+        if kind == 'f64s':
+            self._pad(8, extra=4) # doubles aligned after the length
+        else:
+            self._pad(4)
+
+        position = len(self.buf)
+
+        if kind == 'str':
+            encoded = value.encode('utf8')
+            self.buf += struct.pack('<I', len(encoded)) + encoded + b'\0'
+        elif kind == 'f64s':
+            self.buf += struct.pack(f'<I{len(value)}d', len(value), *value)
+        elif kind == 'u8s':
+            self.buf += struct.pack('<I', len(value)) + value
+        elif kind == 'tables':
+            self.buf += struct.pack('<I', len(value)) + bytes(4 * len(value))
+
+            for index, table in enumerate(value):
+                element_position = position + 4 + 4 * index
+                struct.pack_into('<I', self.buf, element_position, self._table(table) - element_position)
+        else:
+            raise ValueError(f"Unknown FlatBuffers field kind {kind}")
+
+        return position
+
+def encode_properties(columns: Sequence[Column], properties: Dict[str, Any]) -> bytes:
+    """
+    Properties as (column index, value) pairs, skipping null values
+    """
+    encoded = bytearray()
+
+    for index, column in enumerate(columns):
+        value = properties.get(column.name)
+
+        if value is None:
+            continue
+
+        encoded += struct.pack('<H', index)
+
+        if column.type == ColumnType.BOOL:
+            encoded += struct.pack('<?', value)
+        elif column.type == ColumnType.INT:
+            encoded += struct.pack('<i', value)
+        elif column.type == ColumnType.LONG:
+            encoded += struct.pack('<q', value)
+        elif column.type == ColumnType.DOUBLE:
+            encoded += struct.pack('<d', value)
+        else: # STRING, JSON, DATETIME (ISO 8601)
+            text = json.dumps(value, ensure_ascii=False) if column.type == ColumnType.JSON else str(value)
+            text_bytes = text.encode('utf8')
+            encoded += struct.pack('<I', len(text_bytes)) + text_bytes
+
+    return bytes(encoded)
+
+def encode_feature(columns: Sequence[Column], feature: PointFeature) -> bytes:
+    long, lat, properties = feature
+
+    geometry: List[Field] = [None, ('f64s', (long, lat))]
+    return FlatBufferBuilder().finish([('table', geometry), ('u8s', encode_properties(columns, properties))])
+
+def encode_header(columns: Sequence[Column], count: int, envelope: Tuple[float, float, float, float] | None,
+                  name: str, description: str | None = None, metadata: str | None = None) -> bytes:
+    header: List[Field] = [
+        ('str', name),
+        ('f64s', envelope) if envelope else None,
+        ('u8', GEOMETRY_POINT),
+        None, None, None, None, # has_z, has_m, has_t, has_tm
+        ('tables', [[('str', column.name), ('u8', int(column.type))] for column in columns]),
+        ('u64', count),
+        ('u16', INDEX_NODE_SIZE if count else 0),
+        ('table', [('str', 'EPSG'), ('i32', 4326)]),
+        None, # title
+        ('str', description) if description else None,
+        ('str', metadata) if metadata else None,
+    ]
+
+    return FlatBufferBuilder().finish(header)
+
+def level_bounds(count: int, node_size: int = INDEX_NODE_SIZE) -> List[Tuple[int, int]]:
+    """
+    Node ranges of each level of the index, from the leaves (at the end) to the root (first node)
+    """
+    level_counts = [count]
+    nodes = count
+
+    while True:
+        count = math.ceil(count / node_size)
+        level_counts.append(count)
+        nodes += count
+
+        if count == 1:
+            break
+
+    bounds = []
+
+    for level_count in level_counts:
+        bounds.append((nodes - level_count, nodes))
+        nodes -= level_count
+
+    return bounds
+
+def encode_index(leaves: List[Tuple[float, float, int]], node_size: int = INDEX_NODE_SIZE) -> bytes:
+    """
+    Packed R-tree of the points (x, y, feature offset), already sorted by their Hilbert curve position
+    """
+    bounds = level_bounds(len(leaves), node_size)
+    nodes: List[Tuple[float, float, float, float, int]] = [(0, 0, 0, 0, 0)] * bounds[0][1]
+
+    leaves_start = bounds[0][0]
+
+    for index, (x, y, offset) in enumerate(leaves):
+        nodes[leaves_start + index] = (x, y, x, y, offset)
+
+    for (start, end), (parent_start, _) in zip(bounds, bounds[1:]):
+        parent = parent_start
+
+        for first_child in range(start, end, node_size):
+            children = nodes[first_child:min(first_child + node_size, end)]
+
+            nodes[parent] = (min(node[0] for node in children), min(node[1] for node in children),
+                             max(node[2] for node in children), max(node[3] for node in children), first_child)
+            parent += 1
+
+    return b''.join(NODE_ITEM.pack(*node) for node in nodes)
+
+def write_flatgeobuf(columns: Sequence[Column], features: Iterable[PointFeature], name: str,
+                     description: str | None = None, metadata: str | None = None) -> Iterator[bytes]:
+    """
+    FlatGeobuf file chunks. Features are sorted along the Hilbert curve and indexed, so clients can read
+    only the features within a bounding box (HTTP range requests)
+    """
+    points = list(features)
+
+    envelope = None
+
+    if points:
+        longs = [long for long, _, _ in points]
+        lats = [lat for _, lat, _ in points]
+        envelope = (min(longs), min(lats), max(longs), max(lats))
+
+        bbox = (envelope[1], envelope[0], envelope[3], envelope[2])
+        # descending, as the reference implementation (packedrtree.cpp hilbertSort)
+        points.sort(key=lambda point: hilbert_key(point[1], point[0], bbox), reverse=True)
+
+    yield MAGIC
+    yield encode_header(columns, len(points), envelope, name, description, metadata)
+
+    if not points:
+        return
+
+    encoded_features = [encode_feature(columns, point) for point in points]
+
+    leaves = []
+    offset = 0
+
+    for (long, lat, _), encoded_feature in zip(points, encoded_features):
+        leaves.append((long, lat, offset))
+        offset += len(encoded_feature)
+
+    yield encode_index(leaves)
+    yield from encoded_features
@@ -0,0 +1,210 @@
+"""
+Encoders of the fountains responses in other formats than JSON (MessagePack, GeoJSON, FlatGeobuf),
+streamed from the transformed fountains
+"""
+
+from typing import Any, Callable, Dict, Iterable, Iterator
+
+import json
+import struct
+
+from app.models.fountain import FountainOpenStreetMap
+from app.models.response import ResponseFormat
+from app.services.flatgeobuf import Column, ColumnType, write_flatgeobuf
+
+FOUNTAIN_EXCLUDE = { 'provider_name' }
+"""
+Fountain fields sent once in the response metadata instead of in every fountain
+"""
+
+def fountain_content(fountain: FountainOpenStreetMap) -> Dict[str, Any]:
+    return fountain.model_dump(mode='json', exclude_none=True, exclude=FOUNTAIN_EXCLUDE)
+
+def _msgpack(value: Any, out: bytearray):
+    # pylint: disable=too-many-branches
+    if value is None:
+        out += b'\xc0'
+    elif value is True:
+        out += b'\xc3'
+    elif value is False:
+        out += b'\xc2'
+    elif isinstance(value, int):
+        if 0 <= value < 0x80:
+            out += struct.pack('B', value)
+        elif -32 <= value < 0:
+            out += struct.pack('b', value)
+        elif 0 <= value <= 0xFFFFFFFF:
+            out += struct.pack('>BI', 0xce, value)
+        elif 0 <= value:
+            out += struct.pack('>BQ', 0xcf, value)
+        else:
+            out += struct.pack('>Bq', 0xd3, value)
+    elif isinstance(value, float):
+        out += struct.pack('>Bd', 0xcb, value)
+    elif isinstance(value, str):
+        encoded = value.encode('utf8')
+        length = len(encoded)
+
+        if length < 32:
+            out += struct.pack('B', 0xa0 | length)
+        elif length <= 0xFF:
+            out += struct.pack('>BB', 0xd9, length)
+        elif length <= 0xFFFF:
+            out += struct.pack('>BH', 0xda, length)
+        else:
+            out += struct.pack('>BI', 0xdb, length)
+
+        out += encoded
+    elif isinstance(value, (list, tuple)):
+        msgpack_array_header(len(value), out)
+
+        for item in value:
+            _msgpack(item, out)
+    elif isinstance(value, dict):
+        msgpack_map_header(len(value), out)
+
+        for key, item in value.items():
+            _msgpack(str(key), out)
+            _msgpack(item, out)
+    else:
+        raise TypeError(f"Type {type(value).__name__} is not supported by MessagePack")
+
+def msgpack_array_header(length: int, out: bytearray):
+    if length < 16:
+        out += struct.pack('B', 0x90 | length)
+    elif length <= 0xFFFF:
+        out += struct.pack('>BH', 0xdc, length)
+    else:
+        out += struct.pack('>BI', 0xdd, length)
+
+def msgpack_map_header(length: int, out: bytearray):
+    if length < 16:
+        out += struct.pack('B', 0x80 | length)
+    elif length <= 0xFFFF:
+        out += struct.pack('>BH', 0xde, length)
+    else:
+        out += struct.pack('>BI', 0xdf, length)
+
+def msgpack_encode(value: Any) -> bytes:
+    """
+    MessagePack of JSON compatible values (None, bool, int, float, str, list and dict)
+    """
+    out = bytearray()
+    _msgpack(value, out)
+    return bytes(out)
+
+CHUNK_FOUNTAINS = 1000
+"""
+Fountains encoded per streamed chunk
+"""
+
+def encode_msgpack(metadata: Dict[str, Any], fountains: Iterable[FountainOpenStreetMap], count: int) -> Iterator[bytes]:
+    """
+    Same fields as the JSON response (metadata, count and fountains)
+    """
+    out = bytearray()
+
+    msgpack_map_header(len(metadata) + 2, out)
+
+    for key, value in metadata.items():
+        _msgpack(key, out)
+        _msgpack(value, out)
+
+    _msgpack('count', out)
+    _msgpack(count, out)
+    _msgpack('fountains', out)
+    msgpack_array_header(count, out)
+
+    for index, fountain in enumerate(fountains, start=1):
+        _msgpack(fountain_content(fountain), out)
+
+        if index % CHUNK_FOUNTAINS == 0:
+            yield bytes(out)
+            out.clear()
+
+    yield bytes(out)
+
+def geojson_feature(fountain: FountainOpenStreetMap) -> Dict[str, Any]:
+    properties = fountain_content(fountain)
+    long, lat = properties.pop('long'), properties.pop('lat')
+
+    return {
+        "type": "Feature",
+        "id": fountain.provider_id,
+        "geometry": { "type": "Point", "coordinates": [long, lat] },
+        "properties": properties,
+    }
+
+def encode_geojson(metadata: Dict[str, Any], fountains: Iterable[FountainOpenStreetMap], count: int) -> Iterator[bytes]:
+    """
+    FeatureCollection of points, with the response metadata as foreign members
+    """
+    def dumps(value: Any) -> str:
+        return json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(',', ':'))
+
+    header = { "type": "FeatureCollection", **metadata, "count": count }
+
+    chunk = [dumps(header)[:-1], ',"features":[']
+
+    for index, fountain in enumerate(fountains):
+        if index:
+            chunk.append(',')
+
+        chunk.append(dumps(geojson_feature(fountain)))
+
+        if (index + 1) % CHUNK_FOUNTAINS == 0:
+            yield ''.join(chunk).encode('utf8')
+            chunk.clear()
+
+    chunk.append(']}')
+
+    yield ''.join(chunk).encode('utf8')
+
+FLATGEOBUF_COLUMNS = [
+    Column('provider_id', ColumnType.STRING),
+    Column('type', ColumnType.STRING),
+    Column('name', ColumnType.STRING),
+    Column('description', ColumnType.STRING),
+    Column('picture', ColumnType.STRING),
+    Column('operational_status', ColumnType.BOOL),
+    Column('safe_water', ColumnType.STRING),
+    Column('legal_water', ColumnType.STRING),
+    Column('access_bottles', ColumnType.BOOL),
+    Column('access_pets', ColumnType.BOOL),
+    Column('access_wheelchair', ColumnType.BOOL),
+    Column('access', ColumnType.STRING),
+    Column('fee', ColumnType.BOOL),
+    Column('address', ColumnType.STRING),
+    Column('website', ColumnType.STRING),
+    Column('provider_updated_at', ColumnType.DATETIME),
+    Column('provider_url', ColumnType.STRING),
+    Column('merged_ids', ColumnType.JSON),
+    Column('osm', ColumnType.JSON),
+]
+
+def encode_flatgeobuf(metadata: Dict[str, Any], fountains: Iterable[FountainOpenStreetMap], _: int) -> Iterator[bytes]:
+    """
+    Point features with the fountain fields as columns (osm as JSON) and the response metadata as header metadata
+    """
+    def features():
+        for fountain in fountains:
+            properties = fountain_content(fountain)
+            yield properties.pop('long'), properties.pop('lat'), properties
+
+    return write_flatgeobuf(FLATGEOBUF_COLUMNS, features(), name='fountains',
+                            description=metadata.get('query_url'), metadata=json.dumps(metadata))
+
+Encoder = Callable[[Dict[str, Any], Iterable[FountainOpenStreetMap], int], Iterator[bytes]]
+
+ENCODERS: Dict[ResponseFormat, Encoder] = {
+    ResponseFormat.MSGPACK: encode_msgpack,
+    ResponseFormat.GEOJSON: encode_geojson,
+    ResponseFormat.FLATGEOBUF: encode_flatgeobuf,
+}
+
+MEDIA_TYPES: Dict[ResponseFormat, str] = {
+    ResponseFormat.JSON: "application/json",
+    ResponseFormat.MSGPACK: "application/msgpack",
+    ResponseFormat.GEOJSON: "application/geo+json",
+    ResponseFormat.FLATGEOBUF: "application/flatgeobuf",
+}
@@ -0,0 +1,363 @@
+"""
+Geographic helpers to filter fountains locally
+"""
+
+from typing import Callable, Dict, List, Tuple, TypeVar
+
+from collections import defaultdict
+
+import math
+
+T = TypeVar('T')
+
+EARTH_RADIUS = 6371008.8
+"""
+Mean Earth radius in meters
+"""
+
+BoundingBox = Tuple[float, float, float, float]
+"""
+(south_lat, west_long, north_lat, east_long)
+"""
+
+Point = Tuple[float, float]
+"""
+(lat, long)
+"""
+
+def distance(lat1: float, long1: float, lat2: float, long2: float) -> float:
+    """
+    Great-circle distance in meters between two points (haversine formula)
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    delta_phi = phi2 - phi1
+    delta_lambda = math.radians(long2 - long1)
+
+    a = math.sin(delta_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2
+
+    return 2 * EARTH_RADIUS * math.asin(min(1, math.sqrt(a)))
+
+def in_bbox(lat: float, long: float, bbox: BoundingBox) -> bool:
+    south_lat, west_long, north_lat, east_long = bbox
+
+    return south_lat <= lat <= north_lat and west_long <= long <= east_long
+
+def distance_to_bbox(lat: float, long: float, bbox: BoundingBox) -> float:
+    """
+    Distance in meters from a point to the nearest point of a bounding box (0 if inside)
+    """
+    south_lat, west_long, north_lat, east_long = bbox
+
+    return distance(lat, long, min(max(lat, south_lat), north_lat), min(max(long, west_long), east_long))
+
+def circle_bbox(lat: float, long: float, radius: float) -> BoundingBox:
+    """
+    Bounding box of a circle (radius in meters)
+    """
+    delta_lat = math.degrees(radius / EARTH_RADIUS)
+    delta_long = math.degrees(radius / (EARTH_RADIUS * max(math.cos(math.radians(lat)), 1e-6)))
+
+    return (max(lat - delta_lat, -90), max(long - delta_long, -180), min(lat + delta_lat, 90), min(long + delta_long, 180))
+
+def bbox_contains(outer: BoundingBox, inner: BoundingBox) -> bool:
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and inner[2] <= outer[2] and inner[3] <= outer[3]
+
+def bbox_intersection(a: BoundingBox, b: BoundingBox) -> BoundingBox | None:
+    intersection = (max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3]))
+
+    if intersection[0] >= intersection[2] or intersection[1] >= intersection[3]:
+        return None
+
+    return intersection
+
+def bbox_area(bbox: BoundingBox) -> float:
+    """
+    Area in square degrees (only to compare bounding boxes)
+    """
+    return max(0, bbox[2] - bbox[0]) * max(0, bbox[3] - bbox[1])
+
+def bbox_difference(a: BoundingBox, b: BoundingBox) -> List[BoundingBox]:
+    """
+    Bounding boxes covering the part of a outside b (at most 4)
+    """
+    intersection = bbox_intersection(a, b)
+
+    if intersection is None:
+        return [a]
+
+    south_lat, west_long, north_lat, east_long = a
+    inner_south, inner_west, inner_north, inner_east = intersection
+
+    pieces = [
+        (south_lat, west_long, inner_south, east_long), # south strip
+        (inner_north, west_long, north_lat, east_long), # north strip
+        (inner_south, west_long, inner_north, inner_west), # west strip
+        (inner_south, inner_east, inner_north, east_long), # east strip
+    ]
+
+    return [piece for piece in pieces if bbox_area(piece) > 0]
+
+HILBERT_MAX = (1 << 16) - 1
+
+def hilbert(x: int, y: int) -> int:
+    """
+    Position of a point (x and y from 0 to HILBERT_MAX) along the Hilbert curve, so near points get near positions
+    https://github.com/rawrunprotected/hilbert_curves (as in FlatGeobuf)
+    """
+    a = x ^ y
+    b = 0xFFFF ^ a
+    c = 0xFFFF ^ (x | y)
+    d = x & (y ^ 0xFFFF)
+
+    A = a | (b >> 1)
+    B = (a >> 1) ^ a
+    C = ((c >> 1) ^ (b & (d >> 1))) ^ c
+    D = ((a & (c >> 1)) ^ (d >> 1)) ^ d
+
+    a, b, c, d = A, B, C, D
+    A = (a & (a >> 2)) ^ (b & (b >> 2))
+    B = (a & (b >> 2)) ^ (b & ((a ^ b) >> 2))
+    C ^= (a & (c >> 2)) ^ (b & (d >> 2))
+    D ^= (b & (c >> 2)) ^ ((a ^ b) & (d >> 2))
+
+    a, b, c, d = A, B, C, D
+    A = (a & (a >> 4)) ^ (b & (b >> 4))
+    B = (a & (b >> 4)) ^ (b & ((a ^ b) >> 4))
+    C ^= (a & (c >> 4)) ^ (b & (d >> 4))
+    D ^= (b & (c >> 4)) ^ ((a ^ b) & (d >> 4))
+
+    a, b, c, d = A, B, C, D
+    C ^= (a & (c >> 8)) ^ (b & (d >> 8))
+    D ^= (b & (c >> 8)) ^ ((a ^ b) & (d >> 8))
+
+    a = C ^ (C >> 1)
+    b = D ^ (D >> 1)
+
+    i0 = x ^ y
+    i1 = b | (0xFFFF ^ (i0 | a))
+
+    i0 = (i0 | (i0 << 8)) & 0x00FF00FF
+    i0 = (i0 | (i0 << 4)) & 0x0F0F0F0F
+    i0 = (i0 | (i0 << 2)) & 0x33333333
+    i0 = (i0 | (i0 << 1)) & 0x55555555
+
+    i1 = (i1 | (i1 << 8)) & 0x00FF00FF
+    i1 = (i1 | (i1 << 4)) & 0x0F0F0F0F
+    i1 = (i1 | (i1 << 2)) & 0x33333333
+    i1 = (i1 | (i1 << 1)) & 0x55555555
+
+    return (i1 << 1) | i0
+
+def scaled(lat: float, long: float, bbox: BoundingBox) -> Tuple[int, int]:
+    """
+    Point scaled within a bounding box to x and y from 0 to HILBERT_MAX
+    """
+    south_lat, west_long, north_lat, east_long = bbox
+
+    width = east_long - west_long
+    height = north_lat - south_lat
+
+    x = int(HILBERT_MAX * (long - west_long) / width) if width > 0 else 0
+    y = int(HILBERT_MAX * (lat - south_lat) / height) if height > 0 else 0
+
+    return x, y
+
+def hilbert_key(lat: float, long: float, bbox: BoundingBox) -> int:
+    """
+    Hilbert curve position of a point scaled within a bounding box
+    """
+    return hilbert(*scaled(lat, long, bbox))
+
+def z_order(x: int, y: int) -> int:
+    """
+    Position of a point (x and y from 0 to HILBERT_MAX) along the Z-order (Morton) curve: interleaved bits of x and y
+    """
+    def spread(value: int) -> int:
+        value = (value | (value << 8)) & 0x00FF00FF
+        value = (value | (value << 4)) & 0x0F0F0F0F
+        value = (value | (value << 2)) & 0x33333333
+        return (value | (value << 1)) & 0x55555555
+
+    return (spread(y) << 1) | spread(x)
+
+def z_order_key(lat: float, long: float, bbox: BoundingBox) -> int:
+    """
+    Z-order curve position of a point scaled within a bounding box
+    """
+    return z_order(*scaled(lat, long, bbox))
+
+CURVE_KEYS = {
+    'hilbert': hilbert_key,
+    'zorder': z_order_key,
+}
+"""
+Space-filling curve keys by name
+"""
+
+def curve_sorted(items: List[T], position: Callable[[T], Tuple[float, float]], curve: str = 'hilbert') -> List[T]:
+    """
+    Items sorted along a space-filling curve (hilbert or zorder) scaled to their bounding box,
+    so consecutive items (e.g. a batch) cover a compact region. position returns the (lat, long) of an item.
+    """
+    if not items:
+        return items
+
+    curve_key = CURVE_KEYS[curve]
+    positions = [position(item) for item in items]
+
+    lats = [lat for lat, _ in positions]
+    longs = [long for _, long in positions]
+    bbox = (min(lats), min(longs), max(lats), max(longs))
+
+    keys = [curve_key(lat, long, bbox) for lat, long in positions]
+
+    return [items[index] for index in sorted(range(len(items)), key=keys.__getitem__)]
+
+class ProximityGrid:
+    """
+    Grid of indexed points to find the points near another point: rows of cell_lat degrees (the distance),
+    split in columns wide enough for the distance at the poleward edge of their degree of latitude.
+    Columns wrap around the antimeridian, so points at both sides of ±180° are neighbors.
+    """
+
+    def __init__(self, grid_distance: float):
+        self.cell_lat = math.degrees(grid_distance / EARTH_RADIUS)
+        # whole number of columns in each row, so the last column meets the first one at the antimeridian
+        self._columns = [max(1, math.floor(360 / self._long_span(max(abs(lat), abs(lat + 1))))) for lat in range(-90, 90)]
+        self._cells: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+
+    def _long_span(self, lat: float) -> float:
+        """
+        Degrees of longitude of the grid distance around a latitude
+        """
+        cos = math.cos(math.radians(min(90, lat + self.cell_lat)))
+        return min(360, self.cell_lat / cos) if cos > 1e-9 else 360
+
+    def _row(self, lat: float) -> int:
+        return math.floor((lat + 90) / self.cell_lat)
+
+    def _row_columns(self, row: int) -> int:
+        return self._columns[min(179, max(0, int(row * self.cell_lat)))]
+
+    def add(self, lat: float, long: float, index: int):
+        row = self._row(lat)
+        columns = self._row_columns(row)
+        self._cells[(row, math.floor((long + 180) * columns / 360) % columns)].append(index)
+
+    def neighbors(self, lat: float, long: float) -> List[int]:
+        """
+        Indices of the points of the cells within the grid distance of a point (usually 2 rows of 2 cells)
+        """
+        cells = self._cells
+        long += 180
+        span = 360 / self._row_columns(self._row(lat)) # at least the distance at the latitude of the point
+        neighbors: List[int] = []
+
+        for row in range(self._row(lat - self.cell_lat), self._row(lat + self.cell_lat) + 1):
+            columns = self._row_columns(row)
+            first, last = math.floor((long - span) * columns / 360), math.floor((long + span) * columns / 360)
+
+            for column in range(columns) if last - first + 1 >= columns else range(first, last + 1):
+                if (row, column % columns) in cells:
+                    neighbors.extend(cells[(row, column % columns)])
+
+        return neighbors
+
+def decode_polyline(encoded: str, precision: int = 5) -> List[Point]:
+    """
+    Points of an encoded polyline (https://developers.google.com/maps/documentation/utilities/polylinealgorithm),
+    precision 5 (Google) or 6 (OSRM, Valhalla). Raises ValueError if the polyline is malformed.
+    """
+    factor = 10 ** precision
+    points: List[Point] = []
+    index, lat, long = 0, 0, 0
+
+    try:
+        while index < len(encoded):
+            deltas = []
+
+            for _ in range(2):
+                shift, result = 0, 0
+
+                while True:
+                    byte = ord(encoded[index]) - 63
+                    index += 1
+
+                    if not 0 <= byte < 64:
+                        raise ValueError(f"Invalid polyline character at {index - 1}")
+
+                    result |= (byte & 0x1f) << shift
+                    shift += 5
+
+                    if byte < 0x20:
+                        break
+
+                deltas.append(~(result >> 1) if result & 1 else result >> 1)
+
+            lat += deltas[0]
+            long += deltas[1]
+            points.append((lat / factor, long / factor))
+    except IndexError as e:
+        raise ValueError("Truncated polyline") from e
+
+    return points
+
+def segment_distance(lat: float, long: float, start: Point, end: Point) -> Tuple[float, float]:
+    """
+    Distance in meters from a point to a segment, and fraction of the segment to its nearest point
+    (equirectangular projection around the point, accurate for segments of a few kilometers)
+    """
+    scale = math.cos(math.radians(lat))
+    start_x, start_y = ((start[1] - long + 180) % 360 - 180) * scale, start[0] - lat
+    end_x, end_y = ((end[1] - long + 180) % 360 - 180) * scale, end[0] - lat
+    delta_x, delta_y = end_x - start_x, end_y - start_y
+    length2 = delta_x * delta_x + delta_y * delta_y
+
+    fraction = 0 if length2 == 0 else min(1, max(0, -(start_x * delta_x + start_y * delta_y) / length2))
+
+    return math.radians(math.hypot(start_x + fraction * delta_x, start_y + fraction * delta_y)) * EARTH_RADIUS, fraction
+
+def simplify_line(points: List[Point], tolerance: float) -> List[Point]:
+    """
+    Line simplified with the Douglas-Peucker algorithm: every point of the line is within tolerance meters of the simplified line
+    """
+    if len(points) < 3:
+        return list(points)
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    ranges = [(0, len(points) - 1)]
+
+    # segment_distance inlined (the hot loop of long routes), with the longitudes unwrapped across the antimeridian
+    lats = [lat for lat, _ in points]
+    longs = [points[0][1]]
+
+    for _, long in points[1:]:
+        longs.append(longs[-1] + (long - longs[-1] + 180) % 360 - 180)
+
+    scales = [math.cos(math.radians(lat)) for lat in lats]
+    tolerance_degrees = math.degrees(tolerance / EARTH_RADIUS)
+
+    while ranges:
+        first, last = ranges.pop()
+        farthest, farthest_distance = -1, tolerance_degrees
+        start_lat, start_long = lats[first], longs[first]
+        delta_lat, delta_long = lats[last] - start_lat, longs[last] - start_long
+
+        for index in range(first + 1, last):
+            scale = scales[index]
+            start_x, start_y = (start_long - longs[index]) * scale, start_lat - lats[index]
+            delta_x = delta_long * scale
+            length2 = delta_x * delta_x + delta_lat * delta_lat
+            fraction = 0 if length2 == 0 else min(1, max(0, -(start_x * delta_x + start_y * delta_lat) / length2))
+            point_distance = math.hypot(start_x + fraction * delta_x, start_y + fraction * delta_lat)
+
+            if point_distance > farthest_distance:
+                farthest, farthest_distance = index, point_distance
+
+        if farthest >= 0:
+            keep[farthest] = True
+            ranges.append((first, farthest))
+            ranges.append((farthest, last))
+
+    return [point for point, kept in zip(points, keep) if kept]
@@ -0,0 +1,195 @@
+"""
+Background jobs for long-running fountains queries, with results stored compressed on disk
+"""
+
+from typing import Any, Callable, Dict, Iterator, Set
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from time import sleep, time
+
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import os.path
+import threading
+
+from app.models.job import Job, JobStatus
+from app.models.filter import FountainFilter
+from app.errors import RequestError
+
+from app.config import logger
+
+JOBS_DIR = "jobs"
+
+ACTIVE_JOB_STATUS = (JobStatus.PENDING, JobStatus.RUNNING)
+
+HEARTBEAT_INTERVAL = 30
+"""
+Seconds between heartbeats of the active (pending or running) jobs of a worker: the modification time of their status file
+"""
+
+STALE_JOB_TIMEOUT = 4 * HEARTBEAT_INTERVAL
+"""
+Seconds without heartbeat for an active job to be considered abandoned (e.g. the worker was restarted)
+"""
+
+def job_id(area: str | None, updated: datetime | None, raw: bool, osm: bool, dedup: float | None = None,
+           filters: FountainFilter | None = None) -> str:
+    """
+    Job identifier for the query parameters, so identical queries share the same job
+    """
+    params: Dict[str, Any] = {
+        "area": area.lower() if area else None,
+        "updated": updated.isoformat() if updated else None,
+        "raw": raw,
+        "osm": osm,
+    }
+
+    if dedup and not raw:
+        params["dedup"] = dedup # only when set, so the identifiers of the previous jobs are kept
+
+    if filters is not None and not raw:
+        params["filters"] = filters.model_dump(mode='json', exclude_none=True)
+
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf8')).hexdigest()[:16]
+
+class JobManager:
+    """
+    Runs jobs in a worker pool and stores their status and results in the jobs directory,
+    shared by every API worker process.
+    """
+
+    def __init__(self, jobs_dir: str = JOBS_DIR, workers: int = 2,
+                 heartbeat_interval: float = HEARTBEAT_INTERVAL, stale_timeout: float = STALE_JOB_TIMEOUT):
+        self.jobs_dir = jobs_dir
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_timeout = stale_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fountains_job')
+        self._active: Set[str] = set()
+        """
+        Pending and running jobs of this worker
+        """
+        self._lock = threading.Lock()
+
+        os.makedirs(self.jobs_dir, exist_ok=True)
+
+        threading.Thread(target=self._heartbeat, name='fountains_job_heartbeat', daemon=True).start()
+
+    def status_path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def result_path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json.gz")
+
+    def get(self, job_id: str) -> Job | None:
+        try:
+            with open(self.status_path(job_id), 'r', encoding='utf8') as status_file:
+                return Job.model_validate_json(status_file.read())
+        except FileNotFoundError:
+            return None
+
+    def submit(self, job: Job, run: Callable[[Job], Dict[str, Any]]) -> Job:
+        """
+        Queue the job, unless an identical job is already pending or running in any worker
+        """
+        with self._claim():
+            active_job = self.get(job.id)
+
+            if active_job is not None and active_job.status in ACTIVE_JOB_STATUS and not self._is_stale(active_job.id):
+                logger.info('job %s already %s', active_job.id, active_job.status.value)
+                return active_job
+
+            self._save(job)
+
+            with self._lock:
+                self._active.add(job.id)
+
+        self._executor.submit(self._run, job.model_copy(), run)
+
+        logger.info('job %s submitted', job.id)
+
+        return job
+
+    def _run(self, job: Job, run: Callable[[Job], Dict[str, Any]]):
+        job.status = JobStatus.RUNNING
+        job.started_at = datetime.now(timezone.utc)
+        self._save(job)
+
+        try:
+            content = run(job)
+
+            job.count = content["count"] if "count" in content else len(content.get("elements", []))
+            job.size = self._save_result(job.id, content)
+            job.status = JobStatus.COMPLETED
+        except RequestError as e:
+            job.status = JobStatus.FAILED
+            job.error = e.detail
+            job.error_status = e.status_code
+        except Exception as e: # pylint: disable=broad-exception-caught
+            logger.exception('job %s failed', job.id)
+            job.status = JobStatus.FAILED
+            job.error = repr(e)
+
+        job.finished_at = datetime.now(timezone.utc)
+        self._save(job)
+
+        with self._lock:
+            self._active.discard(job.id)
+
+        logger.info('job %s %s', job.id, job.status.value)
+
+    @contextmanager
+    def _claim(self) -> Iterator[None]:
+        """
+        Exclusive lock of the jobs directory across processes, to check and claim a job atomically
+        """
+        lock_fd = os.open(os.path.join(self.jobs_dir, '.lock'), os.O_CREAT | os.O_RDWR)
+
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(lock_fd) # releases the lock
+
+    def _is_stale(self, job_id: str) -> bool:
+        try:
+            heartbeat = os.path.getmtime(self.status_path(job_id))
+        except FileNotFoundError:
+            return True
+
+        return time() - heartbeat > self.stale_timeout
+
+    def _heartbeat(self):
+        while True:
+            with self._lock:
+                active = list(self._active)
+
+            for job_id in active:
+                try:
+                    os.utime(self.status_path(job_id))
+                except FileNotFoundError:
+                    pass
+
+            sleep(self.heartbeat_interval)
+
+    def _save(self, job: Job):
+        _write_atomic(self.status_path(job.id), job.model_dump_json().encode('utf8'))
+
+    def _save_result(self, job_id: str, content: Dict[str, Any]) -> int:
+        result_path = self.result_path(job_id)
+
+        _write_atomic(result_path, gzip.compress(json.dumps(content).encode('utf8')))
+
+        return os.path.getsize(result_path)
+
+def _write_atomic(file_path: str, data: bytes):
+    tmp_file_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+    with open(tmp_file_path, 'wb') as tmp_file:
+        tmp_file.write(data)
+
+    os.replace(tmp_file_path, file_path)
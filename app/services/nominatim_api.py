@@ -2,15 +2,29 @@
 Geocoding to request OpenStreetMap areas using Nominatim API
 """
 
+from os import getenv
+from functools import lru_cache
+from urllib.parse import urlsplit
+
 from fastapi import status as HTTPStatus
 
 from geopy.location import Location
 from geopy.geocoders import Nominatim
 from geopy.exc import GeocoderTimedOut, GeocoderServiceError
 
+from app.services.deadline import remaining_timeout
+from app.services.geo import BoundingBox
 from app.config import APP_NAME
 from app.errors import RequestTimeoutError, OpenStreetMapError
 
+NOMINATIM_URL = "https://nominatim.openstreetmap.org"
+
+def nominatim_url() -> str:
+    """
+    Nominatim API URL from NOMINATIM_URL environment variable (e.g. a local stand-in server)
+    """
+    return getenv('NOMINATIM_URL') or NOMINATIM_URL
+
 class NominatimAPI:
     """
     Geocoding Nominatim API wrapper
@@ -19,20 +33,39 @@ class NominatimAPI:
 
     api: Nominatim
 
-    def __init__(self, timeout: int = 10):
-        self.api = Nominatim(user_agent=APP_NAME, timeout=timeout) # type: ignore
+    def __init__(self, timeout: int = 10, url: str | None = None):
+        url_parts = urlsplit(url or nominatim_url())
+
+        self.api = Nominatim(user_agent=APP_NAME, timeout=timeout, # type: ignore
+                             domain=url_parts.netloc + url_parts.path.rstrip('/'), scheme=url_parts.scheme or 'https')
+
+    def _geocode(self, geocode_area: str) -> Location:
+        timeout = remaining_timeout(self.api.timeout) # type: ignore
 
-    def find_area_id(self, geocode_area: str) -> int | None:
         try:
-            geocoding_result: Location | None = self.api.geocode(geocode_area, timeout=self.api.timeout) # type: ignore
+            geocoding_result: Location | None = self.api.geocode(geocode_area, timeout=timeout) # type: ignore
         except GeocoderTimedOut as e:
-            raise RequestTimeoutError(f"Geocoding request timed out after {self.api.timeout} seconds") from e
+            raise RequestTimeoutError(f"Geocoding request timed out after {timeout} seconds") from e
         except GeocoderServiceError as e:
             raise OpenStreetMapError(f"Geocoding request error: {repr(e)}") from e
 
         if geocoding_result is None:
             raise OpenStreetMapError(f"Geocoding request error: {geocode_area} not found", status=HTTPStatus.HTTP_404_NOT_FOUND)
 
+        return geocoding_result
+
+    def find_area_id(self, geocode_area: str) -> int | None:
+        geocoding_result = self._geocode(geocode_area)
+
         area_id = int(geocoding_result.raw["osm_id"]) + 3600000000 # relation id to area id
 
         return area_id
+
+    @lru_cache(maxsize=256)
+    def find_area_bbox(self, geocode_area: str) -> BoundingBox:
+        """
+        Bounding box of an area (south_lat, west_long, north_lat, east_long), cached as areas rarely change
+        """
+        south_lat, north_lat, west_long, east_long = (float(coordinate) for coordinate in self._geocode(geocode_area).raw["boundingbox"])
+
+        return south_lat, west_long, north_lat, east_long
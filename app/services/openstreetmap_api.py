@@ -2,12 +2,24 @@
 Request fountains in OpenStreetMap using Overpass API
 """
 
+from typing import Any, Callable, Dict, Iterable, List
+
 from datetime import datetime, timezone
+from os import getenv
 
 import re
 import overpass
+import requests
 
 from app.services.nominatim_api import NominatimAPI
+from app.services.overpass_pool import OverpassEndpointPool
+from app.services.overpass_scheduler import Priority, scheduler
+from app.services.query_cache import QueryCache, Circle
+from app.services.geo import BoundingBox, Point
+from app.services.deadline import remaining_timeout
+from app.services.transform_fountains import PROJECTED_ELEMENT_TYPE, PROJECTION_TAGS
+from app.services.filters import filtered_query_template
+from app.models.filter import FountainFilter
 from app.errors import RequestTimeoutError, OpenStreetMapError
 
 from app.config import logger
@@ -17,18 +29,40 @@ API_ENDPOINT = f'{API_URL}/api/interpreter'
 
 FOUNTAIN_QUERY_TEMPLATE_FILE = 'queries/fountains-query-template.overpassql'
 
+OUT_META = 'out meta center qt;'
+
+def out_projection(tags: Iterable[str]) -> str:
+    """
+    Convert the elements to keep only the given tags, with type, id, version, timestamp and center
+    """
+    projection = ', '.join(f'"{tag}"=t["{tag}"]' for tag in tags)
+
+    return (
+        f'convert {PROJECTED_ELEMENT_TYPE} ::id=id(), ::geom=center(geom()), '
+        f'"@type"=type(), "@version"=version(), "@timestamp"=timestamp(), {projection};'
+        '\nout geom qt;'
+    )
+
+OUT_PROJECTION = out_projection(PROJECTION_TAGS)
+
 class OpenStreetMapAPI:
     """
     API to request fountains in OpenStreetMap
     """
 
-    overpass_api: overpass.API
+    overpass_pool: OverpassEndpointPool
     """
-    Overpass API wrapper
+    Overpass API endpoints
     https://wiki.openstreetmap.org/wiki/Overpass_API
+    https://wiki.openstreetmap.org/wiki/Overpass_API#Public_Overpass_API_instances
     https://github.com/mvexel/overpass-api-python-wrapper
     """
 
+    query_cache: QueryCache | None
+    """
+    Cache of radius and bbox queries (None to always request Overpass)
+    """
+
     _geocoding_api: NominatimAPI | None = None
     """
     Geocoding API wrapper (lazy attribute)
@@ -39,8 +73,20 @@ class OpenStreetMapAPI:
     OverpassQL query template to look for fountains given different region parameters
     """
 
-    def __init__(self, timeout: int = 1800):
-        self.overpass_api = overpass.API(endpoint=API_ENDPOINT, timeout=timeout)
+    project_tags: bool
+    """
+    Whether queries without all tags only request the tags read by the transform (approximate name:*, alt_name:*
+    and description:* fallbacks), otherwise they are requested with out meta as the queries with all tags
+    """
+
+    def __init__(self, timeout: int = 1800, endpoints: List[str] | None = None, query_cache: QueryCache | None = None,
+                 project_tags: bool | None = None):
+        if endpoints is None:
+            endpoints = overpass_endpoints()
+
+        self.overpass_pool = OverpassEndpointPool(endpoints, timeout=timeout)
+        self.query_cache = query_cache
+        self.project_tags = overpass_project_tags() if project_tags is None else project_tags
 
         self.__load_query_templates()
     
@@ -57,78 +103,157 @@ class OpenStreetMapAPI:
     def __load_query_templates(self):
         self._fountains_query_template = _load_query_template(FOUNTAIN_QUERY_TEMPLATE_FILE)
 
-    def get_fountains(self, updated: datetime | None = None, timeout: int = 1200) -> dict:
+    def get_fountains(self, updated: datetime | None = None, timeout: int = 1200, all_tags: bool = True,
+                      filters: FountainFilter | None = None) -> dict:
         logger.info('fountains timeout=%s', timeout)
 
-        return self.__get_fountains_with_query(timeout, updated=updated)
+        return self.__get_fountains_with_query(timeout, Priority.BULK, updated=updated, all_tags=all_tags, filters=filters)
 
     def get_fountains_by_area(self,
                               area: str,
                               updated: datetime | None = None,
-                              timeout: int = 60) -> dict:
+                              timeout: int = 60,
+                              all_tags: bool = True,
+                              priority: Priority = Priority.BULK,
+                              filters: FountainFilter | None = None) -> dict:
         area_id = self.geocoding_api.find_area_id(area)
 
         logger.info('fountains_by_area %s %s', area, area_id)
 
-        return self.__get_fountains_with_query(timeout,
+        return self.__get_fountains_with_query(timeout, priority,
                                                search='area.searchArea',
                                                area_id=area_id,
-                                               updated=updated)
+                                               updated=updated,
+                                               all_tags=all_tags,
+                                               filters=filters)
 
     def get_fountains_by_radius(self,
                                 lat: float, long: float,
                                 radius: int,
                                 updated: datetime | None = None,
-                                timeout: int = 20) -> dict:
+                                timeout: int = 20,
+                                all_tags: bool = True,
+                                priority: Priority = Priority.INTERACTIVE,
+                                filters: FountainFilter | None = None) -> dict:
         logger.info('fountains_by_radius %(radius)s around %(lat)s,%(long)s', { 'radius': radius, 'lat': lat, 'long': long })
 
-        return self.__get_fountains_with_query(timeout,
-                                               search=f'around:{radius},{lat},{long}',
-                                               updated=updated)
+        def fetch() -> dict:
+            return self.__get_fountains_with_query(timeout, priority,
+                                                   search=f'around:{radius},{lat},{long}',
+                                                   updated=updated,
+                                                   all_tags=all_tags,
+                                                   filters=filters)
+
+        return self.__get_cached(Circle(lat, long, radius), fetch, updated, timeout, all_tags, filters)
 
     def get_fountains_by_bbox(self,
                               south_lat: float, west_long: float, north_lat: float, east_long: float,
                               updated: datetime | None = None,
-                              timeout: int = 30) -> dict:
+                              timeout: int = 30,
+                              all_tags: bool = True,
+                              priority: Priority = Priority.INTERACTIVE,
+                              filters: FountainFilter | None = None) -> dict:
         bbox = f'{south_lat},{west_long},{north_lat},{east_long}'
 
         logger.info('fountains_by_bbox %s', bbox)
 
-        return self.__get_fountains_with_query(timeout, bbox, updated=updated)
+        def fetch() -> dict:
+            return self.__get_fountains_with_query(timeout, priority, bbox, updated=updated, all_tags=all_tags, filters=filters)
+
+        return self.__get_cached((south_lat, west_long, north_lat, east_long), fetch, updated, timeout, all_tags, filters)
+
+    def get_fountains_along(self,
+                            line: List[Point],
+                            radius: int,
+                            updated: datetime | None = None,
+                            timeout: int = 60,
+                            all_tags: bool = True,
+                            priority: Priority = Priority.INTERACTIVE) -> dict:
+        """
+        Fountains within radius meters of a line, with a single around query over the points of the line
+        """
+        logger.info('fountains_along %d points within %s', len(line), radius)
+
+        coordinates = ','.join(f'{lat},{long}' for lat, long in line)
+
+        return self.__get_fountains_with_query(timeout, priority, search=f'around:{radius},{coordinates}', updated=updated, all_tags=all_tags)
+
+    def get_fountains_batch(self,
+                            searches: List[str],
+                            updated: datetime | None = None,
+                            timeout: int = 30,
+                            all_tags: bool = True) -> dict:
+        """
+        Fountains matching any of the search filters (e.g. around or bbox filters), in a single union query
+        """
+        logger.info('fountains_batch %d queries', len(searches))
+
+        return self.__get_fountains_with_query(timeout, Priority.INTERACTIVE, searches=searches, updated=updated, all_tags=all_tags)
+
+    def __get_cached(self, region: Circle | BoundingBox, fetch: Callable[[], dict],
+                     updated: datetime | None, timeout: int, all_tags: bool, filters: FountainFilter | None = None) -> dict:
+        if self.query_cache is None or filters is not None: # filtered results are not cached
+            return fetch()
+
+        def fetch_bboxes(bboxes: List[BoundingBox]) -> dict:
+            return self.get_fountains_batch([','.join(map(str, bbox)) for bbox in bboxes],
+                                            updated=updated, timeout=timeout, all_tags=all_tags)
+
+        return self.query_cache.get(region, updated, all_tags, fetch, fetch_bboxes)
 
     def __get_fountains_with_query(self,
                                    timeout: int,
+                                   priority: Priority,
                                    bbox: str = '',
                                    search: str = '',
                                    area_id: int | None = None,
-                                   updated: datetime | None = None) -> dict: # json
+                                   updated: datetime | None = None,
+                                   all_tags: bool = True,
+                                   searches: List[str] | None = None,
+                                   filters: FountainFilter | None = None) -> dict: # json
         if bbox:
             bbox = f'[bbox:{bbox}]'
 
-        if search:
-            search = f'({search})'
+        searches = [f'({search})' if search else '' for search in (searches or [search])]
 
         if updated:
-            if bbox or search or (datetime.now(timezone.utc) - updated).days >= 7:
+            if bbox or any(searches) or (datetime.now(timezone.utc) - updated).days >= 7:
                 updated_filter = 'newer'
             else:
                 updated_filter = 'changed'
 
-            search += f'({updated_filter}:"{updated.isoformat()}")'
+            searches = [search + f'({updated_filter}:"{updated.isoformat()}")' for search in searches]
 
-        fountains_query = self._fountains_query_template.format(
-            timeout=str(timeout),
-            bbox=bbox,
-            search=search,
-            area_id=f'area(id:{area_id})->.searchArea;' if area_id else '',
-        )
+        query_template = self._fountains_query_template
 
-        logger.debug(fountains_query)
+        if filters is not None:
+            query_template = filtered_query_template(query_template, filters)
+
+        if len(searches) > 1:
+            query_template = _union_query_template(query_template, len(searches))
+
+        def build_query() -> str:
+            # built when dispatched to each endpoint, so Overpass stops the query when the request times out
+            fountains_query = query_template.format(
+                timeout=str(remaining_timeout(timeout)),
+                bbox=bbox,
+                search=searches[0],
+                **{ f'search{index}': search for index, search in enumerate(searches) },
+                area_id=f'area(id:{area_id})->.searchArea;' if area_id else '',
+                out=OUT_PROJECTION if self.project_tags and not all_tags else OUT_META,
+            )
+
+            logger.debug(fountains_query)
+
+            return fountains_query
+
+        def query() -> Any:
+            return self.overpass_pool.get(build_query, responseformat='json', build=False)
 
         try:
-            result = self.overpass_api.get(fountains_query, responseformat='json', build=False)
+            result = scheduler.run(self.overpass_pool, priority, query, timeout=remaining_timeout(timeout))
         except overpass.errors.TimeoutError as e:
-            raise RequestTimeoutError(f"Overpass request timed out after {self.overpass_api.timeout} seconds") from e
+            raise RequestTimeoutError(f"Overpass request timed out after {self.overpass_pool.timeout} seconds") from e
         except overpass.errors.ServerLoadError as e:
             server_load_error = (
                 "The Overpass server is currently under load and declined the request.\n"
@@ -136,12 +261,67 @@ class OpenStreetMapAPI:
             )
             raise RequestTimeoutError(server_load_error) from e
         except overpass.errors.MultipleRequestsError as e:
-            raise OpenStreetMapError("You are trying to run multiple requests at the same time") from e
+            raise OpenStreetMapError("Overpass rate limit exceeded: no slot available before the timeout") from e
         except (overpass.errors.ServerRuntimeError, overpass.errors.UnknownOverpassError) as e:
             raise OpenStreetMapError(e.message) from e
+        except requests.ConnectionError as e:
+            raise OpenStreetMapError(f"Overpass connection error: {repr(e)}") from e
 
         return result # type: ignore
 
+    def stats(self) -> Dict[str, Any]:
+        """
+        Overpass endpoints and scheduler metrics
+        """
+        return {
+            "endpoints": self.overpass_pool.stats(),
+            "scheduler": scheduler.stats(),
+            "cache": self.query_cache.stats() if self.query_cache else None,
+        }
+
+
+def overpass_endpoints() -> List[str]:
+    """
+    Overpass API endpoints from OVERPASS_ENDPOINTS environment variable (comma separated)
+    """
+    endpoints = getenv('OVERPASS_ENDPOINTS')
+
+    if not endpoints:
+        return [API_ENDPOINT]
+
+    return [endpoint.strip() for endpoint in endpoints.split(',') if endpoint.strip()]
+
+def overpass_project_tags() -> bool:
+    """
+    Projection of the tags read by the transform from OVERPASS_PROJECT_TAGS environment variable (true to enable)
+    """
+    return getenv('OVERPASS_PROJECT_TAGS', '').lower() == 'true'
+
+def query_cache() -> QueryCache | None:
+    """
+    Query cache from QUERY_CACHE_TTL (seconds, 0 to disable) and QUERY_CACHE_SIZE (queries) environment variables
+    """
+    ttl = float(getenv('QUERY_CACHE_TTL', '300'))
+
+    if ttl <= 0:
+        return None
+
+    return QueryCache(ttl=ttl, size=int(getenv('QUERY_CACHE_SIZE', '128')))
+
+def _union_query_template(query_template: str, count: int) -> str:
+    """
+    Repeat the statements with a {search} filter for each of count filters ({search0}, {search1}...),
+    so the union of the template matches any of them
+    """
+    lines = []
+
+    for line in query_template.splitlines():
+        if '{search}' in line:
+            lines.extend(line.replace('{search}', f'{{search{index}}}') for index in range(count))
+        else:
+            lines.append(line)
+
+    return '\n'.join(lines)
 
 def _load_query_template(query_template_file_path: str):
     def clean_query_template(query_template: str):
@@ -0,0 +1,261 @@
+"""
+Pool of Overpass API endpoints with latency-aware routing and failover
+"""
+
+from typing import Any, Callable, Dict, List
+
+from time import monotonic
+
+import re
+import threading
+import overpass
+import requests
+
+from app.services.deadline import check_deadline
+
+from app.config import APP_NAME, logger
+
+LATENCY_SMOOTHING = 0.3
+"""
+Weight of the latest request in the exponential moving average of latency and error rate
+"""
+
+STATUS_TTL = 30
+"""
+Seconds before the slots status of an endpoint is requested again
+"""
+
+FAILURE_COOLDOWN = 60
+"""
+Seconds an endpoint is deprioritized after a failed request
+"""
+
+FAILOVER_ERRORS = (
+    overpass.errors.TimeoutError,
+    overpass.errors.ServerLoadError,
+    overpass.errors.MultipleRequestsError,
+    requests.ConnectionError,
+)
+"""
+Errors caused by the endpoint rather than the query, so the query is retried in the next endpoint
+"""
+
+DEFAULT_RATE_LIMIT = 2
+"""
+Slots per IP of an endpoint until its status is known
+"""
+
+__RATE_LIMIT = re.compile(r'Rate limit: (\d+)')
+__SLOTS_AVAILABLE = re.compile(r'(\d+) slots? available now')
+__SLOT_AVAILABLE_IN = re.compile(r'Slot available after: \S+, in (-?\d+) seconds')
+
+def parse_available_slots(status: str) -> int:
+    """
+    Available slots from the /api/status response text
+    """
+    match = __SLOTS_AVAILABLE.search(status)
+    return int(match.group(1)) if match else 0
+
+def parse_rate_limit(status: str) -> int | None:
+    """
+    Total slots per IP from the /api/status response text (0 means no limit)
+    """
+    match = __RATE_LIMIT.search(status)
+    return int(match.group(1)) if match else None
+
+def parse_slot_wait(status: str) -> int | None:
+    """
+    Seconds until the next slot is available from the /api/status response text
+    """
+    waits = [max(int(seconds), 0) for seconds in __SLOT_AVAILABLE_IN.findall(status)]
+    return min(waits) if waits else None
+
+class OverpassEndpoint:
+    """
+    Overpass API instance and its request statistics
+    """
+
+    api: overpass.API
+
+    latency: float | None = None
+    """
+    Moving average of the request time in seconds
+    """
+
+    error_rate: float = 0
+    """
+    Moving average of failed requests (0 to 1)
+    """
+
+    available_slots: int | None = None
+    """
+    Available slots in the latest status check (None if unknown)
+    """
+
+    rate_limit: int = DEFAULT_RATE_LIMIT
+    """
+    Total slots per IP (0 means no limit)
+    """
+
+    slot_wait: int | None = None
+    """
+    Seconds until the next slot is available in the latest status check
+    """
+
+    request_count: int = 0
+    error_count: int = 0
+
+    _status_checked_at: float | None = None
+    _failed_at: float | None = None
+
+    def __init__(self, endpoint: str, timeout: int):
+        self.api = overpass.API(endpoint=endpoint, timeout=timeout, user_agent=APP_NAME)
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return self.api.endpoint
+
+    def check_status(self, ttl: float = STATUS_TTL, timeout: int = 5):
+        if self._status_checked_at is not None and monotonic() - self._status_checked_at < ttl:
+            return
+
+        self._status_checked_at = monotonic()
+
+        try:
+            response = requests.get(self.api.status_url, headers={ 'User-Agent': APP_NAME }, timeout=timeout)
+        except requests.RequestException:
+            self.available_slots = None
+            return
+
+        if response.ok:
+            rate_limit = parse_rate_limit(response.text)
+
+            if rate_limit is not None:
+                self.rate_limit = rate_limit
+
+            self.available_slots = parse_available_slots(response.text) if self.rate_limit else None
+            self.slot_wait = parse_slot_wait(response.text)
+        else:
+            self.available_slots = None
+
+    def score(self) -> float:
+        """
+        Expected cost of sending a query to this endpoint (lower is better)
+        """
+        score = (self.latency or 0) * (1 + 4 * self.error_rate)
+
+        if self.available_slots == 0:
+            score += STATUS_TTL
+
+        if self._failed_at is not None and monotonic() - self._failed_at < FAILURE_COOLDOWN:
+            score += FAILURE_COOLDOWN
+
+        return score
+
+    def record(self, elapsed: float, failed: bool):
+        with self._lock:
+            self.request_count += 1
+
+            if failed:
+                self.error_count += 1
+                self._failed_at = monotonic()
+            else:
+                self.latency = elapsed if self.latency is None else \
+                    LATENCY_SMOOTHING * elapsed + (1 - LATENCY_SMOOTHING) * self.latency
+
+            self.error_rate = LATENCY_SMOOTHING * failed + (1 - LATENCY_SMOOTHING) * self.error_rate
+
+            if self.available_slots is not None and failed:
+                self.available_slots = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "endpoint": self.url,
+            "latency": self.latency,
+            "error_rate": self.error_rate,
+            "available_slots": self.available_slots,
+            "rate_limit": self.rate_limit,
+            "requests": self.request_count,
+            "errors": self.error_count,
+        }
+
+class OverpassEndpointPool:
+    """
+    Sends each query to the best ranked endpoint and fails over to the next one on endpoint errors
+    """
+
+    endpoints: List[OverpassEndpoint]
+
+    def __init__(self, endpoints: List[str], timeout: int):
+        if not endpoints:
+            raise ValueError("At least one Overpass endpoint is required")
+
+        self.timeout = timeout
+        self.endpoints = [OverpassEndpoint(endpoint, timeout) for endpoint in endpoints]
+
+    def ranked(self) -> List[OverpassEndpoint]:
+        if len(self.endpoints) > 1:
+            for endpoint in self.endpoints:
+                endpoint.check_status()
+
+        return sorted(self.endpoints, key=OverpassEndpoint.score)
+
+    def capacity(self) -> int | None:
+        """
+        Total slots of all endpoints (None if any endpoint has no limit)
+        """
+        if any(endpoint.rate_limit == 0 for endpoint in self.endpoints):
+            return None
+
+        return sum(endpoint.rate_limit for endpoint in self.endpoints)
+
+    def slot_wait(self, ttl: float = 5) -> int:
+        """
+        Seconds until a slot is available in any endpoint (0 if available now or unknown)
+        """
+        waits = []
+
+        for endpoint in self.endpoints:
+            endpoint.check_status(ttl=ttl)
+
+            if endpoint.available_slots is None or endpoint.available_slots > 0:
+                return 0
+
+            waits.append(endpoint.slot_wait if endpoint.slot_wait is not None else 1)
+
+        return min(waits)
+
+    def get(self, query: str | Callable[[], str], **kwargs) -> Any:
+        """
+        Result of the query in the best ranked endpoint that responds.
+        A query builder is called again for each endpoint, so a failover gets the timeout remaining to the request
+        (e.g. [timeout:N] from remaining_timeout), and there is no failover after the request timed out or was cancelled.
+        """
+        last_error: Exception | None = None
+
+        for endpoint in self.ranked():
+            if last_error is not None:
+                check_deadline()
+
+            endpoint_query = query() if callable(query) else query
+            start = monotonic()
+
+            try:
+                result = endpoint.api.get(endpoint_query, **kwargs)
+            except FAILOVER_ERRORS as e:
+                endpoint.record(monotonic() - start, failed=True)
+                logger.warning('Overpass endpoint %s failed: %s', endpoint.url, repr(e))
+                last_error = e
+                continue
+
+            endpoint.record(monotonic() - start, failed=False)
+
+            logger.debug('Overpass endpoint %s responded in %.3f seconds', endpoint.url, endpoint.latency)
+
+            return result
+
+        raise last_error # type: ignore
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [endpoint.stats() for endpoint in self.endpoints]
@@ -0,0 +1,213 @@
+"""
+Process-wide scheduler of Overpass queries by priority and available slots
+"""
+
+from typing import Any, Callable, Dict, List, Tuple, TypeVar
+
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from enum import IntEnum
+from itertools import count
+from os import getenv
+from time import monotonic, sleep
+
+import heapq
+import threading
+import overpass
+
+from app.services.overpass_pool import OverpassEndpointPool
+from app.services.deadline import current_deadline, check_deadline
+from app.errors import RequestError, RequestTimeoutError
+
+from app.config import logger
+
+T = TypeVar('T')
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    """
+    Small queries a user is waiting for (radius, bbox)
+    """
+
+    BULK = 1
+    """
+    Large queries (area, world)
+    """
+
+    PREFETCH = 2
+    """
+    Background refreshes of the most requested queries
+    """
+
+class PriorityStats:
+    dispatched: int = 0
+    total_wait: float = 0
+    max_wait: float = 0
+
+    def record(self, wait: float):
+        self.dispatched += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def to_dict(self, queued: int) -> Dict[str, Any]:
+        return {
+            "queued": queued,
+            "dispatched": self.dispatched,
+            "avg_wait": self.total_wait / self.dispatched if self.dispatched else 0,
+            "max_wait": self.max_wait,
+        }
+
+class OverpassScheduler:
+    """
+    Queues Overpass queries by priority and dispatches them as slots become available.
+
+    Concurrency is limited to the slots of the endpoints pool, and the status of the endpoints
+    is checked before dispatching, because the slots are shared with other processes using the same IP.
+    Queries rejected with MultipleRequestsError (rate limited) are queued again until their timeout.
+    Some slots are reserved to interactive queries (OVERPASS_INTERACTIVE_SLOTS), so long bulk queries cannot take them all.
+
+    Queries of a request with a deadline are sent from a worker thread, so the request stops waiting as soon as
+    it is cancelled (client disconnected) or times out. The slot of an abandoned query is released right away,
+    so the queued queries do not wait for a response nobody reads, and the abandoned query is counted separately
+    until Overpass responds (the status of the endpoints still accounts for its Overpass slot).
+    """
+
+    def __init__(self, max_workers: int = 32):
+        self._condition = threading.Condition()
+        self._queue: List[Tuple[int, int]] = [] # heap of (priority, sequence)
+        self._sequence = count()
+        self._running = 0
+        self._abandoned_running = 0
+        self._stats = { priority: PriorityStats() for priority in Priority }
+        self.rate_limited = 0
+        self.abandoned = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='overpass')
+
+    def run(self, pool: OverpassEndpointPool, priority: Priority, query: Callable[[], T], timeout: float) -> T:
+        deadline = monotonic() + timeout
+        request_deadline = current_deadline()
+        ticket = (priority, next(self._sequence))
+        enqueued_at = monotonic()
+        dispatched = False
+
+        while True:
+            self._acquire(pool, ticket, deadline)
+
+            if not dispatched:
+                dispatched = True
+                wait = monotonic() - enqueued_at
+                self._stats[priority].record(wait)
+                logger.debug('overpass %s query dispatched after %.3f seconds', priority.name.lower(), wait)
+
+            future = self._executor.submit(copy_context().run, query) if request_deadline is not None else None
+
+            try:
+                return request_deadline.wait(future) if request_deadline is not None and future is not None else query()
+            except RequestError:
+                if future is not None and not future.done(): # request cancelled or timed out, abandon the query
+                    with self._condition:
+                        self.abandoned += 1
+                        self._abandoned_running += 1
+
+                    future.add_done_callback(lambda _: self._abandoned_done())
+
+                    logger.info('overpass %s query abandoned', priority.name.lower())
+                raise
+            except overpass.errors.MultipleRequestsError:
+                with self._condition:
+                    self.rate_limited += 1
+
+                if monotonic() >= deadline:
+                    raise
+
+                logger.info('overpass %s query rate limited, queued again', priority.name.lower())
+            finally:
+                self._release()
+
+    def _acquire(self, pool: OverpassEndpointPool, ticket: Tuple[int, int], deadline: float):
+        with self._condition:
+            heapq.heappush(self._queue, ticket)
+
+        try:
+            while True:
+                with self._condition:
+                    while not self._is_next(pool, ticket):
+                        self._condition.wait(timeout=min(_remaining(deadline), 1))
+
+                slot_wait = pool.slot_wait()
+
+                with self._condition:
+                    if slot_wait == 0 and self._is_next(pool, ticket):
+                        heapq.heappop(self._queue)
+                        self._running += 1
+                        return
+
+                sleep(min(slot_wait, _remaining(deadline), 5))
+        except BaseException:
+            with self._condition:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._condition.notify_all()
+            raise
+
+    def _is_next(self, pool: OverpassEndpointPool, ticket: Tuple[int, int]) -> bool:
+        if self._queue[0] != ticket:
+            return False
+
+        capacity = pool.capacity()
+
+        if capacity is None:
+            return True
+
+        if ticket[0] != Priority.INTERACTIVE:
+            capacity -= min(interactive_slots(), capacity - 1)
+
+        return self._running < capacity
+
+    def _release(self):
+        with self._condition:
+            self._running -= 1
+            self._condition.notify_all()
+
+    def _abandoned_done(self):
+        with self._condition:
+            self._abandoned_running -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            queued = { priority: 0 for priority in Priority }
+
+            for priority, _ in self._queue:
+                queued[Priority(priority)] += 1
+
+            return {
+                "running": self._running,
+                "abandoned_running": self._abandoned_running,
+                "interactive_slots": interactive_slots(),
+                "queued": len(self._queue),
+                "rate_limited": self.rate_limited,
+                "abandoned": self.abandoned,
+                **{ priority.name.lower(): self._stats[priority].to_dict(queued[priority]) for priority in Priority },
+            }
+
+def interactive_slots() -> int:
+    """
+    Overpass slots reserved to interactive queries, from OVERPASS_INTERACTIVE_SLOTS environment variable
+    (at least one slot is always left for the other queries)
+    """
+    return max(0, int(getenv('OVERPASS_INTERACTIVE_SLOTS', '1')))
+
+def _remaining(deadline: float) -> float:
+    check_deadline()
+
+    remaining = deadline - monotonic()
+
+    if remaining <= 0:
+        raise RequestTimeoutError("Timed out waiting for an available Overpass slot")
+
+    return remaining
+
+scheduler = OverpassScheduler()
+"""
+Process-wide Overpass scheduler
+"""
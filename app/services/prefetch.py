@@ -0,0 +1,318 @@
+"""
+Prefetching of the most requested queries, refreshed in the background and served stale while refreshing
+"""
+
+from typing import Any, Callable, Dict, List, Tuple
+
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from time import monotonic
+
+import json
+import os
+import os.path
+import threading
+
+from app.config import logger
+
+HOT_QUERIES_FILE = "logs/hot_queries.json"
+
+HALF_LIFE = 3600
+"""
+Seconds for the requests count of a query to halve, so the hot queries follow the recent traffic
+"""
+
+MAX_TRACKED = 1000
+"""
+Maximum queries tracked, the coldest are forgotten
+"""
+
+FORGET_SCORE = 0.05
+"""
+Score below which a tracked query is forgotten (about 4 half-lives after a single request)
+"""
+
+REFRESH_MARGIN = 0.8
+"""
+Fraction of the TTL after which a hot query is refreshed in the background, before it expires
+"""
+
+@dataclass(frozen=True)
+class HotQuery:
+    kind: str
+    """
+    area, radius or bbox
+    """
+
+    params: Tuple[Any, ...]
+    """
+    Query parameters (area name, center and radius, or bounding box)
+    """
+
+    all_tags: bool
+
+    def to_json(self) -> Dict[str, Any]:
+        return { "kind": self.kind, "params": list(self.params), "all_tags": self.all_tags }
+
+    @staticmethod
+    def from_json(data: Dict[str, Any]) -> 'HotQuery':
+        return HotQuery(data["kind"], tuple(data["params"]), data["all_tags"])
+
+@dataclass
+class HotQueryStats:
+    score: float = 0
+    scored_at: float = 0
+    timeout: int = 60
+
+    def hit(self, now: float):
+        self.score = self.current_score(now) + 1
+        self.scored_at = now
+
+    def current_score(self, now: float) -> float:
+        return self.score * 0.5 ** ((now - self.scored_at) / HALF_LIFE)
+
+@dataclass
+class PrefetchedResult:
+    osm_data: Dict[str, Any]
+    fetched_at: float
+
+class Prefetcher:
+    """
+    Tracks the most requested queries and keeps their results, refreshed in the background before they expire.
+
+    A result older than ttl is still served (stale) for up to stale_ttl more seconds while it is refreshed,
+    so the requests of hot queries do not wait for OpenStreetMap. A query is hot while its decayed requests count
+    is at least min_score, and at most max_areas of the hot queries are areas (bulk queries). The hot queries are saved
+    to a file and prefetched again on startup. Refreshes run in a pool of concurrency threads with the lowest priority,
+    so they do not compete with live requests.
+
+    Each worker process tracks and prefetches its own hot queries.
+    """
+
+    def __init__(self, fetch: Callable[[HotQuery, int], Dict[str, Any]],
+                 top: int = 10, ttl: float = 600, stale_ttl: float = 3600, concurrency: int = 1,
+                 interval: float = 30, hot_queries_file: str = HOT_QUERIES_FILE,
+                 min_score: float = 3, max_areas: int = 1):
+        self.fetch = fetch
+        self.top = top
+        self.min_score = min_score
+        self.max_areas = max_areas
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.interval = interval
+        self.hot_queries_file = hot_queries_file
+
+        self._queries: Dict[HotQuery, HotQueryStats] = {}
+        self._results: Dict[HotQuery, PrefetchedResult] = {}
+        self._refreshing: set[HotQuery] = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='prefetch')
+        self._stop = threading.Event()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def start(self):
+        """
+        Prefetch the saved hot queries and refresh the hot queries periodically
+        """
+        for query, score, timeout in self._load():
+            with self._lock:
+                self._queries.setdefault(query, HotQueryStats(score=score, scored_at=monotonic(), timeout=timeout))
+
+        threading.Thread(target=self._run, name='prefetch_scheduler', daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def get(self, query: HotQuery, timeout: int, fetch: Callable[[], Dict[str, Any]]) -> Tuple[Dict[str, Any], float | None]:
+        """
+        Result of the query, prefetched (fresh or stale while refreshing) or fetched now,
+        and the time it was prefetched (None if fetched now), which identifies the result until it is refreshed
+        """
+        now = monotonic()
+
+        with self._lock:
+            stats = self._queries.get(query)
+
+            if stats is None:
+                stats = self._queries[query] = HotQueryStats(timeout=timeout)
+                self._forget_coldest(now)
+
+            stats.hit(now)
+            stats.timeout = timeout
+
+            result = self._results.get(query)
+            age = now - result.fetched_at if result else None
+
+            if result is not None and age is not None and age < self.ttl:
+                self.hits += 1
+                return result.osm_data, result.fetched_at
+
+            if result is not None and age is not None and age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                stale = result
+            else:
+                self.misses += 1
+                stale = None
+
+        if stale is not None:
+            logger.debug('prefetch stale %s', query)
+            self._refresh(query)
+            return stale.osm_data, stale.fetched_at
+
+        osm_data = fetch()
+
+        if query in self._hot_queries() and not osm_data.get("remark"):
+            with self._lock:
+                self._results[query] = PrefetchedResult(osm_data, monotonic())
+
+        return osm_data, None
+
+    def _hot_queries(self) -> List[HotQuery]:
+        """
+        Most requested queries with at least min_score, and at most max_areas areas
+        """
+        now = monotonic()
+
+        with self._lock:
+            ranked = sorted(((query, stats.current_score(now)) for query, stats in self._queries.items()),
+                            key=lambda item: item[1], reverse=True)
+
+        hot_queries: List[HotQuery] = []
+        areas = 0
+
+        for query, score in ranked:
+            if score < self.min_score or len(hot_queries) == self.top:
+                break
+
+            if query.kind == 'area':
+                if areas == self.max_areas:
+                    continue
+
+                areas += 1
+
+            hot_queries.append(query)
+
+        return hot_queries
+
+    def _forget_coldest(self, now: float):
+        if len(self._queries) > MAX_TRACKED:
+            coldest = min(self._queries, key=lambda query: self._queries[query].current_score(now))
+            del self._queries[coldest]
+            self._results.pop(coldest, None)
+
+    def _forget_decayed(self, now: float):
+        for query in [query for query, stats in self._queries.items() if stats.current_score(now) < FORGET_SCORE]:
+            del self._queries[query]
+
+    def _refresh(self, query: HotQuery):
+        with self._lock:
+            if query in self._refreshing:
+                return
+
+            self._refreshing.add(query)
+            timeout = self._queries[query].timeout if query in self._queries else 60
+
+        try:
+            self._executor.submit(self._refresh_query, query, timeout)
+        except RuntimeError: # executor shut down
+            with self._lock:
+                self._refreshing.discard(query)
+
+    def _refresh_query(self, query: HotQuery, timeout: int):
+        try:
+            osm_data = self.fetch(query, timeout)
+
+            if osm_data.get("remark"):
+                raise ValueError(osm_data["remark"])
+
+            with self._lock:
+                self._results[query] = PrefetchedResult(osm_data, monotonic())
+                self.refreshes += 1
+
+            logger.debug('prefetch refreshed %s', query)
+        except Exception as e: # pylint: disable=broad-exception-caught
+            with self._lock:
+                self.refresh_errors += 1
+
+            logger.warning('prefetch %s failed: %s', query, repr(e))
+        finally:
+            with self._lock:
+                self._refreshing.discard(query)
+
+    def _run(self):
+        while not self._stop.is_set():
+            hot_queries = self._hot_queries()
+            now = monotonic()
+
+            with self._lock:
+                self._forget_decayed(now)
+                hot = set(hot_queries)
+
+                for query in [query for query in self._results if query not in hot]:
+                    del self._results[query]
+
+                due = [query for query in hot_queries
+                       if query not in self._results or now - self._results[query].fetched_at >= REFRESH_MARGIN * self.ttl]
+
+            for query in due:
+                self._refresh(query)
+
+            self._save(hot_queries)
+
+            self._stop.wait(self.interval)
+
+    def _load(self) -> List[Tuple[HotQuery, float, int]]:
+        try:
+            with open(self.hot_queries_file, 'r', encoding='utf8') as hot_queries_file:
+                return [(HotQuery.from_json(data), data.get("score", self.min_score), data.get("timeout", 60))
+                        for data in json.load(hot_queries_file)][:self.top]
+        except FileNotFoundError:
+            return []
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning('invalid hot queries file %s: %s', self.hot_queries_file, repr(e))
+            return []
+
+    def _save(self, hot_queries: List[HotQuery]):
+        now = monotonic()
+
+        with self._lock:
+            data = [{ **query.to_json(), "score": round(self._queries[query].current_score(now), 2), "timeout": self._queries[query].timeout }
+                    for query in hot_queries if query in self._queries]
+
+        try:
+            os.makedirs(os.path.dirname(self.hot_queries_file) or '.', exist_ok=True)
+
+            tmp_file_path = f"{self.hot_queries_file}.{os.getpid()}.tmp"
+
+            with open(tmp_file_path, 'w', encoding='utf8') as tmp_file:
+                json.dump(data, tmp_file, indent=2)
+
+            os.replace(tmp_file_path, self.hot_queries_file)
+        except OSError as e:
+            logger.warning('hot queries not saved: %s', repr(e))
+
+    def stats(self) -> Dict[str, Any]:
+        hot_queries = self._hot_queries()
+        now = monotonic()
+
+        with self._lock:
+            return {
+                "tracked": len(self._queries),
+                "prefetched": len(self._results),
+                "refreshing": len(self._refreshing),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "refresh_errors": self.refresh_errors,
+                "hot": [
+                    { **query.to_json(), "score": round(self._queries[query].current_score(now), 2) }
+                    for query in hot_queries if query in self._queries
+                ],
+            }
@@ -0,0 +1,242 @@
+"""
+Cache of radius and bbox query results, reused for the queries within (or overlapping) a cached region
+"""
+
+from typing import Any, Callable, Dict, List, Tuple
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from itertools import count
+from time import monotonic
+
+import threading
+
+from app.services.geo import BoundingBox, distance, in_bbox, circle_bbox, \
+    bbox_contains, bbox_intersection, bbox_area, bbox_difference
+from app.services.transform_fountains import PROJECTED_ELEMENT_TYPE, unproject_element, element_position
+
+from app.errors import OpenStreetMapError
+
+from app.config import logger
+
+@dataclass(frozen=True)
+class Circle:
+    lat: float
+    long: float
+    radius: float
+    """
+    Radius in meters
+    """
+
+Region = BoundingBox | Circle
+
+def region_bbox(region: Region) -> BoundingBox:
+    if isinstance(region, Circle):
+        return circle_bbox(region.lat, region.long, region.radius)
+    return region
+
+def region_contains_point(region: Region, lat: float, long: float) -> bool:
+    if isinstance(region, Circle):
+        return distance(region.lat, region.long, lat, long) <= region.radius
+    return in_bbox(lat, long, region)
+
+def region_contains(outer: Region, inner: Region) -> bool:
+    if isinstance(outer, Circle):
+        if isinstance(inner, Circle):
+            return distance(outer.lat, outer.long, inner.lat, inner.long) + inner.radius <= outer.radius
+
+        south_lat, west_long, north_lat, east_long = inner
+
+        return all(region_contains_point(outer, lat, long)
+                   for lat, long in ((south_lat, west_long), (south_lat, east_long), (north_lat, west_long), (north_lat, east_long)))
+
+    return bbox_contains(outer, region_bbox(inner))
+
+def utc(timestamp: datetime | None) -> datetime | None:
+    """
+    Timestamp as an aware UTC datetime (naive timestamps are UTC), comparable with the element timestamps
+    """
+    if timestamp is None:
+        return None
+
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+
+    return timestamp.astimezone(timezone.utc)
+
+@dataclass
+class ElementPosition:
+    lat: float
+    long: float
+    timestamp: datetime
+    key: Tuple[str, int]
+    element: Dict[str, Any]
+
+def element_positions(osm_data: Dict[str, Any]) -> List[ElementPosition]:
+    positions = []
+
+    try:
+        for element in osm_data.get("elements", []):
+            unprojected = unproject_element(element) if element["type"] == PROJECTED_ELEMENT_TYPE else element
+            lat, long = element_position(unprojected)
+
+            positions.append(ElementPosition(lat, long, datetime.fromisoformat(unprojected["timestamp"]),
+                                             (unprojected["type"], unprojected["id"]), element))
+    except (KeyError, ValueError) as e:
+        raise OpenStreetMapError("Invalid OpenStreetMap response data") from e
+
+    return positions
+
+@dataclass
+class CachedQuery:
+    region: Region
+    updated: datetime | None
+    all_tags: bool
+    osm_data: Dict[str, Any]
+    positions: List[ElementPosition]
+    expires_at: float
+
+    def answers(self, updated: datetime | None, all_tags: bool) -> bool:
+        """
+        Whether the cached elements are a superset of the elements of a query with these filters
+        """
+        return (self.all_tags or not all_tags) and \
+            (self.updated is None or (updated is not None and self.updated <= updated))
+
+    def positions_within(self, region: Region, updated: datetime | None) -> List[ElementPosition]:
+        return [position for position in self.positions
+                if (updated is None or position.timestamp >= updated) and region_contains_point(region, position.lat, position.long)]
+
+class QueryCache:
+    """
+    Results of radius and bbox queries with their region, updated filter and tags.
+
+    A query within the region of a fresh cached result (with compatible filters) is answered filtering the cached
+    elements by position, without requesting Overpass. A query partially overlapping a cached bbox only requests
+    the uncovered part of its bounding box.
+
+    Elements are filtered by their center, while Overpass matches ways and relations by their geometry,
+    so a way crossing the edge of the region may be missing from a cached answer.
+    """
+
+    def __init__(self, ttl: float = 300, size: int = 128, min_overlap: float = 0.25):
+        self.ttl = ttl
+        self.size = size
+        self.min_overlap = min_overlap # fraction of the query bounding box covered by a cached bbox to request only the remainder
+        self._entries: OrderedDict[int, CachedQuery] = OrderedDict()
+        self._keys = count()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+
+    def get(self, region: Region, updated: datetime | None, all_tags: bool,
+            fetch: Callable[[], Dict[str, Any]],
+            fetch_bboxes: Callable[[List[BoundingBox]], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Query result from the cache, or fetched (entirely or only the uncovered remainder) and cached
+        """
+        updated = utc(updated)
+
+        entry, overlap = self._find(region, updated, all_tags)
+
+        if entry is not None and overlap is None:
+            with self._lock:
+                self.hits += 1
+
+            logger.debug('query cache hit %s', region)
+
+            return self._result(entry.osm_data, entry.positions_within(region, updated))
+
+        if entry is not None and overlap is not None:
+            remainder = bbox_difference(region_bbox(region), overlap)
+
+            logger.debug('query cache partial hit %s, fetching %d bboxes', region, len(remainder))
+
+            remainder_data = fetch_bboxes(remainder)
+
+            if remainder_data.get("remark"):
+                return remainder_data
+
+            with self._lock:
+                self.partial_hits += 1
+
+            positions = { position.key: position for position in entry.positions_within(overlap, updated) }
+
+            for position in element_positions(remainder_data):
+                positions.setdefault(position.key, position)
+
+            osm_data = self._result(remainder_data,
+                                    [position for position in positions.values() if region_contains_point(region, position.lat, position.long)])
+        else:
+            with self._lock:
+                self.misses += 1
+
+            osm_data = fetch()
+
+            if osm_data.get("remark"):
+                return osm_data
+
+        self._put(region, updated, all_tags, osm_data)
+
+        return osm_data
+
+    def _find(self, region: Region, updated: datetime | None, all_tags: bool) -> Tuple[CachedQuery | None, BoundingBox | None]:
+        """
+        Cached query containing the region (without overlap), or the cached bbox with the largest overlap
+        """
+        query_bbox = region_bbox(region)
+        min_overlap_area = self.min_overlap * bbox_area(query_bbox)
+
+        best: Tuple[CachedQuery | None, BoundingBox | None] = (None, None)
+        best_area = 0.0
+
+        with self._lock:
+            self._expire()
+
+            for key, entry in reversed(self._entries.items()):
+                if not entry.answers(updated, all_tags):
+                    continue
+
+                if region_contains(entry.region, region):
+                    self._entries.move_to_end(key)
+                    return entry, None
+
+                if isinstance(entry.region, Circle):
+                    continue
+
+                overlap = bbox_intersection(entry.region, query_bbox)
+
+                if overlap is not None and bbox_area(overlap) >= max(min_overlap_area, best_area):
+                    best, best_area = (entry, overlap), bbox_area(overlap)
+
+        return best
+
+    def _put(self, region: Region, updated: datetime | None, all_tags: bool, osm_data: Dict[str, Any]):
+        entry = CachedQuery(region, updated, all_tags, osm_data, element_positions(osm_data), monotonic() + self.ttl)
+
+        with self._lock:
+            self._entries[next(self._keys)] = entry
+
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def _expire(self):
+        now = monotonic()
+
+        for key in [key for key, entry in self._entries.items() if entry.expires_at <= now]:
+            del self._entries[key]
+
+    @staticmethod
+    def _result(osm_data: Dict[str, Any], positions: List[ElementPosition]) -> Dict[str, Any]:
+        return { **osm_data, "elements": [position.element for position in positions] }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "partial_hits": self.partial_hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,123 @@
+"""
+Fountains along a route: the corridor of a line within a buffer distance
+
+Candidates are requested with a single Overpass around query over the simplified line, and located exactly on the route
+with a grid of points sampled along it, so long routes are neither split into many queries nor compared with every segment.
+"""
+
+from typing import Iterable, List, Optional, Tuple
+
+import math
+
+from app.models.fountain import FountainOpenStreetMap
+from app.services.geo import Point, ProximityGrid, distance, segment_distance, simplify_line
+from app.services.transform_fountains import DEADLINE_CHECK_INTERVAL
+from app.services.deadline import check_deadline
+
+MIN_BUFFER = 1
+"""
+Minimum distance in meters from the route
+"""
+
+MAX_BUFFER = 5000
+"""
+Maximum distance in meters from the route
+"""
+
+MAX_SAMPLES = 100000
+"""
+Maximum points sampled along the route (sampled farther apart than the buffer on longer routes)
+"""
+
+MAX_AROUND_POINTS = 500
+"""
+Maximum points of the line of the around query (the line is simplified further for longer routes)
+"""
+
+class Route:
+    """
+    Line of a route with the distance from the start to each point, and a grid of points sampled every buffer meters
+    (or every length / MAX_SAMPLES meters on longer routes)
+    """
+
+    def __init__(self, points: List[Point], buffer: float):
+        self.points = points
+        self.buffer = buffer
+        self.distances = [0.0]
+        """
+        Distance in meters along the route to each point
+        """
+
+        for start, end in zip(points, points[1:]):
+            self.distances.append(self.distances[-1] + distance(*start, *end))
+
+        interval = max(buffer, self.length / MAX_SAMPLES)
+
+        # the nearest point of the route within the buffer is at most half a sample interval from a sample
+        self._grid = ProximityGrid(buffer + interval / 2)
+
+        for segment, (start, end) in enumerate(zip(points, points[1:])):
+            samples = max(1, math.ceil((self.distances[segment + 1] - self.distances[segment]) / interval))
+
+            for sample in range(samples + 1):
+                fraction = sample / samples
+                self._grid.add(start[0] + (end[0] - start[0]) * fraction, start[1] + (end[1] - start[1]) * fraction, segment)
+
+    @property
+    def length(self) -> float:
+        return self.distances[-1]
+
+    def around(self, max_points: int = MAX_AROUND_POINTS) -> Tuple[List[Point], float]:
+        """
+        Line and radius of an around query covering the corridor: the line simplified within a tolerance,
+        and the buffer widened by the deviation of the simplified line (simplified again with twice the tolerance
+        until it has at most max_points)
+        """
+        tolerance = self.buffer / 2
+        line = simplify_line(self.points, tolerance)
+        deviation = tolerance
+
+        while len(line) > max_points:
+            tolerance *= 2
+            line = simplify_line(line, tolerance)
+            deviation += tolerance
+
+        return line, math.ceil(self.buffer + deviation)
+
+    def locate(self, lat: float, long: float) -> Optional[Tuple[float, float]]:
+        """
+        Distance along the route to the nearest point of the route and distance to it, None if farther than the buffer
+        """
+        nearest: Optional[Tuple[float, float]] = None
+        nearest_distance = self.buffer
+
+        for segment in set(self._grid.neighbors(lat, long)):
+            start, end = self.points[segment], self.points[segment + 1]
+            point_distance, fraction = segment_distance(lat, long, start, end)
+
+            if point_distance <= nearest_distance:
+                along = self.distances[segment] + fraction * (self.distances[segment + 1] - self.distances[segment])
+
+                if nearest is None or point_distance < nearest_distance or along < nearest[0]:
+                    nearest, nearest_distance = (along, point_distance), point_distance
+
+        return nearest
+
+def along_route(route: Route, fountains: Iterable[FountainOpenStreetMap]) -> List[Tuple[FountainOpenStreetMap, float, float]]:
+    """
+    Fountains within the buffer of the route with their distance along it and to it, ordered by distance along the route
+    """
+    located = []
+
+    for index, fountain in enumerate(fountains):
+        if index % DEADLINE_CHECK_INTERVAL == 0:
+            check_deadline()
+
+        position = route.locate(fountain.lat, fountain.long)
+
+        if position is not None:
+            located.append((fountain, *position))
+
+    located.sort(key=lambda fountain_position: fountain_position[1])
+
+    return located
@@ -0,0 +1,267 @@
+"""
+Full-text search of the fountains of the current snapshot by name, description and address,
+with an inverted index of accent and case folded tokens (prefix matching)
+
+The index is updated incrementally in the background when a new snapshot is published: only the fountains created
+or updated (new version or update time) are tokenized again, and the deleted ones are removed.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from bisect import bisect_left, insort
+from time import perf_counter
+
+import re
+import threading
+import unicodedata
+
+from app.services.geo import BoundingBox, in_bbox
+from app.services.snapshot import FountainSnapshot, NONE_STRING
+
+from app.config import logger
+
+FIELDS = {
+    'name': 4,
+    'address': 2,
+    'description': 1,
+}
+"""
+Indexed fields and their weight, also the bit of the field in the postings
+"""
+
+EXACT_WEIGHT = 2
+"""
+Score multiplier of a whole token match over a prefix match
+"""
+
+_TOKEN = re.compile(r'\w+')
+
+def fold(text: str) -> str:
+    """
+    Text without accents and case folded (e.g. Canaletes for Canaletes, Çanalètes or CANALETES)
+    """
+    return ''.join(char for char in unicodedata.normalize('NFKD', text) if not unicodedata.combining(char)).casefold()
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(fold(text))
+
+MASK_SCORES = [max((weight for weight in FIELDS.values() if mask & weight), default=0) for mask in range(sum(FIELDS.values()) + 1)]
+"""
+Weight of the best field of each fields bitmask
+"""
+
+class SearchIndex:
+    """
+    Inverted index of the fountains with text (only a few have a name, description or address), by provider id
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[str, int]] = {}
+        """
+        Provider ids and fields bitmask of each token
+        """
+        self._vocabulary: List[str] = []
+        """
+        Sorted tokens, for prefix ranges
+        """
+        self._documents: Dict[str, Tuple[Tuple[int, int], Dict[str, int]]] = {}
+        """
+        Version and update time, and fields bitmask of each token, of each indexed fountain
+        """
+        self._rows: Dict[str, int] = {}
+        """
+        Row of each indexed fountain in the snapshot
+        """
+        self._snapshot: Optional[FountainSnapshot] = None
+        self._lock = threading.Lock()
+        """
+        Held by searches, and by updates only while applying the changes
+        """
+        self._update_lock = threading.Lock()
+        self.updates = 0
+        self.update_seconds = 0.0
+        self.updated_documents = 0
+        self.searches = 0
+
+    @property
+    def snapshot(self) -> Optional[FountainSnapshot]:
+        """
+        Indexed snapshot, None until the first update
+        """
+        return self._snapshot
+
+    def update(self, snapshot: FountainSnapshot):
+        """
+        Index the changes of a new snapshot (the first snapshot is fully indexed).
+        Searches keep using the previous index while the snapshot is scanned, and only wait while the changes are applied.
+        """
+        with self._update_lock:
+            if snapshot is self._snapshot:
+                return
+
+            start = perf_counter()
+            columns = snapshot.columns
+            field_columns = [(columns[field], weight) for field, weight in FIELDS.items()]
+            versions, updated_at = columns["version"], columns["updated_at"]
+
+            tokens_by_ref: Dict[int, List[str]] = {} # strings are deduplicated in the snapshot
+            rows: Dict[str, int] = {}
+            changed: List[Tuple[str, Tuple[int, int], Dict[str, int]]] = []
+
+            # _documents is only modified by updates, so it is read without the search lock
+            for index in range(snapshot.count):
+                refs = [(column[index], weight) for column, weight in field_columns]
+
+                if all(ref == NONE_STRING for ref, _ in refs):
+                    continue
+
+                provider_id = snapshot.provider_id(index)
+                rows[provider_id] = index
+
+                version = (versions[index], updated_at[index])
+                document = self._documents.get(provider_id)
+
+                if document is not None and document[0] == version:
+                    continue
+
+                tokens: Dict[str, int] = {}
+
+                for ref, weight in refs:
+                    if ref == NONE_STRING:
+                        continue
+
+                    ref_tokens = tokens_by_ref.get(ref)
+
+                    if ref_tokens is None:
+                        ref_tokens = tokens_by_ref[ref] = tokenize(snapshot.string(ref) or '')
+
+                    for token in ref_tokens:
+                        tokens[token] = tokens.get(token, 0) | weight
+
+                changed.append((provider_id, version, tokens))
+
+            deleted = [provider_id for provider_id in self._documents if provider_id not in rows]
+
+            with self._lock:
+                for provider_id, version, tokens in changed:
+                    document = self._documents.get(provider_id)
+
+                    if document is not None:
+                        self._remove(provider_id, document[1])
+
+                    self._add(provider_id, tokens)
+                    self._documents[provider_id] = (version, tokens)
+
+                for provider_id in deleted:
+                    self._remove(provider_id, self._documents.pop(provider_id)[1])
+
+                self._rows = rows
+                self._snapshot = snapshot
+
+                seconds = perf_counter() - start
+                self.updates += 1
+                self.update_seconds += seconds
+                self.updated_documents += len(changed) + len(deleted)
+
+            logger.info('search index updated in %.3f seconds: %d documents, %d changed, %d deleted',
+                        seconds, len(self._documents), len(changed), len(deleted))
+
+    def _add(self, provider_id: str, tokens: Dict[str, int]):
+        for token, mask in tokens.items():
+            posting = self._postings.get(token)
+
+            if posting is None:
+                posting = self._postings[token] = {}
+                insort(self._vocabulary, token)
+
+            posting[provider_id] = mask
+
+    def _remove(self, provider_id: str, tokens: Dict[str, int]):
+        for token in tokens:
+            posting = self._postings.get(token)
+
+            if posting is not None:
+                posting.pop(provider_id, None)
+
+                if not posting:
+                    del self._postings[token]
+                    del self._vocabulary[bisect_left(self._vocabulary, token)]
+
+    def _prefix_tokens(self, prefix: str) -> List[str]:
+        vocabulary = self._vocabulary
+        tokens = []
+
+        for position in range(bisect_left(vocabulary, prefix), len(vocabulary)):
+            if not vocabulary[position].startswith(prefix):
+                break
+
+            tokens.append(vocabulary[position])
+
+        return tokens
+
+    def search(self, query: str, bbox: Optional[BoundingBox] = None, limit: int = 20) -> Tuple[FountainSnapshot | None, List[int]]:
+        """
+        Rows of the indexed snapshot matching every token of the query (as a prefix of a token of any field),
+        optionally within a bounding box, by relevance: name over address over description, whole tokens over prefixes
+        """
+        query_tokens = list(dict.fromkeys(tokenize(query)))
+
+        with self._lock:
+            snapshot, rows, postings = self._snapshot, self._rows, self._postings
+
+            if snapshot is None or not query_tokens:
+                return snapshot, []
+
+            self.searches += 1
+
+            matches = [(query_token, self._prefix_tokens(query_token)) for query_token in query_tokens]
+
+            # most selective query tokens first, so the candidates are filtered early
+            matches.sort(key=lambda match: sum(len(postings[token]) for token in match[1]))
+
+            scores: Optional[Dict[str, int]] = None
+
+            mask_scores = MASK_SCORES
+
+            for query_token, tokens in matches:
+                token_scores: Dict[str, int] = {}
+
+                for token in tokens:
+                    multiplier = EXACT_WEIGHT if token == query_token else 1
+
+                    for provider_id, mask in postings[token].items():
+                        if scores is not None and provider_id not in scores:
+                            continue
+
+                        score = mask_scores[mask] * multiplier
+
+                        if score > token_scores.get(provider_id, 0):
+                            token_scores[provider_id] = score
+
+                scores = token_scores if scores is None else { provider_id: scores[provider_id] + score for provider_id, score in token_scores.items() }
+
+                if not scores:
+                    return snapshot, []
+
+            assert scores is not None
+
+            results = [(score, provider_id, rows[provider_id]) for provider_id, score in scores.items()]
+
+        if bbox is not None:
+            lats, longs = snapshot.columns["lat"], snapshot.columns["long"]
+            results = [result for result in results if in_bbox(lats[result[2]], longs[result[2]], bbox)]
+
+        results.sort(key=lambda result: (-result[0], result[1]))
+
+        return snapshot, [row for _, _, row in results[:limit]]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "documents": len(self._documents),
+                "tokens": len(self._postings),
+                "updates": self.updates,
+                "updated_documents": self.updated_documents,
+                "avg_update_seconds": self.update_seconds / self.updates if self.updates else 0,
+                "searches": self.searches,
+            }
@@ -0,0 +1,381 @@
+"""
+Compact binary snapshot of fountains, memory-mapped read-only so every worker shares the same page cache
+
+Layout (native little-endian):
+- Header: magic, format version, grid level, count, strings count, area string, created_at
+- Columns of count items each: coordinates, OSM id, version and update time, string references (including the area
+  each fountain was fetched from), enum codes and flags
+- Grid: offset of the first row of each cell, in curve order, and the count
+- String table: offsets and UTF-8 data of the deduplicated strings (names, descriptions, addresses, urls)
+
+Rows are sorted along the Hilbert curve of the world, so the fountains of each grid cell (a square of the curve
+at the grid level) are consecutive rows, and the rows within a bounding box are found from the cells overlapping it.
+"""
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from array import array
+from datetime import datetime, timezone
+from enum import Enum
+from time import monotonic
+
+import mmap
+import os
+import os.path
+import struct
+import sys
+import threading
+
+from app.models.fountain import FountainOpenStreetMap, FountainType, SafeWater, LegalWater, Access
+from app.services.geo import BoundingBox, HILBERT_MAX, hilbert, hilbert_key, scaled
+
+from app.config import logger
+
+MAGIC = b'FOSM'
+FORMAT_VERSION = 3
+
+HEADER = struct.Struct('<4sHHIIIq4x') # magic, version, grid level, count, strings, area, created_at
+
+NONE_CODE = 0xFF
+NONE_STRING = 0xFFFFFFFF
+
+OSM_TYPES = ('node', 'way', 'relation')
+
+ENUM_COLUMNS: Dict[str, type[Enum]] = {
+    "type": FountainType,
+    "safe_water": SafeWater,
+    "legal_water": LegalWater,
+    "access": Access,
+}
+
+ENUM_VALUES: Dict[str, List[Enum]] = { column: list(enum) for column, enum in ENUM_COLUMNS.items() }
+"""
+Members of each enum column by code
+"""
+
+BOOL_COLUMNS = ('operational_status', 'access_bottles', 'access_pets', 'access_wheelchair', 'fee')
+
+STRING_COLUMNS = ('name', 'description', 'picture', 'address', 'website')
+
+COLUMNS: List[Tuple[str, str]] = [
+    ("lat", 'd'),
+    ("long", 'd'),
+    ("osm_id", 'q'),
+    ("updated_at", 'q'),
+    ("version", 'I'),
+    ("area", 'I'),
+    *((column, 'I') for column in STRING_COLUMNS),
+    ("osm_type", 'B'),
+    *((column, 'B') for column in ENUM_COLUMNS),
+    *((column, 'B') for column in BOOL_COLUMNS),
+]
+"""
+Columns and array typecodes, ordered by item size so every column is aligned
+"""
+
+WORLD: BoundingBox = (-90, -180, 90, 180)
+
+CURVE_BITS = HILBERT_MAX.bit_length()
+
+MAX_GRID_LEVEL = 8
+"""
+Maximum cells per side is 2^MAX_GRID_LEVEL (65536 cells, 256 KB of offsets)
+"""
+
+CELL_ROWS = 64
+"""
+Average rows per cell the grid level is chosen for
+"""
+
+def grid_level(count: int) -> int:
+    level = 0
+
+    while level < MAX_GRID_LEVEL and CELL_ROWS * 4 ** level < count:
+        level += 1
+
+    return level
+
+def _column_offsets(count: int, level: int) -> Tuple[Dict[str, int], int, int]:
+    """
+    Offsets of the columns, of the grid and of the string table
+    """
+    offsets = {}
+    offset = HEADER.size
+
+    for column, typecode in COLUMNS:
+        offsets[column] = offset
+        offset += array(typecode).itemsize * count
+
+    grid_offset = offset + (-offset % 4)
+    offset = grid_offset + 4 * (4 ** level + 1)
+
+    return offsets, grid_offset, offset + (-offset % 8)
+
+def _check_byteorder():
+    if sys.byteorder != 'little':
+        raise ValueError("Fountain snapshots are only supported on little-endian hosts")
+
+def write_snapshot(fountains: List[FountainOpenStreetMap], file_path: str,
+                   area: Optional[str] = None, created_at: Optional[datetime] = None,
+                   fountain_areas: Optional[Dict[str, Optional[str]]] = None):
+    """
+    Write the fountains snapshot to a temporary file and atomically replace file_path,
+    so readers can swap to the new snapshot at any time.
+
+    fountain_areas is the area each fountain was fetched from by provider id (None for the world, the default).
+    """
+    _check_byteorder()
+
+    strings: Dict[str, int] = {}
+
+    def string_ref(value: Optional[str]) -> int:
+        if value is None:
+            return NONE_STRING
+        return strings.setdefault(value, len(strings))
+
+    area_ref = string_ref(area)
+
+    level = grid_level(len(fountains))
+    cell_shift = 2 * (CURVE_BITS - level)
+
+    curve_keys = { fountain.provider_id: hilbert_key(fountain.lat, fountain.long, WORLD) for fountain in fountains }
+    fountains = sorted(fountains, key=lambda fountain: curve_keys[fountain.provider_id])
+
+    cell_offsets = array('I', [0] * (4 ** level + 1))
+
+    for fountain in fountains:
+        cell_offsets[(curve_keys[fountain.provider_id] >> cell_shift) + 1] += 1
+
+    for cell in range(4 ** level):
+        cell_offsets[cell + 1] += cell_offsets[cell]
+
+    columns = { column: array(typecode) for column, typecode in COLUMNS }
+    enum_codes = { column: { member: code for code, member in enumerate(enum) } for column, enum in ENUM_COLUMNS.items() }
+
+    for fountain in fountains:
+        osm_type, osm_id = fountain.provider_id.split(':', 1)
+
+        columns["lat"].append(fountain.lat)
+        columns["long"].append(fountain.long)
+        columns["osm_id"].append(int(osm_id))
+        columns["updated_at"].append(int(fountain.provider_updated_at.timestamp()))
+        columns["version"].append(fountain.osm_version or 0)
+        columns["area"].append(string_ref(fountain_areas.get(fountain.provider_id) if fountain_areas else None))
+        columns["osm_type"].append(OSM_TYPES.index(osm_type))
+
+        for column in STRING_COLUMNS:
+            columns[column].append(string_ref(getattr(fountain, column)))
+
+        for column, codes in enum_codes.items():
+            value = getattr(fountain, column)
+            columns[column].append(NONE_CODE if value is None else codes[value])
+
+        for column in BOOL_COLUMNS:
+            value = getattr(fountain, column)
+            columns[column].append(NONE_CODE if value is None else int(value))
+
+    encoded_strings = [string.encode('utf8') for string in strings]
+    string_offsets = array('I', [0])
+
+    for encoded_string in encoded_strings:
+        string_offsets.append(string_offsets[-1] + len(encoded_string))
+
+    created_at = created_at or datetime.now(timezone.utc)
+
+    _, grid_offset, strings_offset = _column_offsets(len(fountains), level)
+
+    tmp_file_path = f"{file_path}.{os.getpid()}.tmp"
+
+    with open(tmp_file_path, 'wb') as snapshot_file:
+        snapshot_file.write(HEADER.pack(MAGIC, FORMAT_VERSION, level, len(fountains), len(encoded_strings),
+                                        area_ref, int(created_at.timestamp())))
+
+        for column, _ in COLUMNS:
+            columns[column].tofile(snapshot_file)
+
+        snapshot_file.write(b'\0' * (grid_offset - snapshot_file.tell()))
+        cell_offsets.tofile(snapshot_file)
+
+        snapshot_file.write(b'\0' * (strings_offset - snapshot_file.tell()))
+        string_offsets.tofile(snapshot_file)
+        snapshot_file.write(b''.join(encoded_strings))
+
+    os.replace(tmp_file_path, file_path)
+
+    logger.info('snapshot %s written: %d fountains, %d strings', file_path, len(fountains), len(encoded_strings))
+
+class FountainSnapshot:
+    """
+    Read-only memory-mapped fountains snapshot
+    """
+
+    def __init__(self, file_path: str):
+        _check_byteorder()
+
+        self.file_path = file_path
+
+        with open(file_path, 'rb') as snapshot_file:
+            self._mmap = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.stat = os.stat(file_path)
+
+        data = memoryview(self._mmap)
+
+        magic, version, self.grid_level, self.count, strings_count, area_ref, created_at = HEADER.unpack_from(data)
+
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"Invalid fountains snapshot: {file_path}")
+
+        offsets, grid_offset, strings_offset = _column_offsets(self.count, self.grid_level)
+
+        self.columns: Dict[str, memoryview] = {
+            column: data[offsets[column]:offsets[column] + array(typecode).itemsize * self.count].cast(typecode)
+            for column, typecode in COLUMNS
+        }
+
+        self._cell_offsets = data[grid_offset:grid_offset + 4 * (4 ** self.grid_level + 1)].cast('I')
+        """
+        First row of each grid cell in curve order
+        """
+
+        self._string_offsets = data[strings_offset:strings_offset + 4 * (strings_count + 1)].cast('I')
+        self._strings = data[strings_offset + 4 * (strings_count + 1):]
+
+        self.area = self.string(area_ref)
+        self.created_at = datetime.fromtimestamp(created_at, timezone.utc)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def string(self, ref: int) -> Optional[str]:
+        if ref == NONE_STRING:
+            return None
+        return bytes(self._strings[self._string_offsets[ref]:self._string_offsets[ref + 1]]).decode('utf8')
+
+    def provider_id(self, index: int) -> str:
+        return f"{OSM_TYPES[self.columns['osm_type'][index]]}:{self.columns['osm_id'][index]}"
+
+    def fountain_area(self, index: int) -> Optional[str]:
+        """
+        Area the fountain was fetched from (None for the world)
+        """
+        return self.string(self.columns['area'][index])
+
+    def fountain(self, index: int) -> FountainOpenStreetMap:
+        columns = self.columns
+        osm_type = OSM_TYPES[columns["osm_type"][index]]
+        osm_id = columns["osm_id"][index]
+
+        values: Dict[str, Any] = {
+            "lat": columns["lat"][index],
+            "long": columns["long"][index],
+            "provider_id": f"{osm_type}:{osm_id}",
+            "provider_updated_at": datetime.fromtimestamp(columns["updated_at"][index], timezone.utc),
+            "provider_url": f"https://www.openstreetmap.org/{osm_type}/{osm_id}",
+            "osm_version": columns["version"][index],
+        }
+
+        for column in STRING_COLUMNS:
+            values[column] = self.string(columns[column][index])
+
+        for column, members in ENUM_VALUES.items():
+            code = columns[column][index]
+            values[column] = None if code == NONE_CODE else members[code]
+
+        for column in BOOL_COLUMNS:
+            code = columns[column][index]
+            values[column] = None if code == NONE_CODE else bool(code)
+
+        return FountainOpenStreetMap.model_construct(**values)
+
+    def fountains(self, indices: Optional[Iterator[int]] = None) -> Iterator[FountainOpenStreetMap]:
+        for index in (range(self.count) if indices is None else indices):
+            yield self.fountain(index)
+
+    def within_bbox(self, south_lat: float, west_long: float, north_lat: float, east_long: float) -> Iterator[int]:
+        """
+        Rows within the bounding box, descending the cells of the curve that overlap it: every row of the cells inside it,
+        and the rows of the grid cells on its border that are within it
+        """
+        if south_lat > north_lat or west_long > east_long:
+            return
+
+        x0, y0 = scaled(max(south_lat, -90), max(west_long, -180), WORLD)
+        x1, y1 = scaled(min(north_lat, 90), min(east_long, 180), WORLD)
+
+        cell_offsets = self._cell_offsets
+        level = self.grid_level
+        ranges: List[Tuple[int, int, bool]] = [] # start row, end row, whether the rows must be checked
+
+        def descend(cell_level: int, cell_x: int, cell_y: int):
+            shift = CURVE_BITS - cell_level
+            min_x, min_y = cell_x << shift, cell_y << shift
+            max_x, max_y = min_x + (1 << shift) - 1, min_y + (1 << shift) - 1
+
+            if max_x < x0 or min_x > x1 or max_y < y0 or min_y > y1:
+                return
+
+            # grid cells within this cell are consecutive along the curve
+            cell = hilbert(min_x, min_y) >> 2 * shift
+            cells_shift = 2 * (level - cell_level)
+            start, end = cell_offsets[cell << cells_shift], cell_offsets[(cell + 1) << cells_shift]
+
+            if start == end:
+                return
+
+            # scaled coordinates are truncated, so rows are only surely inside a cell strictly within the bbox
+            if x0 < min_x and max_x < x1 and y0 < min_y and max_y < y1:
+                ranges.append((start, end, False))
+            elif cell_level == level:
+                ranges.append((start, end, True))
+            else:
+                for child_x in (cell_x << 1, (cell_x << 1) + 1):
+                    for child_y in (cell_y << 1, (cell_y << 1) + 1):
+                        descend(cell_level + 1, child_x, child_y)
+
+        descend(0, 0, 0)
+
+        lats, longs = self.columns["lat"], self.columns["long"]
+
+        for start, end, check in sorted(ranges):
+            if not check:
+                yield from range(start, end)
+                continue
+
+            for index in range(start, end):
+                if south_lat <= lats[index] <= north_lat and west_long <= longs[index] <= east_long:
+                    yield index
+
+class SnapshotStore:
+    """
+    Current snapshot of a file path, swapped to the new snapshot when the file is replaced
+    """
+
+    def __init__(self, file_path: str, check_interval: float = 5):
+        self.file_path = file_path
+        self.check_interval = check_interval
+        self._snapshot: Optional[FountainSnapshot] = None
+        self._checked_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def current(self) -> Optional[FountainSnapshot]:
+        if self._checked_at is not None and monotonic() - self._checked_at < self.check_interval:
+            return self._snapshot
+
+        with self._lock:
+            self._checked_at = monotonic()
+
+            try:
+                stat = os.stat(self.file_path)
+            except FileNotFoundError:
+                self._snapshot = None
+                return None
+
+            snapshot = self._snapshot
+
+            if snapshot is None or (stat.st_ino, stat.st_mtime_ns) != (snapshot.stat.st_ino, snapshot.stat.st_mtime_ns):
+                # previous snapshot stays mapped while requests still reference it
+                self._snapshot = FountainSnapshot(self.file_path)
+                logger.info('snapshot %s loaded: %d fountains', self.file_path, len(self._snapshot))
+
+            return self._snapshot
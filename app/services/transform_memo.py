@@ -0,0 +1,130 @@
+"""
+Persistent memo of the fields derived from the tags of each element version, so unchanged elements are not transformed again
+"""
+
+from typing import Any, Dict, Optional, Tuple
+
+from enum import Enum
+
+import hashlib
+import marshal
+import os
+import os.path
+import threading
+
+from app.services import transform_fountains
+from app.services.transform_fountains import DERIVED_FIELDS
+from app.models.fountain import FountainType, SafeWater, LegalWater, Access
+
+from app.config import logger
+
+ENUM_FIELDS: Dict[str, type[Enum]] = {
+    "type": FountainType,
+    "safe_water": SafeWater,
+    "legal_water": LegalWater,
+    "access": Access,
+}
+
+MEMO_FORMAT = 2
+"""
+Format of the memo entries: 2 with the tags projection
+"""
+
+def rules_fingerprint() -> str:
+    """
+    Hash of the transform rules (source of the transform module and derived fields) and the entries format,
+    the memo is discarded when they change
+    """
+    with open(transform_fountains.__file__, 'rb') as transform_file:
+        source = transform_file.read()
+
+    return hashlib.sha1(source + repr((DERIVED_FIELDS, MEMO_FORMAT)).encode('utf8')).hexdigest()
+
+class TransformMemo:
+    """
+    Derived fields by element (type:id), with the version and the tags projection (only the tags read by the transform,
+    or all tags) they were derived from. Only the latest version of each element is kept.
+
+    Stored as a marshal file (fingerprint and entries) loaded in memory, written atomically by save().
+    """
+
+    def __init__(self, file_path: Optional[str] = None):
+        self.file_path = file_path
+        self.fingerprint = rules_fingerprint()
+        self._entries: Dict[str, Tuple[int, bool, Tuple[Any, ...]]] = {}
+        self._lock = threading.Lock()
+        self._changed = False
+        self.hits = 0
+        self.misses = 0
+
+        if file_path is not None:
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.file_path, 'rb') as memo_file: # type: ignore
+                fingerprint, entries = marshal.load(memo_file)
+        except FileNotFoundError:
+            return
+        except (EOFError, ValueError, TypeError) as e:
+            logger.warning('invalid transform memo %s: %s', self.file_path, repr(e))
+            return
+
+        if fingerprint != self.fingerprint:
+            logger.info('transform rules changed, memo %s discarded', self.file_path)
+            self._changed = True
+            return
+
+        self._entries = entries
+
+    def save(self):
+        if self.file_path is None or not self._changed:
+            return
+
+        os.makedirs(os.path.dirname(self.file_path) or '.', exist_ok=True)
+
+        tmp_file_path = f"{self.file_path}.{os.getpid()}.tmp"
+
+        with self._lock:
+            with open(tmp_file_path, 'wb') as memo_file:
+                marshal.dump((self.fingerprint, self._entries), memo_file)
+
+            self._changed = False
+
+        os.replace(tmp_file_path, self.file_path)
+
+    def get(self, element_type: str, element_id: int, version: int, projected: bool) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(f"{element_type}:{element_id}")
+
+        if entry is None or entry[0] != version or entry[1] != projected:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+
+        derived = dict(zip(DERIVED_FIELDS, entry[2]))
+
+        for field, enum in ENUM_FIELDS.items():
+            value = derived[field]
+
+            if value is not None:
+                derived[field] = enum(value)
+
+        return derived
+
+    def put(self, element_type: str, element_id: int, version: int, projected: bool, derived: Dict[str, Any]):
+        values = tuple(value.value if isinstance(value, Enum) else value for value in (derived[field] for field in DERIVED_FIELDS))
+
+        with self._lock:
+            self._entries[f"{element_type}:{element_id}"] = (version, projected, values)
+            self._changed = True
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0
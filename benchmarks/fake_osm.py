@@ -0,0 +1,253 @@
+"""
+Local stand-in of the Overpass and Nominatim APIs for load testing, with configurable latency, errors and result sizes
+
+Usage: python -m benchmarks.fake_osm [--port 8010] [--latency 0.2] [--elements 200] [--error-429 0.05]
+
+Point the API to the stand-in server with:
+OVERPASS_ENDPOINTS=http://127.0.0.1:8010/api/interpreter
+NOMINATIM_URL=http://127.0.0.1:8010
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import typer
+
+from rich.console import Console
+
+console = Console()
+
+AROUND = re.compile(r'around:(\d+(?:\.\d+)?),(-?\d+(?:\.\d+)?(?:,-?\d+(?:\.\d+)?)+)') # center or line
+BBOX = re.compile(r'\((-?\d+(?:\.\d+)?),(-?\d+(?:\.\d+)?),(-?\d+(?:\.\d+)?),(-?\d+(?:\.\d+)?)\)')
+GLOBAL_BBOX = re.compile(r'\[bbox:(-?\d+(?:\.\d+)?),(-?\d+(?:\.\d+)?),(-?\d+(?:\.\d+)?),(-?\d+(?:\.\d+)?)\]')
+AREA = re.compile(r'area\(id:(\d+)\)')
+
+AREA_CENTER = (41.391111, 2.180556)
+AREA_SPREAD = 0.5
+"""
+Degrees around AREA_CENTER of the fountains of any geocoded area
+"""
+
+TAGS = [
+    { "amenity": "drinking_water", "drinking_water": "yes", "bottle": "yes" },
+    { "amenity": "drinking_water", "name": "Font", "wheelchair": "yes", "dog": "yes", "addr:street": "Carrer Gran", "addr:city": "Barcelona" },
+    { "natural": "spring", "drinking_water": "no", "description": "Natural spring" },
+    { "man_made": "water_tap", "access": "customers", "fee": "no" },
+    { "amenity": "water_point", "operational_status": "broken", "website": "example.com/water" },
+]
+
+@dataclass
+class FakeOsmConfig:
+    latency: float = 0.2
+    jitter: float = 0.1
+    elements: int = 200
+    error_429: float = 0
+    error_504: float = 0
+    error_remark: float = 0
+    error_timeout: float = 0
+    timeout_delay: float = 30
+    slots: int = 2
+    fixture: Optional[Dict[str, Any]] = None
+
+def query_regions(query: str) -> List[Tuple[float, float, float, float]]:
+    """
+    Bounding boxes of the regions of a fountains query
+    """
+    regions = []
+
+    for radius, coordinates in AROUND.findall(query):
+        values = [float(coordinate) for coordinate in coordinates.split(',')]
+        lats, longs = values[0::2], values[1::2]
+        delta_lat = float(radius) / 111320
+        delta_long = delta_lat / max(math.cos(math.radians(max(map(abs, lats)))), 1e-6)
+        regions.append((min(lats) - delta_lat, min(longs) - delta_long, max(lats) + delta_lat, max(longs) + delta_long))
+
+    for bbox in (*BBOX.findall(query), *GLOBAL_BBOX.findall(query)):
+        regions.append(tuple(float(coordinate) for coordinate in bbox))
+
+    if not regions and AREA.search(query):
+        lat, long = AREA_CENTER
+        regions.append((lat - AREA_SPREAD, long - AREA_SPREAD, lat + AREA_SPREAD, long + AREA_SPREAD))
+
+    return regions or [(-60, -180, 75, 180)]
+
+def fake_elements(query: str, count: int) -> List[Dict[str, Any]]:
+    """
+    Deterministic fountains in the regions of the query, so repeated queries return the same elements
+    """
+    regions = list(dict.fromkeys(query_regions(query)))
+    projected = 'convert fountain' in query
+    elements = []
+
+    for region in regions:
+        seed = int(hashlib.sha1(repr(region).encode('utf8')).hexdigest()[:12], 16)
+        rng = random.Random(seed)
+        south_lat, west_long, north_lat, east_long = region
+
+        for index in range(max(1, count // len(regions))):
+            element_id = (seed + index) % 10**10
+            lat, long = rng.uniform(south_lat, north_lat), rng.uniform(west_long, east_long)
+            tags = TAGS[element_id % len(TAGS)]
+            version = 1 + element_id % 5
+            timestamp = "2024-01-01T00:00:00Z"
+
+            if projected:
+                elements.append({
+                    "type": "fountain", "id": element_id,
+                    "geometry": { "type": "Point", "coordinates": [long, lat] },
+                    "tags": { "@type": "node", "@version": str(version), "@timestamp": timestamp, **tags },
+                })
+            else:
+                elements.append({
+                    "type": "node", "id": element_id, "lat": lat, "lon": long,
+                    "timestamp": timestamp, "version": version, "tags": tags,
+                })
+
+    return elements
+
+def make_handler(config: FakeOsmConfig, stats: Dict[str, int], lock: threading.Lock) -> type[BaseHTTPRequestHandler]:
+    class FakeOsmHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+
+            if url.path.endswith("/status"):
+                self.respond(200, f"Rate limit: {config.slots}\n{config.slots} slots available now.\n".encode('utf8'), "text/plain")
+            elif url.path.startswith("/search"):
+                self.nominatim(parse_qs(url.query))
+            elif url.path.endswith("/interpreter"):
+                self.overpass(parse_qs(url.query).get("data", [""])[0])
+            else:
+                self.respond(404, b"Not found", "text/plain")
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode('utf8')
+            self.overpass(parse_qs(body).get("data", [""])[0])
+
+        def overpass(self, query: str):
+            self.count("overpass")
+            self.wait()
+
+            error = self.injected_error()
+
+            if error == "429":
+                self.respond(429, b"Too Many Requests", "text/plain")
+            elif error == "504":
+                self.respond(504, b"Gateway Timeout", "text/plain")
+            elif error == "timeout":
+                time.sleep(config.timeout_delay)
+                self.respond(504, b"Gateway Timeout", "text/plain")
+            elif error == "remark":
+                self.respond_json({ "elements": [], "remark": 'runtime error: Query timed out in "query" at line 3 after 25 seconds.' })
+            elif config.fixture is not None:
+                self.respond_json(config.fixture)
+            else:
+                self.respond_json({ "version": 0.6, "generator": "fake_osm", "elements": fake_elements(query, config.elements) })
+
+        def nominatim(self, params: Dict[str, List[str]]):
+            self.count("nominatim")
+            self.wait()
+
+            area = params.get("q", ["area"])[0]
+            lat, long = AREA_CENTER
+            osm_id = int(hashlib.sha1(area.lower().encode('utf8')).hexdigest()[:6], 16)
+
+            self.respond_json([{
+                "osm_type": "relation", "osm_id": osm_id, "display_name": area, "lat": str(lat), "lon": str(long),
+                "boundingbox": [str(lat - AREA_SPREAD), str(lat + AREA_SPREAD), str(long - AREA_SPREAD), str(long + AREA_SPREAD)],
+            }])
+
+        def injected_error(self) -> Optional[str]:
+            roll = random.random()
+
+            for error, rate in (("429", config.error_429), ("504", config.error_504),
+                                ("timeout", config.error_timeout), ("remark", config.error_remark)):
+                if roll < rate:
+                    self.count(error)
+                    return error
+
+                roll -= rate
+
+            return None
+
+        def wait(self):
+            time.sleep(max(0, config.latency + random.uniform(-config.jitter, config.jitter)))
+
+        def count(self, key: str):
+            with lock:
+                stats[key] = stats.get(key, 0) + 1
+
+        def respond_json(self, content: Any):
+            self.respond(200, json.dumps(content).encode('utf8'), "application/json")
+
+        def respond(self, status: int, body: bytes, content_type: str):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_):
+            pass
+
+    return FakeOsmHandler
+
+def serve(config: FakeOsmConfig, host: str = "127.0.0.1", port: int = 8010) -> Tuple[ThreadingHTTPServer, Dict[str, int]]:
+    """
+    Start the stand-in server in a background thread
+    """
+    stats: Dict[str, int] = {}
+    server = ThreadingHTTPServer((host, port), make_handler(config, stats, threading.Lock()))
+    server.daemon_threads = True
+
+    threading.Thread(target=server.serve_forever, name='fake_osm', daemon=True).start()
+
+    return server, stats
+
+def main(host: str = typer.Option("127.0.0.1", help="Host to listen"),
+         port: int = typer.Option(8010, help="Port to listen"),
+         latency: float = typer.Option(0.2, help="Response latency in seconds"),
+         jitter: float = typer.Option(0.1, help="Random variation of the latency in seconds"),
+         elements: int = typer.Option(200, help="Fountains of each Overpass response"),
+         fixture: Optional[str] = typer.Option(None, help="Overpass JSON response file to serve instead of synthetic fountains"),
+         error_429: float = typer.Option(0, help="Fraction of Overpass requests rejected as rate limited (429)"),
+         error_504: float = typer.Option(0, help="Fraction of Overpass requests rejected as server load (504)"),
+         error_remark: float = typer.Option(0, help="Fraction of Overpass responses with a runtime error remark"),
+         error_timeout: float = typer.Option(0, help="Fraction of Overpass requests that take --timeout-delay seconds"),
+         timeout_delay: float = typer.Option(30, help="Seconds of the timed out requests"),
+         slots: int = typer.Option(2, help="Rate limit slots reported by /api/status")):
+    fixture_data = None
+
+    if fixture:
+        with open(fixture, 'r', encoding='utf8') as fixture_file:
+            fixture_data = json.load(fixture_file)
+
+    config = FakeOsmConfig(latency=latency, jitter=jitter, elements=elements,
+                           error_429=error_429, error_504=error_504, error_remark=error_remark,
+                           error_timeout=error_timeout, timeout_delay=timeout_delay, slots=slots, fixture=fixture_data)
+
+    server, stats = serve(config, host, port)
+
+    console.print(f"Fake Overpass: http://{host}:{port}/api/interpreter")
+    console.print(f"Fake Nominatim: http://{host}:{port}")
+
+    try:
+        while True:
+            time.sleep(10)
+            console.print(stats, style="dim")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,179 @@
+"""
+Load driver of the API endpoints, reporting throughput and latency percentiles of each endpoint
+
+Usage: python -m benchmarks.load [--url http://127.0.0.1:8001] [--duration 30] [--concurrency 8] [--endpoint radius --endpoint bbox]
+
+Run the API against the local stand-in (python -m benchmarks.fake_osm) to load test without the public servers.
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from time import perf_counter
+
+import json
+import os.path
+import random
+import threading
+import requests
+import typer
+
+from rich.console import Console
+from rich.table import Table
+
+RESULTS_FILE = os.path.join("logs", "load_benchmark.json")
+
+CENTER = (41.391111, 2.180556)
+
+console = Console()
+
+Request = Tuple[str, str, Dict[str, Any], Optional[Dict[str, Any]]]
+"""
+Method, path, query params and JSON body
+"""
+
+def random_point(rng: random.Random, spread: float) -> Tuple[float, float]:
+    lat, long = CENTER
+    return round(lat + rng.uniform(-spread, spread), 5), round(long + rng.uniform(-spread, spread), 5)
+
+def radius_request(rng: random.Random, spread: float) -> Request:
+    lat, long = random_point(rng, spread)
+    return "GET", "/fountains/radius", { "lat": lat, "long": long, "radius": rng.choice([500, 1000, 2000]) }, None
+
+def bbox_request(rng: random.Random, spread: float) -> Request:
+    lat, long = random_point(rng, spread)
+    size = rng.choice([0.01, 0.02, 0.05])
+    return "GET", "/fountains/bbox", { "south_lat": lat, "west_long": long, "north_lat": lat + size, "east_long": long + size }, None
+
+def area_request(rng: random.Random, _: float) -> Request:
+    return "GET", "/fountains/", { "area": rng.choice(["Barcelona", "Madrid", "Valencia", "Sevilla"]) }, None
+
+def batch_request(rng: random.Random, spread: float) -> Request:
+    queries = []
+
+    for _ in range(rng.randint(5, 20)):
+        lat, long = random_point(rng, spread)
+        queries.append({ "type": "radius", "lat": lat, "long": long, "radius": 500 })
+
+    return "POST", "/fountains/batch", {}, { "queries": queries }
+
+def snapshot_request(rng: random.Random, spread: float) -> Request:
+    lat, long = random_point(rng, spread)
+    return "GET", "/fountains/snapshot", { "south_lat": lat, "west_long": long, "north_lat": lat + 0.05, "east_long": long + 0.05 }, None
+
+ENDPOINTS: Dict[str, Callable[[random.Random, float], Request]] = {
+    "radius": radius_request,
+    "bbox": bbox_request,
+    "area": area_request,
+    "batch": batch_request,
+    "snapshot": snapshot_request,
+}
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+def main(url: str = typer.Option("http://127.0.0.1:8001", help="API base URL"),
+         duration: float = typer.Option(30, help="Seconds to run"),
+         concurrency: int = typer.Option(8, help="Concurrent clients"),
+         endpoints: Optional[List[str]] = typer.Option(None, "--endpoint", help=f"Endpoints to request ({', '.join(ENDPOINTS)}), all by default"),
+         spread: float = typer.Option(0.05, help="Degrees around the center of the random queries (smaller repeats more queries)"),
+         timeout: float = typer.Option(60, help="Request timeout in seconds"),
+         seed: int = typer.Option(0, help="Random seed of the queries"),
+         save: bool = typer.Option(True, help=f"Append the results to {RESULTS_FILE}")):
+    endpoint_names = endpoints or list(ENDPOINTS)
+
+    for name in endpoint_names:
+        if name not in ENDPOINTS:
+            raise typer.BadParameter(f"Unknown endpoint {name}", param_hint="--endpoint")
+
+    latencies: Dict[str, List[float]] = { name: [] for name in endpoint_names }
+    errors: Dict[str, int] = { name: 0 for name in endpoint_names }
+    lock = threading.Lock()
+
+    start = perf_counter()
+    deadline = start + duration
+
+    def client(client_index: int):
+        rng = random.Random(seed + client_index)
+        session = requests.Session()
+
+        while perf_counter() < deadline:
+            name = rng.choice(endpoint_names)
+            method, path, params, body = ENDPOINTS[name](rng, spread)
+
+            request_start = perf_counter()
+
+            try:
+                response = session.request(method, url.rstrip('/') + path, params=params, json=body, timeout=timeout)
+                failed = not response.ok
+            except requests.RequestException:
+                failed = True
+
+            elapsed = perf_counter() - request_start
+
+            with lock:
+                latencies[name].append(elapsed)
+                errors[name] += failed
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='load_client') as executor:
+        for future in [executor.submit(client, index) for index in range(concurrency)]:
+            future.result()
+
+    elapsed = perf_counter() - start
+
+    table = Table(title=f"Load test: {concurrency} clients, {elapsed:.1f} seconds")
+
+    table.add_column("Endpoint", style="cyan")
+    table.add_column("Requests", justify="right")
+    table.add_column("Errors", justify="right", style="red")
+    table.add_column("Req/s", justify="right", style="bold green")
+    table.add_column("p50 (ms)", justify="right")
+    table.add_column("p90 (ms)", justify="right")
+    table.add_column("p99 (ms)", justify="right")
+    table.add_column("Max (ms)", justify="right")
+
+    results: Dict[str, Any] = {}
+
+    for name in endpoint_names:
+        values = sorted(latencies[name])
+
+        results[name] = {
+            "requests": len(values),
+            "errors": errors[name],
+            "throughput": len(values) / elapsed,
+            "p50": percentile(values, 0.5),
+            "p90": percentile(values, 0.9),
+            "p99": percentile(values, 0.99),
+            "max": values[-1] if values else 0,
+        }
+
+        result = results[name]
+
+        table.add_row(name, str(result["requests"]), str(result["errors"]), f"{result['throughput']:.1f}",
+                      *(f"{result[key] * 1000:.0f}" for key in ("p50", "p90", "p99", "max")))
+
+    console.print(table)
+
+    if save:
+        history = []
+
+        if os.path.exists(RESULTS_FILE):
+            with open(RESULTS_FILE, 'r', encoding='utf8') as results_file:
+                history = json.load(results_file)
+
+        history.append({
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "url": url, "concurrency": concurrency, "duration": elapsed, "spread": spread,
+            "results": results,
+        })
+
+        os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+
+        with open(RESULTS_FILE, 'w', encoding='utf8') as results_file:
+            json.dump(history, results_file, indent=4)
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,164 @@
+"""
+Local stand-in of a downstream endpoint receiving the fountains uploaded by fountains_cli.py (--post, --put),
+simulating the writes to a spatially indexed database
+
+Usage: python -m benchmarks.receiver [--port 8020] [--buffer-pages 256] [--miss-latency 0.0005]
+
+The index is a grid of pages (--page-degrees), cached in a LRU buffer pool (--buffer-pages).
+Each page not in the pool costs --miss-latency seconds (a random read of the page), and each fountain --row-latency seconds,
+so the batches covering a compact region are written faster than the scattered ones. Writes are serialized, as index page locks do.
+"""
+
+from typing import Any, Dict, List, Tuple
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import json
+import math
+import threading
+import time
+import typer
+
+from rich.console import Console
+
+console = Console()
+
+@dataclass
+class ReceiverConfig:
+    page_degrees: float = 0.25
+    buffer_pages: int = 256
+    miss_latency: float = 0.0005
+    row_latency: float = 0.00001
+
+class SpatialIndexStandIn:
+    """
+    Pages of the simulated index with a LRU buffer pool, and write statistics
+    """
+
+    def __init__(self, config: ReceiverConfig):
+        self.config = config
+        self._pool: OrderedDict[Tuple[int, int], None] = OrderedDict()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+        self.pages = 0
+        self.misses = 0
+        self.write_seconds = 0.0
+
+    def page(self, lat: float, long: float) -> Tuple[int, int]:
+        return math.floor((lat + 90) / self.config.page_degrees), math.floor((long + 180) / self.config.page_degrees)
+
+    def write(self, fountains: List[Dict[str, Any]]):
+        pages = { self.page(fountain['lat'], fountain['long']) for fountain in fountains }
+
+        with self._lock:
+            misses = 0
+
+            for page in pages:
+                if page in self._pool:
+                    self._pool.move_to_end(page)
+                else:
+                    misses += 1
+                    self._pool[page] = None
+
+                    if len(self._pool) > self.config.buffer_pages:
+                        self._pool.popitem(last=False)
+
+            seconds = misses * self.config.miss_latency + len(fountains) * self.config.row_latency
+            time.sleep(seconds)
+
+            self.batches += 1
+            self.rows += len(fountains)
+            self.pages += len(pages)
+            self.misses += misses
+            self.write_seconds += seconds
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "rows": self.rows,
+                "pages_per_batch": self.pages / self.batches if self.batches else 0,
+                "misses": self.misses,
+                "miss_rate": self.misses / self.pages if self.pages else 0,
+                "write_seconds": self.write_seconds,
+            }
+
+def make_handler(index: SpatialIndexStandIn) -> type[BaseHTTPRequestHandler]:
+    class ReceiverHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_OPTIONS(self):
+            self.send_response(204)
+            self.send_header("Allow", "OPTIONS, GET, POST, PUT")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def do_GET(self):
+            if self.path.startswith("/stats"):
+                self.respond(200, json.dumps(index.stats()).encode('utf8'))
+            else:
+                self.respond(404, b'{"error":"Not found"}')
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            try:
+                fountains = json.loads(body)
+            except ValueError:
+                self.respond(400, b'{"error":"Invalid JSON"}')
+                return
+
+            index.write(fountains)
+
+            self.respond(200, json.dumps({ "count": len(fountains) }).encode('utf8'))
+
+        do_PUT = do_POST
+
+        def respond(self, status: int, body: bytes):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_):
+            pass
+
+    return ReceiverHandler
+
+def serve(config: ReceiverConfig, host: str = "127.0.0.1", port: int = 8020) -> Tuple[ThreadingHTTPServer, SpatialIndexStandIn]:
+    """
+    Start the stand-in receiver in a background thread (port 0 for any free port)
+    """
+    index = SpatialIndexStandIn(config)
+    server = ThreadingHTTPServer((host, port), make_handler(index))
+    server.daemon_threads = True
+
+    threading.Thread(target=server.serve_forever, name='receiver', daemon=True).start()
+
+    return server, index
+
+def main(host: str = typer.Option("127.0.0.1", help="Host to listen"),
+         port: int = typer.Option(8020, help="Port to listen"),
+         page_degrees: float = typer.Option(0.25, help="Degrees of each index page (grid cell)"),
+         buffer_pages: int = typer.Option(256, help="Index pages cached in the buffer pool"),
+         miss_latency: float = typer.Option(0.0005, help="Seconds to read a page not in the buffer pool"),
+         row_latency: float = typer.Option(0.00001, help="Seconds to write each fountain")):
+    config = ReceiverConfig(page_degrees=page_degrees, buffer_pages=buffer_pages, miss_latency=miss_latency, row_latency=row_latency)
+
+    server, index = serve(config, host, port)
+
+    console.print(f"Receiver: http://{host}:{port}/fountains (--post or --put), statistics in http://{host}:{port}/stats")
+
+    try:
+        while True:
+            time.sleep(10)
+            console.print(index.stats(), style="dim")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,96 @@
+"""
+Startup time benchmark of the CLIs and the API
+
+Usage: python -m benchmarks.startup [--runs 5]
+"""
+
+from typing import Any, Dict, List, Tuple
+
+from datetime import datetime, timezone
+from statistics import median
+from time import perf_counter
+
+import json
+import os.path
+import subprocess
+import sys
+import typer
+
+from rich.console import Console
+from rich.table import Table
+
+RESULTS_FILE = os.path.join("logs", "startup_benchmark.json")
+
+COMMANDS: Dict[str, List[str]] = {
+    "fountains_cli.py --help": ["fountains_cli.py", "--help"],
+    "fountains_cli.py log": ["fountains_cli.py", "log"],
+    "providers_cli.py --help": ["providers_cli.py", "--help"],
+    "import app.main": ["-c", "import app.main"],
+}
+
+console = Console()
+
+def run_time(args: List[str]) -> float:
+    start = perf_counter()
+    subprocess.run([sys.executable, "-W", "ignore", *args], check=True, capture_output=True)
+    return perf_counter() - start
+
+def slowest_imports(args: List[str], limit: int = 3) -> List[Tuple[str, int]]:
+    """
+    Top-level imports with the highest cumulative time (microseconds), from python -X importtime
+    """
+    result = subprocess.run([sys.executable, "-W", "ignore", "-X", "importtime", *args], check=True, capture_output=True, text=True)
+
+    imports = []
+
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+
+        _, cumulative, module = line.split("|")
+
+        if module.startswith("   ") or not cumulative.strip().isdigit(): # nested import or header
+            continue
+
+        imports.append((module.strip(), int(cumulative)))
+
+    return sorted(imports, key=lambda item: item[1], reverse=True)[:limit]
+
+def main(runs: int = typer.Option(5, help="Runs of each command"),
+         save: bool = typer.Option(True, help=f"Append the results to {RESULTS_FILE}")):
+    table = Table(title="Startup time")
+
+    table.add_column("Command", style="cyan")
+    table.add_column("Median (s)", justify="right", style="bold green")
+    table.add_column("Min (s)", justify="right")
+    table.add_column("Slowest imports", style="dim")
+
+    results: Dict[str, Any] = {}
+
+    for name, args in COMMANDS.items():
+        times = [run_time(args) for _ in range(runs)]
+        imports = slowest_imports(args)
+
+        results[name] = { "median": median(times), "min": min(times) }
+
+        table.add_row(name, f"{median(times):.3f}", f"{min(times):.3f}",
+                      ", ".join(f"{module} ({cumulative / 1000:.0f} ms)" for module, cumulative in imports))
+
+    console.print(table)
+
+    if save:
+        history = []
+
+        if os.path.exists(RESULTS_FILE):
+            with open(RESULTS_FILE, 'r', encoding='utf8') as results_file:
+                history = json.load(results_file)
+
+        history.append({ "timestamp": datetime.now(timezone.utc).isoformat(), "results": results })
+
+        os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+
+        with open(RESULTS_FILE, 'w', encoding='utf8') as results_file:
+            json.dump(history, results_file, indent=4)
+
+if __name__ == "__main__":
+    typer.run(main)
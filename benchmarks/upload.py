@@ -0,0 +1,142 @@
+"""
+Upload benchmark of the batch orders of fountains_cli.py (--order), measuring the insert throughput of a local stand-in receiver
+(python -m benchmarks.receiver) that simulates the writes to a spatially indexed database
+
+Usage: python -m benchmarks.upload [--fountains 200000] [--batch-size 5000] [--order osm --order hilbert]
+       python -m benchmarks.upload --input logs/fountains-Spain-2024-06-15T00:00:00Z.json
+"""
+
+from typing import Any, Dict, List, Optional
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from time import perf_counter
+
+import json
+import os.path
+import random
+import requests
+import typer
+
+from rich.console import Console
+from rich.table import Table
+
+from cli.utils import BatchOrder, batches
+from app.services.geo import curve_sorted
+from benchmarks.receiver import ReceiverConfig, serve
+
+RESULTS_FILE = os.path.join("logs", "upload_benchmark.json")
+
+console = Console()
+
+def synthetic_fountains(count: int, cities: int, seed: int) -> List[Dict[str, Any]]:
+    """
+    Fountains clustered around random cities of the world, in random order (as merged or sharded results)
+    """
+    rng = random.Random(seed)
+    centers = [(rng.uniform(-55, 70), rng.uniform(-180, 180), rng.uniform(0.02, 0.3)) for _ in range(cities)]
+    fountains = []
+
+    for index in range(count):
+        lat, long, spread = rng.choice(centers)
+
+        fountains.append({
+            "provider_id": f"node:{index}",
+            "type": "drinking_water",
+            "lat": max(-90, min(90, rng.gauss(lat, spread))),
+            "long": max(-180, min(180, rng.gauss(long, spread))),
+        })
+
+    rng.shuffle(fountains)
+
+    return fountains
+
+def upload(url: str, fountains: List[Dict[str, Any]], order: BatchOrder, batch_size: int, threads: int, timeout: float) -> float:
+    """
+    Send the fountains in batches as fountains_cli.py does, returns the seconds elapsed (sorting included)
+    """
+    start = perf_counter()
+
+    if order != BatchOrder.OSM:
+        fountains = curve_sorted(fountains, lambda fountain: (fountain['lat'], fountain['long']), order.value)
+
+    session = requests.Session()
+
+    def send(batch: List[Dict[str, Any]]):
+        session.post(url, json=batch, timeout=timeout).raise_for_status()
+
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='upload') as executor:
+        for future in [executor.submit(send, batch) for _, _, batch in batches(fountains, batch_size)]:
+            future.result()
+
+    return perf_counter() - start
+
+def main(fountains_count: int = typer.Option(200000, "--fountains", help="Synthetic fountains to upload"),
+         cities: int = typer.Option(2000, help="Clusters of the synthetic fountains"),
+         input_file: Optional[str] = typer.Option(None, "--input", help="Fountains JSON file saved by fountains_cli.py, instead of synthetic fountains (in their order)"),
+         orders: Optional[List[BatchOrder]] = typer.Option(None, "--order", help="Orders to compare, all by default"),
+         batch_size: int = typer.Option(5000, help="Fountains per request"),
+         threads: int = typer.Option(10, help="Parallel requests"),
+         page_degrees: float = typer.Option(0.25, help="Degrees of each index page of the receiver"),
+         buffer_pages: int = typer.Option(256, help="Index pages cached in the buffer pool of the receiver"),
+         miss_latency: float = typer.Option(0.0005, help="Seconds to read a page not in the buffer pool of the receiver"),
+         timeout: float = typer.Option(300, help="Request timeout in seconds"),
+         seed: int = typer.Option(0, help="Random seed of the synthetic fountains"),
+         save: bool = typer.Option(True, help=f"Append the results to {RESULTS_FILE}")):
+    if input_file:
+        with open(input_file, 'r', encoding='utf8') as fountains_file:
+            fountains = json.load(fountains_file)
+    else:
+        fountains = synthetic_fountains(fountains_count, cities, seed)
+
+    config = ReceiverConfig(page_degrees=page_degrees, buffer_pages=buffer_pages, miss_latency=miss_latency)
+
+    table = Table(title=f"Upload: {len(fountains)} fountains, batches of {batch_size}, {threads} parallel requests")
+
+    table.add_column("Order", style="cyan")
+    table.add_column("Seconds", justify="right")
+    table.add_column("Fountains/s", justify="right", style="bold green")
+    table.add_column("Pages/batch", justify="right")
+    table.add_column("Page misses", justify="right")
+    table.add_column("Miss rate", justify="right")
+    table.add_column("Write seconds", justify="right")
+
+    results: Dict[str, Any] = {}
+
+    for order in orders or list(BatchOrder):
+        server, index = serve(config, port=0) # fresh index and buffer pool for each order
+
+        try:
+            elapsed = upload(f"http://127.0.0.1:{server.server_address[1]}/fountains", fountains, order, batch_size, threads, timeout)
+        finally:
+            server.shutdown()
+
+        stats = index.stats()
+        results[order.value] = { "seconds": elapsed, "throughput": len(fountains) / elapsed, **stats }
+
+        table.add_row(order.value, f"{elapsed:.2f}", f"{len(fountains) / elapsed:.0f}", f"{stats['pages_per_batch']:.0f}",
+                      str(stats['misses']), f"{stats['miss_rate']:.1%}", f"{stats['write_seconds']:.2f}")
+
+    console.print(table)
+
+    if save:
+        history = []
+
+        if os.path.exists(RESULTS_FILE):
+            with open(RESULTS_FILE, 'r', encoding='utf8') as results_file:
+                history = json.load(results_file)
+
+        history.append({
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "fountains": len(fountains), "input": input_file, "batch_size": batch_size, "threads": threads,
+            "page_degrees": page_degrees, "buffer_pages": buffer_pages, "miss_latency": miss_latency,
+            "results": results,
+        })
+
+        os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+
+        with open(RESULTS_FILE, 'w', encoding='utf8') as results_file:
+            json.dump(history, results_file, indent=4)
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,178 @@
+"""
+Run ledger of fountains_cli.py in SQLite, safe for concurrent CLI processes
+"""
+
+from typing import Any, Dict, List, Optional
+
+from datetime import datetime
+
+import json
+import os.path
+import sqlite3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    area TEXT,
+    area_key TEXT NOT NULL,
+    target TEXT NOT NULL,
+    since TEXT,
+    osm INTEGER NOT NULL,
+    timeout INTEGER NOT NULL,
+    post TEXT,
+    put TEXT,
+    count INTEGER NOT NULL,
+    request_time REAL NOT NULL,
+    transform_time REAL,
+    post_time REAL NOT NULL,
+    file TEXT,
+    snapshot TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_area_target ON runs (area_key, target, timestamp);
+CREATE INDEX IF NOT EXISTS runs_timestamp ON runs (timestamp);
+"""
+
+RUN_COLUMNS = ("timestamp", "area", "area_key", "target", "since", "osm", "timeout", "post", "put",
+               "count", "request_time", "transform_time", "post_time", "file", "snapshot")
+
+def area_key(area: Optional[str]) -> str:
+    """
+    Case insensitive area, empty for the world
+    """
+    return area.lower() if area else ''
+
+def target(post: Optional[str], put: Optional[str]) -> str:
+    """
+    Destination of the fountains data, empty when saved to a file
+    """
+    if post:
+        return f"POST {post}"
+    if put:
+        return f"PUT {put}"
+    return ''
+
+class RunLedger:
+    """
+    Each run is inserted in its own transaction (WAL journal), so parallel CLI processes
+    for different areas do not overwrite each other's runs.
+    """
+
+    def __init__(self, file_path: str, timeout: float = 30):
+        os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+
+        self.connection = sqlite3.connect(file_path, timeout=timeout, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self) -> 'RunLedger':
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def is_empty(self) -> bool:
+        return self.connection.execute("SELECT 1 FROM runs LIMIT 1").fetchone() is None
+
+    def record(self,
+               timestamp: datetime,
+               area: Optional[str],
+               since: Optional[datetime],
+               osm: bool, timeout: int,
+               post: Optional[str],
+               put: Optional[str],
+               count: int,
+               request_time: float,
+               transform_time: Optional[float],
+               post_time: float,
+               file: Optional[str] = None,
+               snapshot: Optional[str] = None):
+        run = {
+            "timestamp": timestamp.isoformat(),
+            "area": area,
+            "area_key": area_key(area),
+            "target": target(post, put),
+            "since": since.isoformat() if since else None,
+            "osm": osm,
+            "timeout": timeout,
+            "post": post,
+            "put": put,
+            "count": count,
+            "request_time": request_time,
+            "transform_time": transform_time,
+            "post_time": post_time,
+            "file": file,
+            "snapshot": snapshot,
+        }
+
+        self.connection.execute(
+            f"INSERT INTO runs ({', '.join(RUN_COLUMNS)}) VALUES ({', '.join(f':{column}' for column in RUN_COLUMNS)})",
+            run)
+
+    def latest_timestamp(self, area: Optional[str], post: Optional[str], put: Optional[str]) -> Optional[datetime]:
+        row = self.connection.execute(
+            "SELECT MAX(timestamp) FROM runs WHERE area_key = ? AND target = ?",
+            (area_key(area), target(post, put))).fetchone()
+
+        return datetime.fromisoformat(row[0]) if row[0] else None
+
+    def runs(self, area: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Latest runs, ordered by timestamp (ascending)
+        """
+        where, params = ("WHERE area_key = ?", [area_key(area)]) if area is not None else ("", [])
+
+        rows = self.connection.execute(
+            f"SELECT * FROM (SELECT * FROM runs {where} ORDER BY timestamp DESC LIMIT ?) ORDER BY timestamp",
+            (*params, limit)).fetchall()
+
+        return [dict(row) for row in rows]
+
+    def trends(self, area: Optional[str] = None, period: str = '%Y-%m-%d') -> List[Dict[str, Any]]:
+        """
+        Runs aggregated by area and period (strftime format of the timestamp, daily by default)
+        """
+        where, params = ("WHERE area_key = ?", [area_key(area)]) if area is not None else ("", [])
+
+        rows = self.connection.execute(f"""
+            SELECT area_key, MAX(area) AS area, strftime(?, timestamp) AS period, COUNT(*) AS runs,
+                   AVG(request_time) AS request_time, MAX(request_time) AS max_request_time,
+                   AVG(transform_time) AS transform_time, AVG(post_time) AS post_time, AVG(count) AS count
+            FROM runs {where}
+            GROUP BY area_key, period
+            ORDER BY area_key, period
+            """, (period, *params)).fetchall()
+
+        return [dict(row) for row in rows]
+
+    def import_json_log(self, log_file_path: str, encoding: str = 'utf8', if_empty: bool = False) -> int:
+        """
+        Import the runs of the previous JSON log file, only into an empty ledger if if_empty
+        (checked in the same transaction, so concurrent CLI processes import the runs once), returning the imported runs
+        """
+        with open(log_file_path, 'r', encoding=encoding) as log_file:
+            logs = json.load(log_file)
+
+        self.connection.execute("BEGIN IMMEDIATE")
+
+        try:
+            if if_empty and not self.is_empty():
+                self.connection.execute("ROLLBACK")
+                return 0
+
+            for log in logs:
+                since = log.get("since")
+                self.record(datetime.fromisoformat(log["timestamp"]), log.get("area"),
+                            datetime.fromisoformat(since) if since else None,
+                            log.get("osm", False), log.get("timeout", 0), log.get("post"), log.get("put"),
+                            log.get("count", 0), log.get("request_time", 0), None, log.get("post_time", 0))
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+
+        return len(logs)
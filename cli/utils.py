@@ -1,14 +1,21 @@
-from typing import Any, List, Dict, Tuple, Generator, Optional
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, List, Dict, Tuple, Generator, Optional
 
+from contextlib import contextmanager
 from datetime import datetime, timezone
+from enum import Enum
 
 from json.decoder import JSONDecodeError
+from itertools import islice
+from time import perf_counter
 
 import math
 import os.path
-import requests
+import threading
 import typer
 
+if TYPE_CHECKING:
+    import requests
+
 from rich.console import Console
 from rich.theme import Theme
 
@@ -32,7 +39,7 @@ def debug(message: Any, highlight: bool = False):
 def print_cancellable(message: str, style: Optional[str] = None):
     console.print(f"{message} [dim](Ctrl^C to cancel)[/dim]", style=style)
 
-def print_response(response: Optional[requests.Response]):
+def print_response(response: Optional['requests.Response']):
     if response is not None:
         try:
             response_body = response.json() if response.content else None
@@ -55,6 +62,8 @@ def debug_time(time_name: str, start_timestamp: datetime) -> Tuple[datetime, flo
     return current_timestamp, total_seconds_elapsed
 
 def check_url_method(url: str, method: str = 'POST'):
+    import requests # pylint: disable=import-outside-toplevel
+
     try:
         options = requests.options(url, timeout=10)
 
@@ -97,10 +106,63 @@ def format_size(size_bytes: float) -> str:
 def file_size(file_path: str) -> float:
     return os.path.getsize(file_path)
 
-def batches(l: List[Any], size: int) -> Generator[Tuple[int, int, List[Any]], None, None]:
-    """Yield successive chunks of a specific size for list l."""
-    len_l = len(l)
-    for i in range(0, len_l, size):
-        start_index = i
-        end_index = min(i + size, len_l)
-        yield start_index, end_index, l[start_index:end_index]
+class BatchOrder(str, Enum):
+    """Order of the fountains split in upload batches."""
+
+    OSM = 'osm'
+    """As returned by OpenStreetMap (batches are sent while transforming)"""
+
+    HILBERT = 'hilbert'
+    """Along the Hilbert curve, so each batch covers a compact region"""
+
+    ZORDER = 'zorder'
+    """Along the Z-order (Morton) curve"""
+
+def batches(l: Iterable[Any], size: int) -> Generator[Tuple[int, int, List[Any]], None, None]:
+    """Yield successive chunks of a specific size for iterable l (consumed lazily)."""
+    iterator = iter(l)
+    start_index = 0
+    while batch := list(islice(iterator, size)):
+        end_index = start_index + len(batch)
+        yield start_index, end_index, batch
+        start_index = end_index
+
+class TimedIterator:
+    """Iterator wrapper measuring the time spent producing its items."""
+
+    def __init__(self, iterable: Iterable[Any]):
+        self.iterator = iter(iterable)
+        self.seconds = 0.0
+
+    def __iter__(self) -> 'TimedIterator':
+        return self
+
+    def __next__(self) -> Any:
+        start = perf_counter()
+        try:
+            return next(self.iterator)
+        finally:
+            self.seconds += perf_counter() - start
+
+class BusyTimer:
+    """Time during which at least one task is running (overlapping tasks are counted once)."""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self._active = 0
+        self._since = 0.0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def busy(self) -> Iterator[None]:
+        with self._lock:
+            if self._active == 0:
+                self._since = perf_counter()
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active -= 1
+                if self._active == 0:
+                    self.seconds += perf_counter() - self._since
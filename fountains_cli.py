@@ -1,30 +1,36 @@
-from typing import Any, List, Dict, Callable, Optional
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, List, Dict, Callable, Optional
 
 from datetime import datetime
 
 from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+from dataclasses import dataclass, field
 
 import os.path
 import json
+import threading
 import typer
-import requests
 
-from rich.table import Table
+from cli.utils import console, err_console, error, debug, debug_time, print_cancellable, print_response, \
+      batches, now, check_url_method, file_size, format_size, parse_headers, TimedIterator, BusyTimer, BatchOrder
+from cli.ledger import RunLedger
 
-from cli.utils import console, error, debug, debug_time, print_cancellable, print_response, \
-      batches, now, check_url_method, file_size, format_size, parse_headers
+# Heavy dependencies (requests, overpass, geopy, pydantic models) are imported by the commands that use them,
+# so subcommands like log start fast
+if TYPE_CHECKING:
+    import requests
 
-from app.models.fountain import FountainOpenStreetMap
-from app.services.openstreetmap_api import OpenStreetMapAPI
-from app.services.transform_fountains import transform_fountains_osm
-from app.errors import RequestError
+    from app.models.fountain import FountainOpenStreetMap
 
 CLI_NAME = os.path.basename(__file__)
-LOG_FILE = os.path.join("logs", "fountains_cli.log")
+LEDGER_FILE = os.path.join("logs", "fountains_cli.sqlite3")
+LOG_FILE = os.path.join("logs", "fountains_cli.log") # previous JSON log, imported into the ledger
 LOG_FILE_ENCODING = "utf8"
+TRANSFORM_MEMO_FILE = os.path.join("logs", "transform_memo.bin")
 MAX_LOGS = 100
 REQUEST_MAX_THREADS = 10
 REQUEST_BATCH_SIZE = 5000
+REQUEST_MAX_PENDING = 2 * REQUEST_MAX_THREADS # batches transformed ahead of the uploads
 REQUEST_MAX_RETRIES = 3
 REQUEST_RETRY_TIME_OUT_STATUS = [504]
 
@@ -34,38 +40,52 @@ def fountains_filename(area: Optional[str], timestamp: datetime) -> str:
     timestamp_iso = timestamp.isoformat(timespec='seconds').replace('+00:00', 'Z')
     return os.path.join("logs", f"fountains-{area or 'World'}-{timestamp_iso}.json")
 
-def fountains_body(fountains: List[FountainOpenStreetMap]) -> List[Dict[str, Any]]:
+def fountains_body(fountains: List['FountainOpenStreetMap']) -> List[Dict[str, Any]]:
     return [fountain.model_dump(mode='json', exclude_none=True) for fountain in fountains]
 
-def save_fountains_to_file(fountains: List[FountainOpenStreetMap], filename: str):
+def save_fountains_to_file(fountains: List['FountainOpenStreetMap'], filename: str, label: str = ''):
     with open(filename, 'w', encoding=LOG_FILE_ENCODING) as f:
         json.dump(fountains_body(fountains), f, indent=4)
-    console.print("Saved to file: ", end='')
+    console.print(f"{label}Saved to file: ", end='')
     console.print(filename, style="file", highlight=False, end=' ')
     console.print(f"({format_size(file_size(filename))})", style="dim")
 
-def post_fountains_to_url(request_type: str, request_method: Callable[..., requests.Response],
-                          fountains: List[FountainOpenStreetMap], endpoint_url: str, timeout: int,
+def post_fountains_to_url(request_type: str, request_method: Callable[..., 'requests.Response'],
+                          fountains: Iterable['FountainOpenStreetMap'], endpoint_url: str, timeout: int,
                           batch_size: int = REQUEST_BATCH_SIZE, retries: int = REQUEST_MAX_RETRIES,
-                          headers: Optional[Dict[str, str]] = None):
+                          headers: Optional[Dict[str, str]] = None,
+                          executor: Optional[ThreadPoolExecutor] = None, label: str = '',
+                          max_pending: int = REQUEST_MAX_PENDING, timer: Optional[BusyTimer] = None):
+    """
+    Send the fountains in batches of parallel requests.
+    The requests run in the given executor (shared upload pipeline) or in a new one,
+    and the time any of them is in flight is measured by the timer.
+
+    The fountains are consumed lazily: each batch is sent as soon as it is transformed,
+    and at most max_pending batches are in flight, so transforming waits for slow uploads.
+    """
     request_headers = { 'Content-Type': 'application/json' }
 
     if headers:
         request_headers.update(headers)
 
-    console.print(request_type, end=' ')
+    console.print(f"{label}{request_type}", end=' ')
     console.print(endpoint_url, style="file", highlight=False)
 
-    def make_request(batch_range: str, json_body: Any) -> requests.Response:
+    def make_request(batch_range: str, json_body: Any) -> 'requests.Response':
         response = request_method(endpoint_url, json=json_body, headers=request_headers, timeout=timeout)
 
-        console.print(f"{request_type} {batch_range} ({response.status_code})")
+        console.print(f"{label}{request_type} {batch_range} ({response.status_code})")
 
         return response
 
-    def parallel_request(batch: List[FountainOpenStreetMap], start_index: int, end_index: int) -> requests.Response:
+    def parallel_request(batch: List['FountainOpenStreetMap'], start_index: int, end_index: int) -> 'requests.Response':
+        with timer.busy() if timer is not None else nullcontext():
+            return batch_request(batch, start_index, end_index)
+
+    def batch_request(batch: List['FountainOpenStreetMap'], start_index: int, end_index: int) -> 'requests.Response':
         batch_range = f"{start_index} .. {end_index}"
-        console.print(batch_range)
+        console.print(f"{label}{batch_range}")
 
         attempts = 1
         json_body = fountains_body(batch)
@@ -73,17 +93,22 @@ def post_fountains_to_url(request_type: str, request_method: Callable[..., reque
 
         while response.status_code in REQUEST_RETRY_TIME_OUT_STATUS and attempts < retries:
             attempts += 1
-            console.print(f"{batch_range} retry ({attempts})")
+            console.print(f"{label}{batch_range} retry ({attempts})")
             
             response = make_request(batch_range, json_body)
 
         return response
 
-    with ThreadPoolExecutor(max_workers=REQUEST_MAX_THREADS, thread_name_prefix='fountains_cli_request') as executor:
-        request_futures: List[Future[requests.Response]] = []
+    def post_batches(executor: ThreadPoolExecutor):
+        request_futures: List[Future['requests.Response']] = []
+        pending = threading.BoundedSemaphore(max_pending)
 
         for start_index, end_index, batch in batches(fountains, batch_size):
-            request_futures.append(executor.submit(parallel_request, batch, start_index, end_index))
+            pending.acquire() # pylint: disable=consider-using-with
+
+            request_future = executor.submit(parallel_request, batch, start_index, end_index)
+            request_future.add_done_callback(lambda _: pending.release())
+            request_futures.append(request_future)
 
         for request_future in as_completed(request_futures):
             response = request_future.result()
@@ -92,81 +117,143 @@ def post_fountains_to_url(request_type: str, request_method: Callable[..., reque
 
             response.raise_for_status()
 
-def load_logs() -> List[Dict[str, Any]]:
-    if os.path.exists(LOG_FILE):
-        with open(LOG_FILE, 'r', encoding=LOG_FILE_ENCODING) as log_file:
-            return json.load(log_file)
-    return []
-
-def log_request(logs: List[Dict[str, Any]],
-                timestamp: datetime,
-                area: Optional[str],
-                since: Optional[datetime],
-                osm: bool, timeout: int,
-                post: Optional[str],
-                put: Optional[str],
-                request_time: float,
-                post_time: float,
-                count: int):
-    log_entry = {
-        "timestamp": timestamp.isoformat(),
-        "since": since.isoformat() if since else None,
-        "area": area,
-        "osm": osm,
-        "timeout": timeout,
-        "post": post,
-        "put": put,
-        "request_time": request_time,
-        "post_time": post_time,
-        "count": count,
-    }
-
-    logs.append(log_entry)
-    logs = logs[-MAX_LOGS:]
-
-    with open(LOG_FILE, 'w', encoding=LOG_FILE_ENCODING) as log_file:
-        json.dump(logs, log_file, indent=4)
-
-def since_latest_log(logs: List[Dict[str, Any]], area: Optional[str],
-                     post: Optional[str], put: Optional[str]) -> Optional[datetime]:
-    parameter_area = area.lower() if area else None
-
-    for log in reversed(logs): # logs are ordered by timestamp (ascending)
-        log_area = log["area"].lower() if log.get("area") else None
-
-        if log_area == parameter_area and (log.get("post") == post and log.get("put") == put):
-            return datetime.fromisoformat(log["timestamp"]) # latest timestamp
-
-    return None
-
-def update_since(logs: List[Dict[str, Any]], since: Optional[datetime], area: Optional[str],
+    if executor is None:
+        with ThreadPoolExecutor(max_workers=REQUEST_MAX_THREADS, thread_name_prefix='fountains_cli_request') as executor:
+            post_batches(executor)
+    else:
+        post_batches(executor)
+
+def publish_snapshot(runs: List['AreaRun'], snapshot_file: str):
+    """
+    Merge the fountains of the runs into the previous snapshot. A full run replaces the fountains previously fetched
+    for its area (all of them for the world), so only those gone from the area are deleted. A run with --since only
+    adds and updates fountains.
+    """
+    # pylint: disable=import-outside-toplevel
+    from app.services.snapshot import FountainSnapshot, write_snapshot
+    from app.services.changes import ChangeLog, changes_file
+
+    previous_snapshot = FountainSnapshot(snapshot_file) if os.path.exists(snapshot_file) else None
+
+    snapshot_fountains: Dict[str, 'FountainOpenStreetMap'] = {}
+    fountain_areas: Dict[str, Optional[str]] = {}
+
+    replaced_areas = { run.area for run in runs if run.since is None }
+
+    if previous_snapshot is not None and None not in replaced_areas:
+        for index in range(len(previous_snapshot)):
+            area = previous_snapshot.fountain_area(index)
+
+            if area not in replaced_areas:
+                fountain = previous_snapshot.fountain(index)
+                snapshot_fountains[fountain.provider_id] = fountain
+                fountain_areas[fountain.provider_id] = area
+
+    for run in runs:
+        for fountain in run.fountains:
+            snapshot_fountains[fountain.provider_id] = fountain
+            fountain_areas[fountain.provider_id] = run.area
+
+    fountains = list(snapshot_fountains.values())
+    area = ', '.join(area or 'World' for area in dict.fromkeys(fountain_areas.values()))
+
+    os.makedirs(os.path.dirname(snapshot_file) or '.', exist_ok=True)
+
+    write_snapshot(fountains, snapshot_file, area=area, fountain_areas=fountain_areas)
+
+    console.print("Published snapshot: ", end='')
+    console.print(snapshot_file, style="file", highlight=False, end=' ')
+    console.print(f"({len(fountains)} fountains, {format_size(file_size(snapshot_file))})", style="dim")
+
+    with ChangeLog(changes_file(snapshot_file)) as change_log:
+        sequence, changes = change_log.record(previous_snapshot, FountainSnapshot(snapshot_file))
+
+    debug(f"Snapshot sequence {sequence}: {changes} changes")
+
+def open_ledger() -> RunLedger:
+    ledger = RunLedger(LEDGER_FILE)
+
+    if ledger.is_empty() and os.path.exists(LOG_FILE):
+        imported = ledger.import_json_log(LOG_FILE, encoding=LOG_FILE_ENCODING, if_empty=True)
+
+        if imported:
+            debug(f"Imported {imported} runs from {LOG_FILE}")
+
+    return ledger
+
+def update_since(ledger: RunLedger, since: Optional[datetime], area: Optional[str],
                  post: Optional[str], put: Optional[str]) -> Optional[datetime]:
     if since:
-        debug(f"Update: --since {since.isoformat()} (explicitly specified)")
+        debug(f"Update {area or 'World'}: --since {since.isoformat()} (explicitly specified)")
     else:
-        since = since_latest_log(logs, area, post, put)
+        since = ledger.latest_timestamp(area, post, put)
 
         if since:
-            debug(f"Update: --since {since.isoformat()}")
+            debug(f"Update {area or 'World'}: --since {since.isoformat()}")
         else:
-            debug("Update: No matching logs for area")
+            debug(f"Update {area or 'World'}: No matching logs for area")
     return since
 
+def format_time(seconds: Optional[float]) -> str:
+    return f"{seconds:.3f}" if seconds is not None else ''
+
 @app.command(name="log", help="Show the log of previous requests. Alias: --logs")
 @app.command(name="logs", hidden=True)
-def show_log():
+def show_log(
+    area: Optional[str] = typer.Option(None, help="Show only the runs of an area (empty for world)"),
+    limit: int = typer.Option(MAX_LOGS, help="Number of latest runs to show"),
+    trend: bool = typer.Option(False, "--trend", help="Show daily averages per area instead of each run"),
+):
     """
     Show the log of previous requests.
     """
+    from rich.table import Table # pylint: disable=import-outside-toplevel
+
     def empty_log():
         console.print(f"[bold]Log is empty[/bold]\nUsage: python {CLI_NAME} --help")
         raise typer.Exit()
 
-    if not os.path.exists(LOG_FILE):
+    if not os.path.exists(LEDGER_FILE) and not os.path.exists(LOG_FILE):
         empty_log()
 
-    with open(LOG_FILE, 'r', encoding=LOG_FILE_ENCODING) as log_file:
-        logs = json.load(log_file)
+    with open_ledger() as ledger:
+        if trend:
+            trends = ledger.trends(area)
+
+            if not trends:
+                empty_log()
+
+            max_request_time = max(row["request_time"] for row in trends) or 1
+
+            trends_table = Table()
+
+            trends_table.add_column("Area", justify="center", style="magenta")
+            trends_table.add_column("Day", justify="center", style="cyan", no_wrap=True)
+            trends_table.add_column("Runs", justify="center", style="blue")
+            trends_table.add_column("Fountains", justify="center", style="bold green")
+            trends_table.add_column("API Time (s)", justify="right", style="cyan")
+            trends_table.add_column("Max API Time (s)", justify="right", style="cyan")
+            trends_table.add_column("Transform Time (s)", justify="right", style="cyan")
+            trends_table.add_column("Post/Save Time (s)", justify="right", style="cyan")
+            trends_table.add_column("API Time", style="yellow", no_wrap=True)
+
+            for row in trends:
+                trends_table.add_row(
+                    row["area"] or 'World',
+                    row["period"],
+                    str(row["runs"]),
+                    f"{row["count"]:.0f}",
+                    format_time(row["request_time"]),
+                    format_time(row["max_request_time"]),
+                    format_time(row["transform_time"]),
+                    format_time(row["post_time"]),
+                    '█' * max(1, round(20 * row["request_time"] / max_request_time)),
+                )
+
+            console.print(trends_table)
+            return
+
+        logs = ledger.runs(area, limit=limit)
 
         if not logs:
             empty_log()
@@ -181,91 +268,274 @@ def show_log():
         logs_table.add_column("OSM", justify="center", style="yellow")
         logs_table.add_column("Post/Put", justify="center", style="green")
         logs_table.add_column("API Time (s)", justify="center", style="cyan")
+        logs_table.add_column("Transform Time (s)", justify="center", style="cyan")
         logs_table.add_column("Post/Save Time (s)", justify="center", style="cyan")
 
         for log in logs:
             logs_table.add_row(
-                log.get("timestamp"),
-                log.get("area", ''),
-                log.get("since", ''),
-                str(log.get("count")),
-                str(log.get("timeout")),
-                str(log.get("osm")),
-                log.get("post") or log.get("put"),
-                f"{log.get("request_time"):.3f}",
-                f"{log.get("post_time"):.3f}",
+                log["timestamp"],
+                log["area"] or '',
+                log["since"] or '',
+                str(log["count"]),
+                str(log["timeout"]),
+                str(bool(log["osm"])),
+                log["post"] or log["put"] or log["file"] or '',
+                format_time(log["request_time"]),
+                format_time(log["transform_time"]),
+                format_time(log["post_time"]),
             )
 
         console.print(logs_table)
 
+@dataclass
+class AreaRun:
+    """
+    Fetch, transform and upload of one area (None for the world)
+    """
+    area: Optional[str]
+    since: Optional[datetime]
+    timestamp: datetime
+    fountains: List['FountainOpenStreetMap'] = field(default_factory=list)
+    """
+    Transformed fountains, kept only when saved to a file or published in a snapshot
+    """
+    count: int = 0
+    request_time: float = 0
+    transform_time: float = 0
+    post_time: float = 0
+    """
+    Time any upload request (or the file save) was running
+    """
+    overlap_time: float = 0
+    """
+    Time transforming and uploading at once: transform + upload - wall time of both
+    """
+    method: str = 'Save'
+    filename: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        return self.area or 'World'
+
+    @property
+    def label(self) -> str:
+        return f"[{self.name}] "
+
+def read_areas_file(areas_file: str) -> List[str]:
+    """
+    Areas in a text file, one per line (empty lines and lines starting with # are ignored)
+    """
+    with open(areas_file, 'r', encoding='utf8') as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+def print_summary(runs: List[AreaRun]):
+    from rich.table import Table # pylint: disable=import-outside-toplevel
+
+    summary_table = Table(title="Summary")
+
+    summary_table.add_column("Area", justify="center", style="magenta")
+    summary_table.add_column("Updated --since", justify="center", style="bright_cyan")
+    summary_table.add_column("Fountains", justify="center", style="bold green")
+    summary_table.add_column("API Time (s)", justify="right", style="cyan")
+    summary_table.add_column("Transform Time (s)", justify="right", style="cyan")
+    summary_table.add_column("Post/Save Time (s)", justify="right", style="cyan")
+    summary_table.add_column("Overlap (s)", justify="right", style="cyan")
+    summary_table.add_column("Status", justify="center")
+
+    for run in runs:
+        summary_table.add_row(
+            run.name,
+            run.since.isoformat() if run.since else '',
+            str(run.count),
+            format_time(run.request_time),
+            format_time(run.transform_time),
+            format_time(run.post_time),
+            format_time(run.overlap_time),
+            f"[red]{run.error}[/red]" if run.error else "[green]OK[/green]",
+        )
+
+    console.print(summary_table)
+
 @app.callback(invoke_without_command=True)
 def fetch_fountains(
     context: typer.Context,
-    area: Optional[str] = typer.Option(None, help="Search in a geographical region (geocode area: country, city, state...). If not specified, all world data is retrieved."),
+    areas: Optional[List[str]] = typer.Option(None, "--area", help="Search in a geographical region (geocode area: country, city, state...). Repeat to fetch many areas concurrently. If not specified, all world data is retrieved."),
+    areas_file: Optional[str] = typer.Option(None, help="File with the areas to fetch, one per line"),
     since: Optional[datetime] = typer.Option(None, "--since", "--updated", help="Search only fountains updated since a specified datetime, in ISO 8601 format.", formats=["%d/%m/%Y", "%Y-%m-%d", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M:%S.%f", "%Y-%m-%dT%H:%M:%S%z", "%Y-%m-%dT%H:%M:%S.%f%z"]),
-    update: bool = typer.Option(False, "--update", help="Set --since automatically from the latest log of --area"),
+    update: bool = typer.Option(False, "--update", help="Set --since automatically from the latest log of each --area"),
     osm: bool = typer.Option(False, "--osm", help="Include OSM extra information (type, id, version, url, tags)"),
     timeout: int = typer.Option(1800, help="Timeout in seconds for the OSM API request (default 30 minutes)"),
+    concurrency: int = typer.Option(2, help="Maximum areas fetched from OpenStreetMap at the same time"),
     post: Optional[str] = typer.Option(None, help="URL to POST the fountains data"),
     put: Optional[str] = typer.Option(None, help="URL to PUT the fountains data"),
-    headers: Optional[List[str]] = typer.Option(None, "--header", help="Headers to include in the request")
+    headers: Optional[List[str]] = typer.Option(None, "--header", help="Headers to include in the request"),
+    snapshot: Optional[str] = typer.Option(None, help="Publish a binary snapshot file for the API (SNAPSHOT_FILE). Fountains are merged into the previous snapshot, replacing those previously fetched for the same area (only updated with --since)"),
+    memo: bool = typer.Option(True, help="Reuse the transform of unchanged elements (same version) from previous runs"),
+    dedup: Optional[float] = typer.Option(None, min=0, max=100, help="Merge near-duplicate fountains (e.g. a node and a way of the same fountain) within this distance in meters, keeping the merged provider ids in merged_ids"),
+    order: BatchOrder = typer.Option(BatchOrder.OSM, help="Order of the fountains sent with --post or --put: osm (as returned, sent while transforming), hilbert or zorder (sorted along the curve after the transform, so each batch covers a compact region)")
 ):
     """
     Fetch fountains data from OpenStreetMap and save to file or post to a url.
     """
     if context.invoked_subcommand is None: # main command (no subcommand)
+        # pylint: disable=import-outside-toplevel
+        import requests
+
+        from app.services.openstreetmap_api import OpenStreetMapAPI
+        from app.services.transform_fountains import iter_fountains_osm
+        from app.services.transform_memo import TransformMemo
+        from app.services.geo import curve_sorted
+        from app.services.dedup import merge_duplicates
+        from app.errors import RequestError
+
         check_url: str | None = post or put
 
         if check_url:
             check_url_method(check_url, 'POST' if post else 'PUT')
 
-        logs = load_logs()
+        area_names: List[Optional[str]] = [*(areas or []), *(read_areas_file(areas_file) if areas_file else [])]
 
-        if update:
-            since = update_since(logs, since, area, post, put)
+        if not area_names:
+            if not update:
+                typer.confirm("--area not specified. Do you want to retrieve all world fountains?", abort=True)
+            area_names = [None]
 
         timestamp = now()
 
-        try:
-            osm_api = OpenStreetMapAPI(timeout=timeout)
+        with open_ledger() as ledger:
+            runs = [AreaRun(area, update_since(ledger, since, area, post, put) if update else since, timestamp)
+                    for area in dict.fromkeys(area_names)] # unique areas in order
+
+        osm_api = OpenStreetMapAPI(timeout=timeout)
+        request_headers = parse_headers(headers)
+        transform_memo = TransformMemo(TRANSFORM_MEMO_FILE) if memo else None
+
+        def run_area(run: AreaRun, upload_executor: ThreadPoolExecutor) -> AreaRun:
+            start_timestamp = now()
+
+            try:
+                if run.area:
+                    print_cancellable(f"{run.label}Fetching fountains in {run.area}...")
+                    osm_data = osm_api.get_fountains_by_area(run.area, updated=run.since, timeout=timeout, all_tags=osm)
+                else:
+                    print_cancellable(f"{run.label}Fetching all fountains...")
+                    osm_data = osm_api.get_fountains(updated=run.since, timeout=timeout, all_tags=osm)
+
+                request_timestamp, run.request_time = debug_time(f"{run.label}OpenStreetMap API", start_timestamp)
+
+                transformed = TimedIterator(iter_fountains_osm(osm_data, osm, transform_memo))
+            except RequestError as e:
+                run.error = f"{e.detail} ({e.status_code})"
+                return run
+
+            def counted(fountains: Iterator['FountainOpenStreetMap']) -> Iterator['FountainOpenStreetMap']:
+                for fountain in fountains:
+                    run.count += 1
+
+                    if snapshot:
+                        run.fountains.append(fountain)
+
+                    yield fountain
+
+            def deduplicated(fountains: Iterator['FountainOpenStreetMap']) -> Iterator['FountainOpenStreetMap']:
+                if not dedup:
+                    return fountains
+
+                # merging needs every fountain, so the upload starts after the transform
+                kept, merged = merge_duplicates(fountains, dedup)
+                console.print(f"{run.label}Merged duplicates: {merged}")
+
+                return iter(kept)
+
+            def upload_order(fountains: Iterator['FountainOpenStreetMap']) -> Iterator['FountainOpenStreetMap']:
+                if order == BatchOrder.OSM:
+                    return fountains
+
+                # sorting needs every fountain, so the upload starts after the transform
+                return iter(curve_sorted(list(fountains), lambda fountain: (fountain.lat, fountain.long), order.value))
+
+            upload_timer = BusyTimer()
+
+            try:
+                # transform and upload are pipelined: batches are sent while the next ones are transformed
+                if post:
+                    run.method = 'POST'
+                    post_fountains_to_url(run.method, requests.post, upload_order(counted(deduplicated(transformed))), post, timeout,
+                                          headers=request_headers, executor=upload_executor, label=run.label, timer=upload_timer)
+                elif put:
+                    run.method = 'PUT'
+                    post_fountains_to_url(run.method, requests.put, upload_order(counted(deduplicated(transformed))), put, timeout,
+                                          headers=request_headers, executor=upload_executor, label=run.label, timer=upload_timer)
+                else:
+                    run.fountains = list(deduplicated(transformed))
+                    run.count = len(run.fountains)
+                    console.print(f"{run.label}Fountains found: {run.count}")
+                    run.filename = fountains_filename(run.area, run.timestamp)
+
+                    with upload_timer.busy():
+                        save_fountains_to_file(run.fountains, filename=run.filename, label=run.label)
+            except RequestError as e:
+                run.error = f"{e.detail} ({e.status_code})"
+                return run
+            except (IOError, requests.HTTPError) as e:
+                run.error = str(e)
+                return run
+
+            run.transform_time = transformed.seconds
+
+            if post or put:
+                console.print(f"{run.label}Fountains found: {run.count}")
+
+            debug(f"{run.label}Transform Time: {run.transform_time:.2g} seconds", highlight=True)
+
+            _, pipeline_time = debug_time(f"{run.label}Transform + {run.method}", request_timestamp)
+            run.post_time = upload_timer.seconds
+            run.overlap_time = max(0, run.transform_time + run.post_time - pipeline_time)
+
+            debug(f"{run.label}{run.method} Time: {run.post_time:.2g} seconds, overlapped with transform: {run.overlap_time:.2g} seconds",
+                  highlight=True)
+
+            return run
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix='fountains_cli_area') as area_executor, \
+             ThreadPoolExecutor(max_workers=REQUEST_MAX_THREADS, thread_name_prefix='fountains_cli_request') as upload_executor:
+            area_futures = [area_executor.submit(run_area, run, upload_executor) for run in runs]
+
+            with open_ledger() as ledger:
+                for area_future in as_completed(area_futures):
+                    run = area_future.result()
 
-            if area:
-                print_cancellable(f"Fetching fountains in {area}...")
-                osm_data = osm_api.get_fountains_by_area(area, updated=since, timeout=timeout)
-            else:
-                if not update:
-                    typer.confirm("--area not specified. Do you want to retrieve all world fountains?", abort=True)
-                print_cancellable("Fetching all fountains...")
-                osm_data = osm_api.get_fountains(updated=since, timeout=timeout)
+                    if run.error:
+                        console.print(f"{run.label}ERROR: {run.error}", style="bold red")
+                        continue
 
-            request_timestamp, request_time = debug_time("OpenStreetMap API", timestamp)
+                    ledger.record(run.timestamp, run.area, run.since, osm, timeout, post, put, run.count,
+                                  run.request_time, run.transform_time, run.post_time, file=run.filename, snapshot=snapshot)
 
-            fountains = transform_fountains_osm(osm_data, osm)
-        except RequestError as e:
-            error(f"{e.detail} ({e.status_code})")
+        succeeded = [run for run in runs if not run.error]
 
-        processed_at, _ = debug_time("Transform", request_timestamp)
+        if transform_memo is not None:
+            debug(f"Transform memo: {transform_memo.hit_rate:.1%} reused ({transform_memo.hits} of {transform_memo.hits + transform_memo.misses}), {len(transform_memo)} elements")
 
-        fountains_count = len(fountains)
+            try:
+                transform_memo.save()
+            except OSError as e:
+                err_console.print(f"Transform memo not saved: {e}")
 
-        console.print(f"Fountains found: {fountains_count}")
+        if snapshot and succeeded:
+            try:
+                publish_snapshot(succeeded, snapshot)
+            except (IOError, ValueError) as e:
+                error(f"Snapshot: {e}")
 
-        try:
-            if post:
-                method = 'POST'
-                post_fountains_to_url(method, requests.post, fountains, post, timeout, headers=parse_headers(headers))
-            elif put:
-                method = 'PUT'
-                post_fountains_to_url(method, requests.put, fountains, put, timeout, headers=parse_headers(headers))
-            else:
-                method = 'Save'
-                save_fountains_to_file(fountains, filename=fountains_filename(area, timestamp))
-        except (IOError, requests.HTTPError) as e:
-            error(str(e))
+        if len(runs) > 1:
+            print_summary(runs)
 
-        _, post_time = debug_time(method, processed_at)
+        failed = len(runs) - len(succeeded)
 
-        log_request(logs, timestamp, area, since, osm, timeout, post, put, request_time, post_time, fountains_count)
+        if failed:
+            error(runs[0].error if len(runs) == 1 else f"{failed} of {len(runs)} areas failed")
 
 if __name__ == "__main__":
     app()
@@ -1,17 +1,19 @@
 from typing import Optional, List, Dict
 
 import typer
-import requests
 
 from cli.utils import console, parse_headers, error, check_url_method, print_response
 
-from app.models.provider import Provider
-
 app = typer.Typer(context_settings={ "help_option_names": ["-h", "--help"] })
 
 def post_provider_to_url(endpoint_url: str,
                          name: str, url: Optional[str],
                          headers: Optional[Dict[str, str]], timeout: int = 120, verbose: bool = True):
+    # pylint: disable=import-outside-toplevel
+    import requests
+
+    from app.models.provider import Provider
+
     request_headers = { 'Content-Type': 'application/json' }
 
     if headers:
@@ -0,0 +1,57 @@
+"""
+Writes tests/fixtures/fountains.fgb with the reference FlatGeobuf implementation of GDAL (through pyogrio),
+from the fountains of tests/test_formats.py: python -m tests.fixtures.make_flatgeobuf_fixture
+
+The JSON columns are written as strings (pyogrio does not set the JSON subtype).
+"""
+
+import json
+import os.path
+import struct
+
+import numpy
+import pyogrio # type: ignore
+import pyogrio.raw # type: ignore
+
+from app.services.flatgeobuf import ColumnType
+from app.services.formats import FLATGEOBUF_COLUMNS, fountain_content
+from tests.test_formats import FOUNTAINS, METADATA
+
+FIXTURE_FILE = os.path.join(os.path.dirname(__file__), 'fountains.fgb')
+
+def main():
+    rows = [fountain_content(fountain) for fountain in FOUNTAINS]
+    geometry = numpy.array([struct.pack('<BIdd', 1, 1, row['long'], row['lat']) for row in rows], dtype=object) # WKB points
+
+    field_data = []
+    field_mask = []
+
+    for column in FLATGEOBUF_COLUMNS:
+        values = [row.get(column.name) for row in rows]
+
+        if column.type == ColumnType.BOOL:
+            field_data.append(numpy.array([bool(value) for value in values]))
+        elif column.type == ColumnType.DATETIME:
+            field_data.append(numpy.array([value.rstrip('Z') for value in values], dtype='datetime64[ms]'))
+        elif column.type == ColumnType.JSON:
+            field_data.append(numpy.array([None if value is None else json.dumps(value, ensure_ascii=False) for value in values],
+                                          dtype=object))
+        else:
+            field_data.append(numpy.array(values, dtype=object))
+
+        field_mask.append(numpy.array([value is None for value in values]))
+
+    if os.path.exists(FIXTURE_FILE):
+        os.remove(FIXTURE_FILE)
+
+    utc = numpy.full(len(rows), 100, dtype='int16') # GDAL TZFlag of UTC
+
+    pyogrio.raw.write(FIXTURE_FILE, geometry, field_data, [column.name for column in FLATGEOBUF_COLUMNS], field_mask=field_mask,
+                      layer='fountains', driver='FlatGeobuf', geometry_type='Point', crs='EPSG:4326',
+                      layer_options={ 'SPATIAL_INDEX': 'YES', 'DESCRIPTION': METADATA['query_url'] },
+                      layer_metadata=METADATA, gdal_tz_offsets={ 'provider_updated_at': utc })
+
+    print(f"{FIXTURE_FILE} written by GDAL {pyogrio.__gdal_version_string__}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+from typing import Any, AsyncIterator, Coroutine, List
+
+import asyncio
+import json
+import unittest
+
+from starlette.requests import Request
+
+from app.api.admission import admission, admission_pools
+from app.errors import TooManyRequestsError, request_error_handler
+from app.services.admission import WorkloadPool
+from app.services.overpass_scheduler import Priority
+
+def request(client: str = '10.0.0.1') -> Request:
+    return Request({ "type": "http", "method": "GET", "path": "/fountains/", "query_string": b"area=Barcelona",
+                     "headers": [], "server": ("localhost", 80), "client": (client, 1234), "scheme": "http", "root_path": "" })
+
+def run(coroutine: Coroutine[Any, Any, Any]) -> Any:
+    return asyncio.run(coroutine)
+
+class WorkloadPoolTest(unittest.TestCase):
+
+    def pool(self, concurrency: int = 1, queue_size: int = 1, queue_timeout: float = 1, client_concurrency: int = 8) -> WorkloadPool:
+        return WorkloadPool('test', concurrency=concurrency, queue_size=queue_size, queue_timeout=queue_timeout,
+                            client_concurrency=client_concurrency)
+
+    def test_concurrency_limit(self):
+        async def scenario() -> List[str]:
+            pool = self.pool(concurrency=2, queue_size=4)
+            events: List[str] = []
+
+            async def handle(name: str, seconds: float):
+                admitted_at = await pool.acquire(name)
+                events.append(f'start {name}')
+                await asyncio.sleep(seconds)
+                events.append(f'end {name}')
+                pool.release(name, admitted_at)
+
+            await asyncio.gather(handle('a', 0.05), handle('b', 0.2), handle('c', 0.05))
+
+            self.assertEqual(pool.stats()["active"], 0)
+            self.assertEqual(pool.stats()["admitted"], 3)
+
+            return events
+
+        events = run(scenario())
+
+        # the third request starts only when one of the first two ends
+        self.assertEqual(events, ['start a', 'start b', 'end a', 'start c', 'end c', 'end b'])
+
+    def test_queue_full(self):
+        async def scenario():
+            pool = self.pool(concurrency=1, queue_size=1)
+            admitted_at = await pool.acquire('a')
+            queued = asyncio.ensure_future(pool.acquire('b'))
+            await asyncio.sleep(0)
+
+            with self.assertRaises(TooManyRequestsError) as context:
+                await pool.acquire('c')
+
+            self.assertEqual(context.exception.status_code, 429)
+            self.assertEqual(pool.stats()["rejected_queue_full"], 1)
+
+            pool.release('a', admitted_at)
+            pool.release('b', await queued)
+
+        run(scenario())
+
+    def test_queue_timeout_with_retry_after(self):
+        async def scenario():
+            pool = self.pool(concurrency=1, queue_size=4, queue_timeout=0.05)
+            pool.completed, pool.total_service = 2, 6.0 # 3 seconds per request
+
+            admitted_at = await pool.acquire('a')
+
+            with self.assertRaises(TooManyRequestsError) as context:
+                await pool.acquire('b')
+
+            self.assertEqual(context.exception.headers, { "Retry-After": "3" })
+            self.assertEqual(pool.stats()["rejected_queue_timeout"], 1)
+            self.assertEqual(pool.stats()["queued"], 0)
+
+            # the slot is not lost to the timed out request
+            pool.release('a', admitted_at)
+            pool.release('c', await pool.acquire('c'))
+            self.assertEqual(pool.stats()["active"], 0)
+
+        run(scenario())
+
+    def test_client_quota(self):
+        async def scenario():
+            pool = self.pool(concurrency=1, queue_size=4, client_concurrency=2)
+            admitted_at = await pool.acquire('a')
+            queued = asyncio.ensure_future(pool.acquire('a')) # queued requests count in the quota
+            await asyncio.sleep(0)
+
+            with self.assertRaises(TooManyRequestsError):
+                await pool.acquire('a')
+
+            other = asyncio.ensure_future(pool.acquire('b')) # other clients are still queued
+            await asyncio.sleep(0)
+
+            self.assertEqual(pool.stats()["rejected_client_quota"], 1)
+            self.assertEqual(pool.stats()["queued"], 2)
+
+            pool.release('a', admitted_at)
+            pool.release('a', await queued)
+            pool.release('b', await other)
+
+        run(scenario())
+
+class AdmissionDependencyTest(unittest.TestCase):
+
+    def test_rejected_with_retry_after(self):
+        async def scenario():
+            admit = admission(Priority.BULK)
+            pool = admission_pools()[Priority.BULK]
+            held: List[AsyncIterator[None]] = []
+
+            for _ in range(pool.client_concurrency):
+                dependency = admit(request())
+                await dependency.__anext__()
+                held.append(dependency)
+
+            with self.assertRaises(TooManyRequestsError) as context:
+                await admit(request()).__anext__()
+
+            response = await request_error_handler(request(), context.exception)
+
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response.headers["retry-after"], "1")
+            self.assertIn("Too many concurrent bulk requests", json.loads(response.body)["error"])
+
+            for dependency in held:
+                with self.assertRaises(StopAsyncIteration):
+                    await dependency.__anext__()
+
+            self.assertEqual(pool.stats()["active"], 0)
+
+        run(scenario())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+from datetime import datetime, timezone
+
+import os.path
+import tempfile
+import unittest
+
+from app.models.fountain import FountainOpenStreetMap
+from app.services.changes import ChangeLog
+from app.services.snapshot import FountainSnapshot, write_snapshot
+
+UPDATED_AT = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+def fountain(provider_id: str, version: int) -> FountainOpenStreetMap:
+    return FountainOpenStreetMap.model_construct(lat=41.38, long=2.17, provider_id=provider_id, provider_updated_at=UPDATED_AT,
+                                                 osm_version=version)
+
+class ChangeLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.snapshot_file = os.path.join(self.directory.name, 'fountains.snapshot')
+        self.change_log = ChangeLog(os.path.join(self.directory.name, 'fountains.changes.sqlite3'))
+        self.snapshot = None
+
+    def tearDown(self):
+        self.change_log.close()
+        self.directory.cleanup()
+
+    def publish(self, *fountains: FountainOpenStreetMap) -> int:
+        write_snapshot(list(fountains), self.snapshot_file)
+        snapshot = FountainSnapshot(self.snapshot_file)
+        sequence, _ = self.change_log.record(self.snapshot, snapshot)
+        self.snapshot = snapshot
+
+        return sequence
+
+    def test_created_and_updated(self):
+        base = self.publish(fountain('node:2', 1))
+        self.publish(fountain('node:1', 1), fountain('node:2', 2))
+        self.publish(fountain('node:1', 2), fountain('node:2', 2))
+
+        changes = self.change_log.changes(base)
+
+        self.assertEqual(changes.created, ['node:1'])
+        self.assertEqual(changes.updated, ['node:2'])
+        self.assertEqual(changes.deleted, [])
+
+    def test_created_then_deleted(self):
+        base = self.publish(fountain('node:2', 1))
+        self.publish(fountain('node:1', 1), fountain('node:2', 1))
+        self.publish(fountain('node:2', 1))
+
+        changes = self.change_log.changes(base)
+
+        self.assertEqual(changes.created, [])
+        self.assertEqual(changes.deleted, ['node:1'])
+
+    def test_updated_then_deleted(self):
+        base = self.publish(fountain('node:1', 1), fountain('node:2', 1))
+        self.publish(fountain('node:1', 1), fountain('node:2', 2))
+        self.publish(fountain('node:1', 1))
+
+        changes = self.change_log.changes(base)
+
+        self.assertEqual(changes.updated, [])
+        self.assertEqual(changes.deleted, ['node:2'])
+
+    def test_cursor(self):
+        base = self.publish(fountain('node:1', 1))
+        self.publish(fountain('node:1', 2), fountain('node:2', 1), fountain('node:3', 1))
+        self.publish(fountain('node:2', 1))
+
+        first = self.change_log.changes(base, limit=2)
+
+        self.assertEqual((first.deleted, first.created), (['node:1'], ['node:2']))
+        self.assertIsNotNone(first.next_cursor)
+
+        second = self.change_log.changes(base, cursor=first.next_cursor, limit=2)
+
+        self.assertEqual((second.created, second.deleted), ([], ['node:3']))
+        self.assertIsNone(second.next_cursor)
+
+    def test_snapshot_merge_keeps_versions(self):
+        base = self.publish(fountain('node:1', 3), fountain('node:2', 5))
+        assert self.snapshot is not None
+
+        # kept fountains of the previous snapshot merged with an updated one, as published with --snapshot --update
+        merged = { fountain.provider_id: fountain for fountain in self.snapshot.fountains() }
+        merged['node:2'] = fountain('node:2', 6)
+        self.publish(*merged.values())
+
+        changes = self.change_log.changes(base)
+
+        self.assertEqual(changes.updated, ['node:2'])
+        self.assertEqual([fountain.osm_version for fountain in self.snapshot.fountains()], [3, 6])
+
+if __name__ == '__main__':
+    unittest.main()
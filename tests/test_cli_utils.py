@@ -0,0 +1,61 @@
+from time import sleep
+
+import threading
+import unittest
+
+from cli.utils import BusyTimer, TimedIterator, batches
+
+class BusyTimerTest(unittest.TestCase):
+
+    def test_overlapping_tasks_counted_once(self):
+        timer = BusyTimer()
+
+        def task():
+            with timer.busy():
+                sleep(0.1)
+
+        threads = [threading.Thread(target=task) for _ in range(4)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertGreaterEqual(timer.seconds, 0.1)
+        self.assertLess(timer.seconds, 0.3)
+
+    def test_idle_time_not_counted(self):
+        timer = BusyTimer()
+
+        with timer.busy():
+            sleep(0.05)
+
+        sleep(0.1)
+
+        with timer.busy():
+            sleep(0.05)
+
+        self.assertLess(timer.seconds, 0.15)
+
+class TimedIteratorTest(unittest.TestCase):
+
+    def test_consumer_time_not_counted(self):
+        def produced():
+            for item in range(3):
+                sleep(0.02)
+                yield item
+
+        timed = TimedIterator(produced())
+
+        for _ in timed:
+            sleep(0.05)
+
+        self.assertGreaterEqual(timed.seconds, 0.06)
+        self.assertLess(timed.seconds, 0.15)
+
+    def test_batches(self):
+        self.assertEqual(list(batches(iter(range(5)), 2)), [(0, 2, [0, 1]), (2, 4, [2, 3]), (4, 5, [4])])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import gzip
+import unittest
+
+from app.services.compression import COMPRESSORS, DEFAULT_LEVELS, EncodedBody, EncodedBodyCache, compress_stream, \
+    negotiate_encoding
+
+try:
+    import brotli # type: ignore
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard # type: ignore
+except ImportError:
+    zstandard = None
+
+LEVELS = { "gzip": 5, "br": 4, "zstd": 3 }
+
+BODY = b'{"fountains": [' + b','.join(b'{"name": "Font %d", "lat": 41.38, "long": 2.17}' % index for index in range(200)) + b']}'
+
+DECOMPRESSORS = { "gzip": gzip.decompress }
+
+if brotli is not None:
+    DECOMPRESSORS["br"] = brotli.decompress
+
+if zstandard is not None:
+    DECOMPRESSORS["zstd"] = lambda body: zstandard.ZstdDecompressor().decompressobj().decompress(body)
+
+class NegotiationTest(unittest.TestCase):
+
+    def test_preference(self):
+        self.assertEqual(negotiate_encoding("gzip, deflate, br, zstd", LEVELS), "zstd")
+        self.assertEqual(negotiate_encoding("gzip, br", LEVELS), "br")
+        self.assertEqual(negotiate_encoding("gzip", LEVELS), "gzip")
+        self.assertEqual(negotiate_encoding("*", LEVELS), "zstd")
+
+    def test_quality(self):
+        self.assertEqual(negotiate_encoding("zstd;q=0.5, br;q=0.8, gzip", LEVELS), "gzip")
+        self.assertEqual(negotiate_encoding("zstd;q=0, *", LEVELS), "br")
+        self.assertEqual(negotiate_encoding("gzip;q=0.9, BR", LEVELS), "br")
+
+    def test_uncompressed(self):
+        self.assertIsNone(negotiate_encoding(None, LEVELS))
+        self.assertIsNone(negotiate_encoding("identity, deflate", LEVELS))
+        self.assertIsNone(negotiate_encoding("gzip;q=0", LEVELS))
+        self.assertIsNone(negotiate_encoding("zstd", { "gzip": 5 }))
+
+class CompressionTest(unittest.TestCase):
+
+    def test_installed_encodings(self):
+        self.assertEqual(set(COMPRESSORS), set(DECOMPRESSORS))
+
+    def test_round_trip(self):
+        for encoding, decompress in DECOMPRESSORS.items():
+            with self.subTest(encoding=encoding):
+                body = EncodedBody(BODY)
+                encoded = body.encode(encoding, DEFAULT_LEVELS[encoding])
+
+                self.assertLess(len(encoded), len(BODY))
+                self.assertEqual(decompress(encoded), BODY)
+
+    def test_stream_round_trip(self):
+        for encoding, decompress in DECOMPRESSORS.items():
+            with self.subTest(encoding=encoding):
+                chunks = [BODY[start:start + 1000] for start in range(0, len(BODY), 1000)]
+
+                self.assertEqual(decompress(b''.join(compress_stream(chunks, encoding, DEFAULT_LEVELS[encoding]))), BODY)
+
+    def test_small_body_uncompressed(self):
+        self.assertEqual(EncodedBody(b'{}').encode("gzip", 5), b'{}')
+
+    @unittest.skipUnless(brotli and zstandard, "brotli and zstandard are not installed")
+    def test_br_and_zstd_installed(self):
+        self.assertIn("br", COMPRESSORS)
+        self.assertIn("zstd", COMPRESSORS)
+
+class EncodedBodyCacheTest(unittest.TestCase):
+
+    def test_content_key(self):
+        cache = EncodedBodyCache()
+        builds = []
+
+        def build() -> bytes:
+            builds.append(1)
+            return BODY
+
+        first = cache.get(('snapshot', 1, '/fountains/snapshot'), build)
+
+        self.assertIs(cache.get(('snapshot', 1, '/fountains/snapshot'), build), first)
+        self.assertIsNot(cache.get(('snapshot', 2, '/fountains/snapshot'), build), first)
+        self.assertEqual(len(builds), 2)
+
+    def test_evicted_when_compressed_variants_exceed_max_bytes(self):
+        cache = EncodedBodyCache(max_bytes=2 * len(BODY) + 100)
+
+        first = cache.get('first', lambda: BODY)
+        cache.get('second', lambda: BODY)
+
+        self.assertEqual(cache.stats()["entries"], 2)
+
+        first.encode("gzip", 5) # the cached bodies grow over max_bytes
+
+        self.assertEqual(cache.stats()["entries"], 1)
+        self.assertLessEqual(cache.stats()["bytes"], cache.max_bytes)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+from datetime import datetime, timezone
+
+import math
+import random
+import unittest
+
+from app.models.fountain import FountainOpenStreetMap, FountainType, SafeWater
+from app.services.dedup import merge_duplicates
+from app.services.geo import EARTH_RADIUS, ProximityGrid, distance
+
+UPDATED_AT = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+def fountain(provider_id: str, lat: float, long: float, **fields) -> FountainOpenStreetMap:
+    return FountainOpenStreetMap.model_construct(lat=lat, long=long, provider_id=provider_id,
+                                                 **{ 'provider_updated_at': UPDATED_AT, 'type': FountainType.TAP_WATER,
+                                                     'safe_water': SafeWater.YES, **fields })
+
+def north(lat: float, meters: float) -> float:
+    return lat + math.degrees(meters / EARTH_RADIUS)
+
+class ProximityGridTest(unittest.TestCase):
+
+    def check_neighbors(self, grid_distance: float, points: list):
+        grid = ProximityGrid(grid_distance)
+
+        for index, (lat, long) in enumerate(points):
+            grid.add(lat, long, index)
+
+        for lat, long in points:
+            expected = { index for index, point in enumerate(points) if distance(lat, long, *point) <= grid_distance }
+
+            with self.subTest(lat=lat, long=long):
+                self.assertLessEqual(expected, set(grid.neighbors(lat, long)))
+
+    def test_neighbors(self):
+        randomizer = random.Random(47)
+        points = []
+
+        for _ in range(300):
+            lat, long = randomizer.uniform(-89.9, 89.9), randomizer.uniform(-180, 180)
+            points.append((lat, long))
+            # close points in every direction
+            points.extend((lat + randomizer.uniform(-0.001, 0.001), long + randomizer.uniform(-0.002, 0.002)) for _ in range(3))
+
+        self.check_neighbors(100, points)
+
+    def test_neighbors_across_the_antimeridian(self):
+        points = [(lat, long) for lat in (-70, -45.5, 0, 0.0004, 30, 60.1, 85) for long in (-180, -179.9995, 179.9995, 180)]
+
+        self.check_neighbors(100, points)
+
+        grid = ProximityGrid(100)
+        grid.add(0, 179.9999, 0)
+
+        self.assertEqual(grid.neighbors(0, -179.9999), [0])
+
+    def test_neighbors_near_the_poles(self):
+        points = [(lat, long) for lat in (89.9995, 89.9999, -89.9995, -89.9999) for long in (-179, -90, 0, 0.001, 90, 179)]
+
+        self.check_neighbors(100, points)
+
+class MergeDuplicatesTest(unittest.TestCase):
+
+    def test_node_and_way(self):
+        node = fountain('node:1', 41.38, 2.17, name=None, access_bottles=True)
+        way = fountain('way:2', north(41.38, 3), 2.17, name="Font de Canaletes",
+                       provider_updated_at=datetime(2024, 6, 1, tzinfo=timezone.utc))
+
+        fountains, merged = merge_duplicates([node, way], 5)
+
+        self.assertEqual(merged, 1)
+        self.assertEqual(fountains, [node])
+        self.assertEqual((node.lat, node.long), (41.38, 2.17)) # position of the node
+        self.assertEqual(node.name, "Font de Canaletes")
+        self.assertTrue(node.access_bottles)
+        self.assertEqual(node.merged_ids, ['way:2'])
+        self.assertEqual(node.provider_updated_at, datetime(2024, 6, 1, tzinfo=timezone.utc))
+
+    def test_farther_than_the_distance(self):
+        fountains, merged = merge_duplicates([fountain('node:1', 41.38, 2.17), fountain('node:2', north(41.38, 6), 2.17)], 5)
+
+        self.assertEqual((len(fountains), merged), (2, 0))
+
+    def test_incompatible(self):
+        tap = fountain('node:1', 41.38, 2.17)
+        non_drinkable = fountain('node:2', north(41.38, 3), 2.17, safe_water=SafeWater.NO)
+        spring = fountain('node:3', north(41.38, 3), 2.17, type=FountainType.NATURAL)
+        unknown = fountain('node:4', north(41.38, 1), 2.17, type=None, safe_water=None) # compatible with any
+
+        fountains, merged = merge_duplicates([tap, non_drinkable, spring, unknown], 5)
+
+        self.assertEqual(fountains, [tap, non_drinkable, spring])
+        self.assertEqual((merged, tap.merged_ids), (1, ['node:4']))
+
+    def test_merged_into_the_nearest(self):
+        far = fountain('node:1', 41.38, 2.17)
+        near = fountain('node:2', north(41.38, 8), 2.17)
+        duplicate = fountain('way:3', north(41.38, 6), 2.17)
+
+        fountains, _ = merge_duplicates([far, near, duplicate], 7)
+
+        self.assertEqual(fountains, [far, near])
+        self.assertEqual((far.merged_ids, near.merged_ids), (None, ['way:3']))
+
+    def test_not_chained(self):
+        # B is merged into A, C is near B but not A: kept
+        a = fountain('node:a', 41.38, 2.17)
+        b = fountain('node:b', north(41.38, 4), 2.17)
+        c = fountain('node:c', north(41.38, 8), 2.17)
+
+        fountains, merged = merge_duplicates([a, b, c], 5)
+
+        self.assertEqual((fountains, merged), ([a, c], 1))
+        self.assertEqual((a.merged_ids, c.merged_ids), (['node:b'], None))
+
+    def test_across_the_antimeridian(self):
+        east = fountain('node:1', -16.5, 179.99998)
+        west = fountain('node:2', -16.5, -179.99998)
+
+        fountains, merged = merge_duplicates([east, west], 10)
+
+        self.assertEqual((fountains, merged), ([east], 1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,197 @@
+from typing import Dict, List
+
+from itertools import product
+
+import re
+import unittest
+
+from app.models.filter import FountainFilter
+from app.models.fountain import FountainOpenStreetMap, FountainType, SafeWater, Access
+from app.services.filters import ACCESS_TAG_VALUES, filtered_query_template, matches, tag_filters
+from app.services.openstreetmap_api import FOUNTAIN_QUERY_TEMPLATE_FILE, _load_query_template
+from app.services.transform_fountains import derive_fields, determine_type, determine_safe_water, determine_access, \
+    determine_access_wheelchair, determine_access_bottles
+
+STATEMENT_TAGS = [('amenity', 'drinking_water'), ('amenity', 'watering_place'), ('natural', 'spring'),
+                  ('man_made', 'water_tap'), ('amenity', 'water_point'), ('waterway', 'water_point')]
+"""
+Tags selected by the statements of the query template
+"""
+
+_TAG_FILTER = re.compile(r'\["([^"]+)"(?:(=|!=|~)"([^"]*)")?\]')
+
+def passes(statement_filters: List[str], tags: Dict[str, str]) -> bool:
+    """
+    Whether Overpass returns an element with the tags for the tag filters of a statement
+    """
+    for statement_filter in statement_filters:
+        key, operator, value = _TAG_FILTER.fullmatch(statement_filter).groups()
+
+        if operator is None:
+            passed = key in tags
+        elif operator == '=':
+            passed = tags.get(key) == value
+        elif operator == '!=':
+            passed = tags.get(key) != value # elements without the tag too
+        else:
+            passed = key in tags and re.search(value, tags[key]) is not None
+
+        if not passed:
+            return False
+
+    return True
+
+def sample_tags() -> List[Dict[str, str]]:
+    """
+    Tags of every statement with known, unknown and missing values of the filtered tags
+    """
+    values = {
+        'drinking_water': (None, 'no', 'yes', 'treated', 'conditional'),
+        'drinking_water:legal': (None, 'yes'),
+        'access': (None, 'yes', 'private', 'customers', 'unknown', 'somewhere'),
+        'wheelchair': (None, 'yes', 'no', 'limited'),
+        'bottle': (None, 'yes', 'no'),
+    }
+    samples = []
+
+    for statement_tag, combination in product(STATEMENT_TAGS, product(*values.values())):
+        tags = dict([statement_tag])
+        tags.update({ key: value for key, value in zip(values, combination) if value is not None })
+        samples.append(tags)
+
+    return samples
+
+def fountain(tags: Dict[str, str]) -> FountainOpenStreetMap:
+    return FountainOpenStreetMap.model_construct(lat=41.38, long=2.17, **derive_fields(tags))
+
+class FilteredQueryTemplateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.query_template = _load_query_template(FOUNTAIN_QUERY_TEMPLATE_FILE)
+
+    def statements(self, query_template: str) -> List[str]:
+        return [line for line in query_template.splitlines() if line.startswith('nwr[')]
+
+    def test_without_filters(self):
+        self.assertEqual(filtered_query_template(self.query_template, FountainFilter()), self.query_template)
+
+    def test_type_drops_statements(self):
+        query_template = filtered_query_template(self.query_template, FountainFilter(type=[FountainType.WATER_POINT]))
+
+        self.assertEqual(self.statements(query_template), ['nwr["amenity"="water_point"]{search};',
+                                                           'nwr["waterway"="water_point"]{search};'])
+
+    def test_tag_filters(self):
+        filters = FountainFilter(safe_water=[SafeWater.NO], access=[Access.YES, Access.PRIVATE], access_wheelchair=False)
+        query_template = filtered_query_template(self.query_template, filters)
+        tail = '["drinking_water"="no"]["access"~"^(yes|public|private|military)$"]["wheelchair"]["wheelchair"!="yes"]{search};'
+
+        self.assertEqual(self.statements(query_template), [f'nwr["{key}"="{value}"]{tail}' for key, value in STATEMENT_TAGS])
+
+    def test_rendered(self):
+        query_template = filtered_query_template(self.query_template, FountainFilter(type=[FountainType.NATURAL],
+                                                                                     access_bottles=True))
+        query = query_template.format(timeout=10, bbox='[bbox:41.3,2.1,41.4,2.2]', search='(newer:"2024-01-01T00:00:00+00:00")',
+                                      area_id='', out='out meta center qt;')
+
+        self.assertIn('nwr["natural"="spring"]["bottle"="yes"](newer:"2024-01-01T00:00:00+00:00");', query)
+        self.assertEqual(len(self.statements(query)), 1)
+        self.assertTrue(query.startswith('[bbox:41.3,2.1,41.4,2.2][out:json][timeout:10];'))
+
+    def test_statements_without_passing_elements(self):
+        # drinking_water amenities are always safe water, unless drinking_water=no
+        filters = FountainFilter(safe_water=[SafeWater.PROBABLY])
+        query_template = filtered_query_template(self.query_template, filters)
+
+        self.assertNotIn('nwr["amenity"="drinking_water"]', query_template)
+        self.assertEqual(len(self.statements(query_template)), len(STATEMENT_TAGS) - 1)
+        self.assertIsNone(tag_filters(filters, { 'amenity': 'drinking_water' }))
+        self.assertIsNone(tag_filters(FountainFilter(type=[FountainType.NATURAL]), { 'man_made': 'water_tap' }))
+
+class MatchesTest(unittest.TestCase):
+
+    FIELDS = {
+        'type': (determine_type, [[value] for value in FountainType] + [[FountainType.NATURAL, FountainType.TAP_WATER]]),
+        'safe_water': (determine_safe_water, [[value] for value in SafeWater] + [[SafeWater.YES, SafeWater.PROBABLY]]),
+        'access': (determine_access, [[value] for value in Access] + [[Access.YES, Access.PERMISSIVE, Access.UNKNOWN]]),
+        'access_wheelchair': (determine_access_wheelchair, [True, False]),
+        'access_bottles': (determine_access_bottles, [True, False]),
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        cls.samples = [(tags, fountain(tags)) for tags in sample_tags()]
+
+    def check(self, filters: FountainFilter, expected) -> int:
+        """
+        Checks matches against the expected result for the tags of each sample,
+        and that every matching element is returned by the filtered statement, returning the number of matches
+        """
+        matched = 0
+
+        for tags, sample in self.samples:
+            with self.subTest(filters=filters, tags=tags):
+                self.assertEqual(matches(filters, sample), expected(tags))
+
+                if expected(tags):
+                    statement_tag = next((key, value) for key, value in STATEMENT_TAGS if tags.get(key) == value)
+                    statement_filters = tag_filters(filters, dict([statement_tag]))
+
+                    self.assertIsNotNone(statement_filters)
+                    self.assertTrue(passes(statement_filters, tags), statement_filters)
+                    matched += 1
+
+        return matched
+
+    def test_each_filter_value(self):
+        for field, (determine, values) in self.FIELDS.items():
+            for value in values:
+                filters = FountainFilter(**{ field: value })
+
+                if isinstance(value, list):
+                    expected = lambda tags, determine=determine, value=value: determine(tags) in value
+                else:
+                    expected = lambda tags, determine=determine, value=value: determine(tags) == value
+
+                self.check(filters, expected)
+
+    def test_combined_filters(self):
+        filters = FountainFilter(type=[FountainType.TAP_WATER, FountainType.WATER_POINT], safe_water=[SafeWater.PROBABLY],
+                                 access=[Access.YES], access_bottles=True)
+
+        def expected(tags: Dict[str, str]) -> bool:
+            return (determine_type(tags) in filters.type and determine_safe_water(tags) == SafeWater.PROBABLY
+                    and determine_access(tags) == Access.YES and determine_access_bottles(tags) is True)
+
+        self.assertGreater(self.check(filters, expected), 0)
+
+    def test_no_filter_matches_everything(self):
+        self.assertEqual(self.check(FountainFilter(), lambda tags: True), len(self.samples))
+
+    def test_unknown_values(self):
+        # fields not determined from the tags (None) match no filter value
+        unknown = fountain({ 'amenity': 'watering_place', 'access': 'somewhere', 'wheelchair': 'limited' })
+
+        self.assertIsNone(unknown.safe_water)
+        self.assertIsNone(unknown.access)
+        self.assertIsNone(unknown.access_bottles)
+        self.assertFalse(unknown.access_wheelchair)
+
+        for field, (_, values) in self.FIELDS.items():
+            if field == 'type' or field == 'access_wheelchair':
+                continue
+
+            for value in values:
+                self.assertFalse(matches(FountainFilter(**{ field: value }), unknown), (field, value))
+
+        self.assertTrue(matches(FountainFilter(access_wheelchair=False), unknown))
+
+    def test_access_tag_values(self):
+        # every value pushed down to Overpass is a value determine_access recognizes
+        for value in ACCESS_TAG_VALUES:
+            self.assertIsNotNone(determine_access({ 'access': value }))
+
+        self.assertIsNone(determine_access({ 'access': 'somewhere' }))
+
+if __name__ == '__main__':
+    unittest.main()
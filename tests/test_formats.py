@@ -0,0 +1,353 @@
+from typing import Any, Dict, List, Tuple
+
+from datetime import datetime, timezone
+
+import json
+import os.path
+import struct
+import tempfile
+import unittest
+
+from app.models.fountain import FountainOpenStreetMap, FountainOpenStreetMapInfo, FountainType, SafeWater, Access
+from app.services.flatgeobuf import INDEX_NODE_SIZE, MAGIC, NODE_ITEM, ColumnType, level_bounds
+from app.services.formats import FLATGEOBUF_COLUMNS, encode_flatgeobuf, encode_msgpack, fountain_content, msgpack_encode
+
+try:
+    import pyogrio.raw # type: ignore
+except ImportError:
+    pyogrio = None
+
+def unpack_msgpack(data: bytes) -> Any:
+    """
+    Reference MessagePack decoder of the types written by the encoder
+    """
+    def read(position: int) -> Tuple[Any, int]:
+        # pylint: disable=too-many-return-statements
+        code = data[position]
+        position += 1
+
+        if code <= 0x7f:
+            return code, position
+        if code >= 0xe0:
+            return code - 0x100, position
+        if 0xa0 <= code <= 0xbf:
+            return string(position, code & 0x1f)
+        if 0x90 <= code <= 0x9f:
+            return array(position, code & 0x0f)
+        if 0x80 <= code <= 0x8f:
+            return mapping(position, code & 0x0f)
+
+        if code in (0xc0, 0xc2, 0xc3):
+            return { 0xc0: None, 0xc2: False, 0xc3: True }[code], position
+
+        formats = { 0xcb: '>d', 0xce: '>I', 0xcf: '>Q', 0xd3: '>q', 0xd9: '>B', 0xda: '>H', 0xdb: '>I',
+                    0xdc: '>H', 0xdd: '>I', 0xde: '>H', 0xdf: '>I' }
+        value, = struct.unpack_from(formats[code], data, position)
+        position += struct.calcsize(formats[code])
+
+        if code in (0xd9, 0xda, 0xdb):
+            return string(position, value)
+        if code in (0xdc, 0xdd):
+            return array(position, value)
+        if code in (0xde, 0xdf):
+            return mapping(position, value)
+
+        return value, position
+
+    def string(position: int, length: int) -> Tuple[str, int]:
+        return data[position:position + length].decode('utf8'), position + length
+
+    def array(position: int, length: int) -> Tuple[List[Any], int]:
+        items = []
+
+        for _ in range(length):
+            item, position = read(position)
+            items.append(item)
+
+        return items, position
+
+    def mapping(position: int, length: int) -> Tuple[Dict[str, Any], int]:
+        items = {}
+
+        for _ in range(length):
+            key, position = read(position)
+            items[key], position = read(position)
+
+        return items, position
+
+    value, end = read(0)
+    assert end == len(data), "trailing bytes"
+
+    return value
+
+class FlatBufferTable:
+    """
+    Reader of a FlatBuffers table: fields by index, scalars by struct format
+    """
+
+    def __init__(self, data: bytes, position: int):
+        self.data = data
+        self.position = position
+        self.vtable = position - struct.unpack_from('<i', data, position)[0]
+        self.fields = (struct.unpack_from('<H', data, self.vtable)[0] - 4) // 2
+
+    def _field(self, index: int) -> int | None:
+        if index >= self.fields:
+            return None
+
+        offset = struct.unpack_from('<H', self.data, self.vtable + 4 + 2 * index)[0]
+
+        return self.position + offset if offset else None
+
+    def _reference(self, index: int) -> int | None:
+        field = self._field(index)
+        return None if field is None else field + struct.unpack_from('<I', self.data, field)[0]
+
+    def scalar(self, index: int, fmt: str) -> Any:
+        field = self._field(index)
+        return None if field is None else struct.unpack_from(fmt, self.data, field)[0]
+
+    def string(self, index: int) -> str | None:
+        vector = self.bytes(index)
+        return None if vector is None else vector.decode('utf8')
+
+    def bytes(self, index: int) -> bytes | None:
+        position = self._reference(index)
+
+        if position is None:
+            return None
+
+        length = struct.unpack_from('<I', self.data, position)[0]
+
+        return self.data[position + 4:position + 4 + length]
+
+    def doubles(self, index: int) -> Tuple[float, ...] | None:
+        position = self._reference(index)
+
+        if position is None:
+            return None
+
+        assert (position + 4) % 8 == 0, "unaligned doubles"
+        length = struct.unpack_from('<I', self.data, position)[0]
+
+        return struct.unpack_from(f'<{length}d', self.data, position + 4)
+
+    def table(self, index: int) -> 'FlatBufferTable | None':
+        position = self._reference(index)
+        return None if position is None else FlatBufferTable(self.data, position)
+
+    def tables(self, index: int) -> List['FlatBufferTable']:
+        position = self._reference(index)
+
+        if position is None:
+            return []
+
+        length = struct.unpack_from('<I', self.data, position)[0]
+        elements = [position + 4 + 4 * item for item in range(length)]
+
+        return [FlatBufferTable(self.data, element + struct.unpack_from('<I', self.data, element)[0]) for element in elements]
+
+def size_prefixed_root(data: bytes, position: int) -> Tuple[FlatBufferTable, int]:
+    """
+    Root table of a size-prefixed buffer, with the positions (and alignment) from the size prefix
+    """
+    size = struct.unpack_from('<I', data, position)[0]
+    flatbuffer = data[position:position + 4 + size]
+
+    return FlatBufferTable(flatbuffer, 4 + struct.unpack_from('<I', flatbuffer, 4)[0]), position + 4 + size
+
+def read_properties(columns: List[Tuple[str, ColumnType]], encoded: bytes) -> Dict[str, Any]:
+    properties: Dict[str, Any] = {}
+    position = 0
+
+    while position < len(encoded):
+        index = struct.unpack_from('<H', encoded, position)[0]
+        name, column_type = columns[index]
+        position += 2
+
+        if column_type == ColumnType.BOOL:
+            properties[name] = struct.unpack_from('<?', encoded, position)[0]
+            position += 1
+        else:
+            length = struct.unpack_from('<I', encoded, position)[0]
+            text = encoded[position + 4:position + 4 + length].decode('utf8')
+            properties[name] = json.loads(text) if column_type == ColumnType.JSON else text
+            position += 4 + length
+
+    return properties
+
+def read_flatgeobuf(data: bytes) -> Tuple[FlatBufferTable, List[Tuple[float, float, Dict[str, Any]]], List[Tuple[float, ...]]]:
+    """
+    Header, features (long, lat, properties) in file order and index nodes of a FlatGeobuf file
+    """
+    assert data[:7] == MAGIC[:7], "invalid magic" # any patch version (last byte)
+
+    header, position = size_prefixed_root(data, 8)
+    columns = [(column.string(0) or '', ColumnType(column.scalar(1, '<B'))) for column in header.tables(7)]
+    count = header.scalar(8, '<Q') or 0
+
+    nodes: List[Tuple[float, ...]] = []
+
+    if count:
+        node_size = header.scalar(9, '<H')
+        node_count = level_bounds(count, INDEX_NODE_SIZE if node_size is None else node_size)[0][1] # schema default if absent
+        nodes = [NODE_ITEM.unpack_from(data, position + NODE_ITEM.size * node) for node in range(node_count)]
+        position += NODE_ITEM.size * node_count
+
+    features_start = position
+    features = []
+
+    while position < len(data):
+        feature, next_position = size_prefixed_root(data, position)
+        geometry = feature.table(0)
+        assert geometry is not None
+        long, lat = geometry.doubles(1) or ()
+
+        features.append((position - features_start, long, lat, read_properties(columns, feature.bytes(1) or b'')))
+        position = next_position
+
+    assert len(features) == count
+
+    for offset, long, lat, _ in features:
+        assert (long, lat, long, lat, offset) in nodes, "feature missing from the index"
+
+    return header, [(long, lat, properties) for _, long, lat, properties in features], nodes
+
+UPDATED_AT = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+
+FOUNTAINS = [
+    FountainOpenStreetMap.model_construct(
+        lat=41.38, long=2.17, provider_id='node:1', provider_updated_at=UPDATED_AT, provider_url='https://www.openstreetmap.org/node/1',
+        type=FountainType.NATURAL, name='Font de Canaletes', safe_water=SafeWater.YES, access=Access.YES,
+        access_bottles=True, access_wheelchair=False,
+        osm=FountainOpenStreetMapInfo(type='node', id=1, version=3, tags={ 'amenity': 'drinking_water', 'name': 'Font de Canaletes' })),
+    FountainOpenStreetMap.model_construct(
+        lat=-33.86, long=151.2, provider_id='way:4294967296', provider_updated_at=UPDATED_AT,
+        description='Ñandú ' * 60, merged_ids=['node:7', 'node:8']),
+    FountainOpenStreetMap.model_construct(lat=64.1, long=-21.9, provider_id='node:3', provider_updated_at=UPDATED_AT, fee=False),
+]
+
+METADATA = { "query_url": "http://localhost/fountains/?area=Barcelona", "provider_name": "OpenStreetMap" }
+
+class MessagePackTest(unittest.TestCase):
+
+    def test_values(self):
+        values = [None, True, False, 0, 127, 128, -1, -32, -33, 0xFFFFFFFF, 0x100000000, -2**40, 1.5, -0.0,
+                  '', 'a' * 31, 'a' * 32, 'é' * 200, 'x' * 0x10000, list(range(15)), list(range(16)), list(range(0x10000)),
+                  { str(key): key for key in range(16) }, { 'nested': [{ 'a': [] }, {}] }]
+
+        for value in values:
+            self.assertEqual(unpack_msgpack(msgpack_encode(value)), value)
+
+    def test_fountains(self):
+        content = unpack_msgpack(b''.join(encode_msgpack(METADATA, FOUNTAINS, len(FOUNTAINS))))
+
+        self.assertEqual(content, { **METADATA, "count": 3, "fountains": [fountain_content(fountain) for fountain in FOUNTAINS] })
+
+class FlatGeobufTest(unittest.TestCase):
+
+    def test_fountains(self):
+        header, features, nodes = read_flatgeobuf(b''.join(encode_flatgeobuf(METADATA, FOUNTAINS, len(FOUNTAINS))))
+
+        self.assertEqual(header.string(0), 'fountains')
+        self.assertEqual(header.scalar(2, '<B'), 1)
+        self.assertEqual(header.doubles(1), (-21.9, -33.86, 151.2, 64.1))
+        self.assertEqual(nodes[0][:4], (-21.9, -33.86, 151.2, 64.1))
+        self.assertEqual(header.string(12), METADATA["query_url"])
+        self.assertEqual(json.loads(header.string(13) or ''), METADATA)
+        self.assertEqual([column.string(0) for column in header.tables(7)], [column.name for column in FLATGEOBUF_COLUMNS])
+
+        crs = header.table(10)
+        assert crs is not None
+        self.assertEqual((crs.string(0), crs.scalar(1, '<i')), ('EPSG', 4326))
+
+        expected = {}
+
+        for fountain in FOUNTAINS:
+            properties = fountain_content(fountain)
+            expected[fountain.provider_id] = (properties.pop('long'), properties.pop('lat'), properties)
+
+        self.assertEqual({ properties['provider_id']: (long, lat, properties) for long, lat, properties in features }, expected)
+
+    def test_empty(self):
+        header, features, nodes = read_flatgeobuf(b''.join(encode_flatgeobuf(METADATA, [], 0)))
+
+        self.assertEqual(header.scalar(8, '<Q'), 0)
+        self.assertIsNone(header.doubles(1))
+        self.assertEqual((features, nodes), ([], []))
+
+REFERENCE_FILE = os.path.join(os.path.dirname(__file__), 'fixtures', 'fountains.fgb')
+"""
+FOUNTAINS written by GDAL (tests/fixtures/make_flatgeobuf_fixture.py), with the JSON columns as strings
+"""
+
+def reference_properties(properties: Dict[str, Any]) -> Dict[str, Any]:
+    return { name: json.loads(value) if name in ('merged_ids', 'osm') else value for name, value in properties.items() }
+
+class FlatGeobufReferenceTest(unittest.TestCase):
+
+    def setUp(self):
+        with open(REFERENCE_FILE, 'rb') as reference_file:
+            self.reference = reference_file.read()
+
+        self.encoded = b''.join(encode_flatgeobuf(METADATA, FOUNTAINS, len(FOUNTAINS)))
+
+    def test_reference_file(self):
+        header, features, _ = read_flatgeobuf(self.reference)
+
+        self.assertEqual(header.string(0), 'fountains')
+        self.assertEqual(header.doubles(1), (-21.9, -33.86, 151.2, 64.1))
+        self.assertEqual(header.scalar(8, '<Q'), len(FOUNTAINS))
+        self.assertEqual(header.string(12), METADATA["query_url"])
+        self.assertEqual(json.loads(header.string(13) or ''), METADATA)
+        self.assertEqual([column.string(0) for column in header.tables(7)], [column.name for column in FLATGEOBUF_COLUMNS])
+
+        expected = [(properties.pop('long'), properties.pop('lat'), properties)
+                    for properties in (fountain_content(fountain) for fountain in FOUNTAINS)]
+
+        self.assertCountEqual([(long, lat, reference_properties(properties)) for long, lat, properties in features], expected)
+
+    def test_same_layout_as_reference(self):
+        header, features, nodes = read_flatgeobuf(self.encoded)
+        reference_header, reference_features, reference_nodes = read_flatgeobuf(self.reference)
+
+        def columns(header: FlatBufferTable) -> List[Tuple[str | None, ColumnType]]:
+            types = [ColumnType(column.scalar(1, '<B')) for column in header.tables(7)]
+
+            # JSON columns written as strings by the reference
+            return [(column.string(0), ColumnType.STRING if column_type == ColumnType.JSON else column_type)
+                    for column, column_type in zip(header.tables(7), types)]
+
+        self.assertEqual(columns(header), columns(reference_header))
+        self.assertEqual((header.table(10).string(0), header.table(10).scalar(1, '<i')), # type: ignore
+                         (reference_header.table(10).string(0), reference_header.table(10).scalar(1, '<i'))) # type: ignore
+
+        # same features, in the same order along the Hilbert curve
+        self.assertEqual(features, [(long, lat, reference_properties(properties)) for long, lat, properties in reference_features])
+
+        # same index, but the byte offsets of the features (laid out in another order within each feature buffer)
+        leaves = level_bounds(len(FOUNTAINS))[0][0]
+
+        self.assertEqual(nodes[:leaves], reference_nodes[:leaves])
+        self.assertEqual([node[:4] for node in nodes[leaves:]], [node[:4] for node in reference_nodes[leaves:]])
+
+    @unittest.skipUnless(pyogrio, "pyogrio (GDAL) is not installed")
+    def test_read_by_reference_implementation(self):
+        with tempfile.TemporaryDirectory() as directory:
+            encoded_file = os.path.join(directory, 'fountains.fgb')
+
+            with open(encoded_file, 'wb') as file:
+                file.write(self.encoded)
+
+            _, _, geometry, fields = pyogrio.raw.read(encoded_file)
+            _, _, reference_geometry, reference_fields = pyogrio.raw.read(REFERENCE_FILE)
+
+            self.assertEqual(list(geometry), list(reference_geometry))
+            self.assertEqual([[str(value) for value in field] for field in fields],
+                             [[str(value) for value in field] for field in reference_fields])
+
+            # spatial filter through the index
+            self.assertEqual(list(pyogrio.raw.read(encoded_file, bbox=(2, 41, 3, 42))[3][0]), ['node:1'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import json
+import unittest
+
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+
+from app.api.fountains import build_fountains_response
+from app.api.params import CommonQueryParams
+from app.errors import RequestTimeoutError
+from app.models.fountain import FountainType
+from app.models.response import ResponseFormat
+from app.services.deadline import Deadline, request_deadline
+from tests.test_formats import unpack_msgpack
+
+OSM_DATA = {
+    "elements": [
+        { "type": "node", "id": 1, "lat": 41.38, "lon": 2.17, "timestamp": "2024-01-01T00:00:00Z", "version": 1,
+          "tags": { "amenity": "drinking_water" } },
+    ]
+}
+
+DUPLICATES_DATA = {
+    "elements": [
+        { "type": "node", "id": 1, "lat": 41.38, "lon": 2.17, "timestamp": "2024-01-01T00:00:00Z", "version": 1,
+          "tags": { "amenity": "drinking_water" } },
+        { "type": "node", "id": 2, "lat": 41.38001, "lon": 2.17, "timestamp": "2024-01-01T00:00:00Z", "version": 1,
+          "tags": { "man_made": "water_tap", "name": "Font" } },
+        { "type": "node", "id": 3, "lat": 41.39, "lon": 2.18, "timestamp": "2024-01-01T00:00:00Z", "version": 1,
+          "tags": { "natural": "spring" } },
+        { "type": "way", "id": 4, "center": { "lat": 41.40, "lon": 2.19 }, "timestamp": "2024-01-01T00:00:00Z", "version": 1,
+          "tags": { "man_made": "water_tap" } },
+    ]
+}
+
+def request(query_string: bytes = b"area=Barcelona&format=msgpack") -> Request:
+    return Request({ "type": "http", "method": "GET", "path": "/fountains/", "query_string": query_string,
+                     "headers": [], "server": ("localhost", 80), "scheme": "http", "root_path": "" })
+
+class StreamedResponseTest(unittest.TestCase):
+
+    def test_timeout_before_streaming(self):
+        with request_deadline(Deadline(0)):
+            with self.assertRaises(RequestTimeoutError):
+                build_fountains_response(request(), 'fountains', OSM_DATA, CommonQueryParams(format=ResponseFormat.MSGPACK))
+
+    def test_streamed(self):
+        response = build_fountains_response(request(), 'fountains', OSM_DATA, CommonQueryParams(format=ResponseFormat.MSGPACK))
+
+        self.assertIsInstance(response, StreamingResponse)
+        self.assertEqual(response.media_type, "application/msgpack")
+
+class ResponseFormatsTest(unittest.TestCase):
+
+    def test_same_fountains_in_every_format(self):
+        params = { "dedup": 5, "fountain_type": [FountainType.TAP_WATER] }
+
+        json_response = build_fountains_response(request(b"area=Barcelona&dedup=5&type=tap_water"), 'fountains', DUPLICATES_DATA,
+                                                 CommonQueryParams(**params))
+        content = json.loads(json_response.body)
+
+        self.assertEqual((content["count"], content["merged"]), (2, 1))
+        self.assertEqual([(fountain["provider_id"], fountain.get("merged_ids"), fountain.get("name")) for fountain in content["fountains"]],
+                         [('node:1', ['node:2'], 'Font'), ('way:4', None, None)])
+
+        msgpack_response = build_fountains_response(request(b"area=Barcelona&dedup=5&type=tap_water&format=msgpack"), 'fountains',
+                                                     DUPLICATES_DATA, CommonQueryParams(format=ResponseFormat.MSGPACK, **params),
+                                                     prefetched_at=1)
+
+        msgpack_content = unpack_msgpack(msgpack_response.body)
+
+        for field in ("count", "merged", "fountains"):
+            self.assertEqual(msgpack_content[field], content[field])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+from datetime import datetime, timezone
+
+import os.path
+import tempfile
+import unittest
+
+from app.models.fountain import FountainOpenStreetMap
+from app.services.snapshot import FountainSnapshot
+from fountains_cli import AreaRun, publish_snapshot
+
+UPDATED_AT = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+def fountain(provider_id: str, version: int = 1) -> FountainOpenStreetMap:
+    return FountainOpenStreetMap.model_construct(lat=41.38, long=2.17, provider_id=provider_id, provider_updated_at=UPDATED_AT,
+                                                 osm_version=version)
+
+class PublishSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.snapshot_file = os.path.join(self.directory.name, 'fountains.snapshot')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def publish(self, *runs: AreaRun) -> dict:
+        publish_snapshot(list(runs), self.snapshot_file)
+
+        snapshot = FountainSnapshot(self.snapshot_file)
+
+        return { snapshot.provider_id(index): (snapshot.fountain_area(index), snapshot.columns["version"][index])
+                 for index in range(len(snapshot)) }
+
+    def run_area(self, area: str | None, *fountains: FountainOpenStreetMap, since: datetime | None = None) -> AreaRun:
+        return AreaRun(area, since, UPDATED_AT, fountains=list(fountains))
+
+    def test_area_run_keeps_other_areas(self):
+        self.publish(self.run_area(None, fountain('node:1'), fountain('node:2')))
+
+        fountains = self.publish(self.run_area('Spain', fountain('node:3')))
+
+        self.assertEqual(fountains, { 'node:1': (None, 1), 'node:2': (None, 1), 'node:3': ('Spain', 1) })
+
+    def test_area_run_deletes_fountains_gone_from_the_area(self):
+        self.publish(self.run_area('Spain', fountain('node:1'), fountain('node:2')),
+                     self.run_area('France', fountain('node:3')))
+
+        fountains = self.publish(self.run_area('Spain', fountain('node:2', 2)))
+
+        self.assertEqual(fountains, { 'node:2': ('Spain', 2), 'node:3': ('France', 1) })
+
+    def test_updated_run_only_adds_and_updates(self):
+        self.publish(self.run_area('Spain', fountain('node:1'), fountain('node:2')))
+
+        fountains = self.publish(self.run_area('Spain', fountain('node:2', 2), fountain('node:3'), since=UPDATED_AT))
+
+        self.assertEqual(fountains, { 'node:1': ('Spain', 1), 'node:2': ('Spain', 2), 'node:3': ('Spain', 1) })
+
+    def test_world_run_replaces_every_area(self):
+        self.publish(self.run_area('Spain', fountain('node:1')),
+                     self.run_area('France', fountain('node:2')))
+
+        fountains = self.publish(self.run_area(None, fountain('node:2')))
+
+        self.assertEqual(fountains, { 'node:2': (None, 1) })
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+from typing import Any, Dict, List
+
+from datetime import datetime, timezone
+from time import sleep, time
+
+import os
+import tempfile
+import threading
+import unittest
+
+from app.models.job import Job, JobStatus
+from app.services.jobs import JobManager
+
+class SlowJobManager(JobManager):
+    """
+    Widens the window between checking and claiming a job
+    """
+
+    def get(self, job_id: str) -> Job | None:
+        job = super().get(job_id)
+        sleep(0.05)
+        return job
+
+class JobManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.release = threading.Event()
+        self.runs = 0
+        self.runs_lock = threading.Lock()
+        self.managers: List[JobManager] = []
+
+    def tearDown(self):
+        self.release.set()
+
+        for manager in self.managers:
+            manager._executor.shutdown(wait=True) # pylint: disable=protected-access
+
+        self.directory.cleanup()
+
+    def manager(self, manager_class: type[JobManager] = JobManager, **kwargs) -> JobManager:
+        manager = manager_class(self.directory.name, workers=1, **kwargs)
+        self.managers.append(manager)
+        return manager
+
+    def job(self, created_at: datetime | None = None) -> Job:
+        return Job(id='job', query_url='http://test/fountains', timeout=1,
+                   created_at=created_at or datetime.now(timezone.utc))
+
+    def run_job(self, _: Job) -> Dict[str, Any]:
+        with self.runs_lock:
+            self.runs += 1
+
+        self.release.wait(5)
+
+        return { "count": 0 }
+
+    def wait_status(self, manager: JobManager, status: JobStatus) -> Job:
+        for _ in range(100):
+            job = manager.get('job')
+
+            if job is not None and job.status == status:
+                return job
+
+            sleep(0.01)
+
+        self.fail(f"job not {status.value}")
+
+    def test_identical_jobs_claimed_once_across_managers(self):
+        managers = [self.manager(SlowJobManager) for _ in range(4)] # as in different API worker processes
+        threads = [threading.Thread(target=manager.submit, args=(self.job(), self.run_job)) for manager in managers]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.wait_status(managers[0], JobStatus.RUNNING)
+        self.release.set()
+        self.wait_status(managers[0], JobStatus.COMPLETED)
+
+        self.assertEqual(self.runs, 1)
+
+    def test_long_queued_job_is_active(self):
+        busy = self.manager(heartbeat_interval=0.05, stale_timeout=0.2)
+        busy.submit(Job(id='other', query_url='http://test/fountains', timeout=1, created_at=datetime.now(timezone.utc)), self.run_job)
+
+        # created long ago (beyond its timeout) but still queued behind the other job, with heartbeats
+        queued = busy.submit(self.job(datetime(2024, 1, 1, tzinfo=timezone.utc)), self.run_job)
+        sleep(0.3)
+
+        job = self.manager(stale_timeout=0.2).submit(self.job(), self.run_job)
+
+        self.assertEqual((job.status, job.created_at), (JobStatus.PENDING, queued.created_at))
+
+    def test_abandoned_job_is_submitted_again(self):
+        manager = self.manager(stale_timeout=60)
+        manager._save(self.job().model_copy(update={ "status": JobStatus.RUNNING })) # pylint: disable=protected-access
+
+        job = manager.submit(self.job(), self.run_job)
+        self.assertEqual(self.runs, 0) # still running in another worker
+
+        stale_time = time() - 120
+        os.utime(manager.status_path('job'), (stale_time, stale_time)) # no heartbeat since 2 minutes ago
+
+        job = manager.submit(self.job(), self.run_job)
+        self.wait_status(manager, JobStatus.RUNNING)
+
+        self.assertEqual(self.runs, 1)
+
+if __name__ == '__main__':
+    unittest.main()
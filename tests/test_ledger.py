@@ -0,0 +1,63 @@
+from datetime import datetime, timezone
+
+import json
+import os.path
+import tempfile
+import threading
+import unittest
+
+from cli.ledger import RunLedger
+
+LOGS = [{ "timestamp": f"2024-01-0{day}T00:00:00+00:00", "area": "Barcelona", "count": 10, "request_time": 1.5,
+          "post_time": 0.1 } for day in range(1, 4)]
+
+class ImportJsonLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.ledger_file = os.path.join(self.directory.name, 'runs.sqlite')
+        self.log_file = os.path.join(self.directory.name, 'log.json')
+
+        with open(self.log_file, 'w', encoding='utf8') as log_file:
+            json.dump(LOGS, log_file)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_import(self):
+        with RunLedger(self.ledger_file) as ledger:
+            self.assertEqual(ledger.import_json_log(self.log_file, if_empty=True), 3)
+            self.assertEqual([run["timestamp"] for run in ledger.runs()], [log["timestamp"] for log in LOGS])
+            self.assertEqual(ledger.latest_timestamp("barcelona", None, None), datetime(2024, 1, 3, tzinfo=timezone.utc))
+
+    def test_not_imported_into_a_ledger_with_runs(self):
+        with RunLedger(self.ledger_file) as ledger:
+            ledger.record(datetime(2024, 2, 1, tzinfo=timezone.utc), None, None, False, 10, None, None, 1, 1.0, None, 0.1)
+
+            self.assertEqual(ledger.import_json_log(self.log_file, if_empty=True), 0)
+            self.assertEqual(len(ledger.runs()), 1)
+
+    def test_imported_once_by_concurrent_processes(self):
+        start = threading.Barrier(4)
+        imported = []
+
+        def import_log():
+            with RunLedger(self.ledger_file) as ledger:
+                start.wait()
+                imported.append(ledger.import_json_log(self.log_file, if_empty=True))
+
+        threads = [threading.Thread(target=import_log) for _ in range(start.parties)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(imported), [0, 0, 0, 3])
+
+        with RunLedger(self.ledger_file) as ledger:
+            self.assertEqual(len(ledger.runs()), 3)
+
+if __name__ == '__main__':
+    unittest.main()
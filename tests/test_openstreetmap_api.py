@@ -0,0 +1,30 @@
+from typing import Any, Callable, List
+
+import unittest
+
+from app.services.openstreetmap_api import OUT_META, OUT_PROJECTION, OpenStreetMapAPI
+
+class ProjectionTest(unittest.TestCase):
+
+    def query(self, project_tags: bool, all_tags: bool) -> str:
+        api = OpenStreetMapAPI(endpoints=['http://127.0.0.1:9/api/interpreter'], project_tags=project_tags)
+        queries: List[str] = []
+
+        def get(query: Callable[[], str], **_: Any):
+            queries.append(query())
+            return { "elements": [] }
+
+        api.overpass_pool.get = get # type: ignore
+        api.get_fountains_by_bbox(41.3, 2.1, 41.4, 2.2, timeout=10, all_tags=all_tags)
+
+        return queries[0]
+
+    def test_out_meta_by_default(self):
+        self.assertIn(OUT_META, self.query(project_tags=False, all_tags=False))
+
+    def test_projection(self):
+        self.assertIn(OUT_PROJECTION, self.query(project_tags=True, all_tags=False))
+        self.assertIn(OUT_META, self.query(project_tags=True, all_tags=True))
+
+if __name__ == '__main__':
+    unittest.main()
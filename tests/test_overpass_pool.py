@@ -0,0 +1,113 @@
+from typing import List
+
+import unittest
+import overpass
+
+from benchmarks.fake_osm import FakeOsmConfig, serve
+from app.services.deadline import Deadline, request_deadline
+from app.services.overpass_pool import OverpassEndpointPool, parse_available_slots, parse_rate_limit, parse_slot_wait
+from app.errors import RequestTimeoutError
+
+STATUS = """Connected as: 1234567890
+Current time: 2024-01-01T00:00:00Z
+Announced endpoint: none
+Rate limit: 3
+1 slots available now.
+Slot available after: 2024-01-01T00:00:12Z, in 12 seconds.
+Slot available after: 2024-01-01T00:00:05Z, in 5 seconds.
+Currently running queries (pid, space limit, time limit, start time):
+"""
+
+QUERY = '[out:json][timeout:{timeout}];node(41.3,2.1,41.4,2.2);out;'
+
+class StatusTest(unittest.TestCase):
+
+    def test_parse_status(self):
+        self.assertEqual(parse_rate_limit(STATUS), 3)
+        self.assertEqual(parse_available_slots(STATUS), 1)
+        self.assertEqual(parse_slot_wait(STATUS), 5)
+
+    def test_parse_status_without_slots(self):
+        status = "Rate limit: 2\nSlot available after: 2024-01-01T00:00:00Z, in -1 seconds.\n"
+
+        self.assertEqual(parse_available_slots(status), 0)
+        self.assertEqual(parse_slot_wait(status), 0)
+        self.assertEqual(parse_rate_limit("Rate limit: 0\n"), 0)
+        self.assertIsNone(parse_slot_wait("Rate limit: 0\n"))
+
+class OverpassEndpointPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def endpoint(self, **config) -> tuple:
+        server, stats = serve(FakeOsmConfig(jitter=0, elements=1, **{ 'latency': 0, **config }), port=0)
+        self.servers.append(server)
+
+        return f'http://127.0.0.1:{server.server_address[1]}/api/interpreter', stats
+
+    def test_ranked_by_latency_and_slots(self):
+        slow_url, _ = self.endpoint()
+        fast_url, _ = self.endpoint()
+        pool = OverpassEndpointPool([slow_url, fast_url], timeout=5)
+
+        for endpoint in pool.endpoints:
+            endpoint.record(0.2 if endpoint.url == slow_url else 0.01, failed=False)
+
+        self.assertEqual([endpoint.url for endpoint in pool.ranked()], [fast_url, slow_url])
+        self.assertEqual([endpoint.available_slots for endpoint in pool.endpoints], [2, 2])
+        self.assertEqual(pool.capacity(), 4)
+
+        # a failed endpoint is deprioritized (and has no slots until the next status check)
+        pool.endpoints[1].record(0.01, failed=True)
+
+        self.assertEqual([endpoint.url for endpoint in pool.ranked()], [slow_url, fast_url])
+        self.assertEqual(pool.endpoints[1].available_slots, 0)
+
+    def test_failover_builds_the_query_again(self):
+        failing_url, failing_stats = self.endpoint(error_504=1)
+        url, stats = self.endpoint()
+        pool = OverpassEndpointPool([failing_url, url], timeout=5)
+        pool.endpoints[1].record(1, failed=False) # rank the failing endpoint first
+
+        queries: List[str] = []
+
+        def build_query() -> str:
+            queries.append(QUERY.format(timeout=len(queries) + 1))
+            return queries[-1]
+
+        result = pool.get(build_query, responseformat='json', build=False)
+
+        self.assertEqual(len(result["elements"]), 1)
+        self.assertEqual(queries, [QUERY.format(timeout=1), QUERY.format(timeout=2)])
+        self.assertEqual((failing_stats["overpass"], stats["overpass"]), (1, 1))
+        self.assertEqual([endpoint.error_count for endpoint in pool.endpoints], [1, 0])
+
+    def test_no_failover_after_the_deadline(self):
+        failing_url, _ = self.endpoint(error_504=1, latency=0.2)
+        url, stats = self.endpoint()
+        pool = OverpassEndpointPool([failing_url, url], timeout=5)
+        pool.endpoints[1].record(1, failed=False)
+
+        with request_deadline(Deadline(0.1)):
+            with self.assertRaises(RequestTimeoutError):
+                pool.get(QUERY.format(timeout=1), responseformat='json', build=False)
+
+        self.assertNotIn("overpass", stats)
+
+    def test_all_endpoints_failing(self):
+        urls = [self.endpoint(error_429=1)[0] for _ in range(2)]
+        pool = OverpassEndpointPool(urls, timeout=5)
+
+        with self.assertRaises(overpass.errors.MultipleRequestsError):
+            pool.get(QUERY.format(timeout=1), responseformat='json', build=False)
+
+        self.assertEqual([endpoint.error_count for endpoint in pool.endpoints], [1, 1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+from typing import Callable, List
+
+from time import sleep
+
+import threading
+import unittest
+import overpass
+
+from app.services.deadline import Deadline, request_deadline
+from app.services.overpass_scheduler import OverpassScheduler, Priority
+from app.errors import RequestTimeoutError
+
+class FakePool:
+    """
+    Endpoints pool with a fixed capacity and every slot available at Overpass
+    """
+
+    def __init__(self, capacity: int):
+        self._capacity = capacity
+
+    def capacity(self) -> int:
+        return self._capacity
+
+    def slot_wait(self) -> int:
+        return 0
+
+class OverpassSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = OverpassScheduler(max_workers=4)
+        self.release = threading.Event()
+        self.threads: List[threading.Thread] = []
+
+    def tearDown(self):
+        self.release.set()
+
+        for thread in self.threads:
+            thread.join(5)
+
+    def blocking_query(self, name: str, dispatched: List[str]) -> Callable[[], str]:
+        def query() -> str:
+            dispatched.append(name)
+            self.release.wait(5)
+            return name
+
+        return query
+
+    def start(self, pool: FakePool, priority: Priority, query: Callable[[], str]):
+        thread = threading.Thread(target=self.scheduler.run, args=(pool, priority, query, 10))
+        thread.start()
+        self.threads.append(thread)
+
+    def wait_for(self, condition: Callable[[], bool]):
+        for _ in range(200):
+            if condition():
+                return
+
+            sleep(0.01)
+
+        self.fail(f"timed out waiting: {self.scheduler.stats()}")
+
+    def test_dispatched_by_priority(self):
+        pool = FakePool(capacity=1)
+        dispatched: List[str] = []
+        order: List[str] = []
+
+        self.start(pool, Priority.BULK, self.blocking_query('running', dispatched))
+        self.wait_for(lambda: dispatched == ['running'])
+
+        for priority in (Priority.PREFETCH, Priority.BULK, Priority.INTERACTIVE, Priority.BULK):
+            queued = self.scheduler.stats()["queued"]
+            self.start(pool, priority, lambda priority=priority: order.append(priority.name) or priority.name)
+            self.wait_for(lambda queued=queued: self.scheduler.stats()["queued"] == queued + 1)
+
+        self.release.set()
+        self.wait_for(lambda: len(order) == 4)
+
+        self.assertEqual(order, ['INTERACTIVE', 'BULK', 'BULK', 'PREFETCH'])
+
+    def test_reserved_interactive_slot(self):
+        pool = FakePool(capacity=2) # one slot reserved to interactive queries (OVERPASS_INTERACTIVE_SLOTS default)
+        dispatched: List[str] = []
+
+        self.start(pool, Priority.BULK, self.blocking_query('bulk 1', dispatched))
+        self.start(pool, Priority.BULK, self.blocking_query('bulk 2', dispatched))
+        self.wait_for(lambda: self.scheduler.stats()["running"] == 1 and self.scheduler.stats()["queued"] == 1)
+
+        self.start(pool, Priority.INTERACTIVE, self.blocking_query('interactive', dispatched))
+        self.wait_for(lambda: 'interactive' in dispatched)
+
+        self.assertEqual(dispatched, ['bulk 1', 'interactive'])
+        self.assertEqual(self.scheduler.stats()["bulk"]["queued"], 1)
+
+    def test_queued_again_when_rate_limited(self):
+        attempts: List[int] = []
+
+        def query() -> str:
+            attempts.append(1)
+
+            if len(attempts) == 1:
+                raise overpass.errors.MultipleRequestsError()
+
+            return 'result'
+
+        self.assertEqual(self.scheduler.run(FakePool(capacity=1), Priority.INTERACTIVE, query, timeout=5), 'result')
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(self.scheduler.stats()["rate_limited"], 1)
+        self.assertEqual(self.scheduler.stats()["running"], 0)
+
+    def test_abandoned_query_releases_its_slot(self):
+        pool = FakePool(capacity=1)
+        dispatched: List[str] = []
+
+        with request_deadline(Deadline(0.1)):
+            with self.assertRaises(RequestTimeoutError):
+                self.scheduler.run(pool, Priority.INTERACTIVE, self.blocking_query('abandoned', dispatched), timeout=10)
+
+        stats = self.scheduler.stats()
+
+        self.assertEqual((stats["running"], stats["abandoned"], stats["abandoned_running"]), (0, 1, 1))
+        self.assertEqual(self.scheduler.run(pool, Priority.INTERACTIVE, lambda: 'next', timeout=1), 'next')
+
+        self.release.set()
+        self.wait_for(lambda: self.scheduler.stats()["abandoned_running"] == 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+from time import monotonic
+
+import unittest
+
+from app.services.prefetch import HALF_LIFE, HotQuery, Prefetcher
+
+OSM_DATA = { "elements": [] }
+
+def query(kind: str, index: int) -> HotQuery:
+    return HotQuery(kind, (f"{kind} {index}",), False)
+
+class PrefetcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.prefetcher = Prefetcher(lambda query, timeout: OSM_DATA, top=3, min_score=3, max_areas=1,
+                                     hot_queries_file='/nonexistent/hot_queries.json')
+
+    def tearDown(self):
+        self.prefetcher.stop()
+
+    def request(self, hot_query: HotQuery, times: int = 1):
+        for _ in range(times):
+            self.prefetcher.get(hot_query, 60, lambda: OSM_DATA)
+
+    def test_minimum_score(self):
+        self.request(query('bbox', 1), 2)
+        self.request(query('bbox', 2), 4)
+
+        self.assertEqual(self.prefetcher._hot_queries(), [query('bbox', 2)]) # pylint: disable=protected-access
+
+    def test_maximum_areas(self):
+        self.request(query('area', 1), 6)
+        self.request(query('area', 2), 5)
+        self.request(query('radius', 1), 4)
+
+        self.assertEqual(self.prefetcher._hot_queries(), [query('area', 1), query('radius', 1)]) # pylint: disable=protected-access
+
+    def test_decayed_queries(self):
+        self.request(query('bbox', 1), 4)
+        self.request(query('bbox', 2), 4)
+
+        stats = self.prefetcher._queries[query('bbox', 1)] # pylint: disable=protected-access
+        stats.scored_at = monotonic() - HALF_LIFE
+
+        self.assertEqual(self.prefetcher._hot_queries(), [query('bbox', 2)]) # pylint: disable=protected-access
+
+        stats.scored_at = monotonic() - 10 * HALF_LIFE
+        self.prefetcher._forget_decayed(monotonic()) # pylint: disable=protected-access
+
+        self.assertNotIn(query('bbox', 1), self.prefetcher._queries) # pylint: disable=protected-access
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+from unittest.mock import patch
+
+import unittest
+
+from starlette.requests import Request
+
+from app import profiling
+
+def endpoint(request: Request) -> str:
+    return request.url.path
+
+def request(token: str | None = None) -> Request:
+    headers = [(profiling.PROFILE_HEADER.lower().encode(), token.encode())] if token is not None else []
+
+    return Request({ "type": "http", "method": "GET", "path": "/fountains/", "query_string": b"", "headers": headers,
+                     "server": ("localhost", 80), "scheme": "http", "root_path": "" })
+
+class ProfilingTest(unittest.TestCase):
+
+    def test_not_wrapped_without_token(self):
+        with patch.object(profiling, 'PROFILE_TOKEN', None):
+            self.assertIs(profiling.profiled(endpoint), endpoint)
+
+    def test_token(self):
+        self.assertTrue(profiling.profiling_requested(request('secret'), 'secret'))
+        self.assertFalse(profiling.profiling_requested(request('secreT'), 'secret'))
+        self.assertFalse(profiling.profiling_requested(request(), 'secret'))
+
+    def test_wrapped_with_token(self):
+        with patch.object(profiling, 'PROFILE_TOKEN', 'secret'):
+            profiled_endpoint = profiling.profiled(endpoint)
+
+        self.assertIsNot(profiled_endpoint, endpoint)
+        self.assertEqual(profiled_endpoint(request=request('other')), '/fountains/')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+from datetime import datetime, timezone
+
+import unittest
+
+from app.services.query_cache import Circle, QueryCache
+
+OSM_DATA = {
+    "elements": [
+        { "type": "node", "id": 1, "lat": 41.38, "lon": 2.17, "timestamp": "2024-01-01T00:00:00Z", "version": 1 },
+        { "type": "node", "id": 2, "lat": 41.381, "lon": 2.171, "timestamp": "2024-06-01T00:00:00Z", "version": 1 },
+    ]
+}
+
+class QueryCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = QueryCache()
+        self.fetches = 0
+
+    def fetch(self):
+        self.fetches += 1
+        return OSM_DATA
+
+    def get(self, region, updated):
+        return self.cache.get(region, updated, False, self.fetch, lambda _: self.fail("unexpected partial fetch"))
+
+    def test_naive_updated_on_cache_hit(self):
+        self.get(Circle(41.38, 2.17, 1000), datetime(2023, 1, 1, tzinfo=timezone.utc))
+
+        osm_data = self.get(Circle(41.38, 2.17, 500), datetime(2024, 3, 1)) # naive, UTC
+
+        self.assertEqual(self.fetches, 1)
+        self.assertEqual([element["id"] for element in osm_data["elements"]], [2])
+
+    def test_naive_cached_updated(self):
+        self.get(Circle(41.38, 2.17, 1000), datetime(2023, 1, 1))
+
+        osm_data = self.get(Circle(41.38, 2.17, 500), datetime(2024, 3, 1, 2, tzinfo=timezone.utc))
+
+        self.assertEqual(self.fetches, 1)
+        self.assertEqual([element["id"] for element in osm_data["elements"]], [2])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+from time import perf_counter
+
+import unittest
+
+from pydantic import ValidationError
+
+from app.models.route import FountainsAlongRequest
+from app.services.route import MAX_SAMPLES, Route
+
+class RouteTest(unittest.TestCase):
+
+    def test_locate(self):
+        route = Route([(41.0, 2.0), (41.0, 2.01), (41.01, 2.01)], 50)
+
+        along, to_route = route.locate(41.0003, 2.005) or (None, None)
+
+        self.assertAlmostEqual(along or 0, 419.7, delta=1)
+        self.assertAlmostEqual(to_route or 0, 33.4, delta=1)
+        self.assertIsNone(route.locate(41.001, 2.005))
+
+    def test_long_route_with_small_buffer(self):
+        start = perf_counter()
+        route = Route([(40.0, -3.0), (43.0, 2.0)], 1) # about 530 km
+
+        self.assertLess(perf_counter() - start, 5)
+        self.assertLessEqual(sum(len(cell) for cell in route._grid._cells.values()), MAX_SAMPLES + 1) # pylint: disable=protected-access
+
+        along, to_route = route.locate(41.5, -0.5) or (None, None)
+        self.assertIsNotNone(along)
+        self.assertLessEqual(to_route or 0, 1)
+
+    def test_minimum_buffer(self):
+        with self.assertRaises(ValidationError):
+            FountainsAlongRequest(line={ "type": "LineString", "coordinates": [[2.0, 41.0], [2.01, 41.0]] }, buffer=0.01)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+from datetime import datetime, timezone
+
+import os.path
+import tempfile
+import unittest
+
+from app.models.fountain import FountainOpenStreetMap
+from app.services.search import SearchIndex
+from app.services.snapshot import FountainSnapshot, write_snapshot
+
+UPDATED_AT = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+def fountain(provider_id: str, name: str, version: int = 1) -> FountainOpenStreetMap:
+    return FountainOpenStreetMap.model_construct(lat=41.38, long=2.17, provider_id=provider_id, provider_updated_at=UPDATED_AT,
+                                                 osm_version=version, name=name)
+
+class SearchIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.snapshot_file = os.path.join(self.directory.name, 'fountains.snapshot')
+        self.index = SearchIndex()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def publish(self, *fountains: FountainOpenStreetMap) -> FountainSnapshot:
+        write_snapshot(list(fountains), self.snapshot_file)
+        snapshot = FountainSnapshot(self.snapshot_file)
+        self.index.update(snapshot)
+        return snapshot
+
+    def search(self, query: str) -> list:
+        snapshot, rows = self.index.search(query)
+        return [snapshot.provider_id(row) for row in rows] if snapshot is not None else []
+
+    def test_not_indexed(self):
+        self.assertIsNone(self.index.snapshot)
+        self.assertEqual(self.search('font'), [])
+
+    def test_prefix_and_accents(self):
+        self.publish(fountain('node:1', 'Font de Canaletes'), fountain('node:2', 'Plaça de Catalunya'))
+
+        self.assertEqual(self.search('canal'), ['node:1'])
+        self.assertEqual(self.search('pl cat'), ['node:2'])
+
+    def test_incremental_update(self):
+        self.publish(fountain('node:1', 'Font de Canaletes'), fountain('node:2', 'Font Màgica'))
+        snapshot = self.publish(fountain('node:1', 'Font del Gat', 2), fountain('node:3', 'Font Vella'))
+
+        self.assertIs(self.index.snapshot, snapshot)
+        self.assertEqual(self.search('canaletes'), [])
+        self.assertEqual(self.search('magica'), [])
+        self.assertEqual(self.search('gat'), ['node:1'])
+        self.assertEqual(sorted(self.search('font')), ['node:1', 'node:3'])
+
+        # vocabulary kept sorted with only the tokens still indexed
+        self.assertEqual(self.index._vocabulary, sorted(self.index._postings)) # pylint: disable=protected-access
+        self.assertEqual(self.index.stats()["updated_documents"], 2 + 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+from datetime import datetime, timezone
+
+import os.path
+import random
+import tempfile
+import unittest
+
+from app.models.fountain import FountainOpenStreetMap, FountainType, SafeWater, Access
+from app.services.snapshot import FountainSnapshot, write_snapshot
+
+UPDATED_AT = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+def fountain(provider_id: str, lat: float, long: float, **values) -> FountainOpenStreetMap:
+    return FountainOpenStreetMap.model_construct(lat=lat, long=long, provider_id=provider_id, provider_updated_at=UPDATED_AT,
+                                                 osm_version=1, **values)
+
+class FountainSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.snapshot_file = os.path.join(self.directory.name, 'fountains.snapshot')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def snapshot(self, fountains, **kwargs) -> FountainSnapshot:
+        write_snapshot(fountains, self.snapshot_file, **kwargs)
+        return FountainSnapshot(self.snapshot_file)
+
+    def test_fountain_values(self):
+        snapshot = self.snapshot([
+            fountain('node:1', 41.38, 2.17, name='Canaletes', type=FountainType.TAP_WATER, safe_water=SafeWater.YES,
+                     access=Access.PERMISSIVE, access_bottles=True, fee=False),
+            fountain('way:2', -33.87, 151.21),
+        ], fountain_areas={ 'node:1': 'Barcelona' })
+
+        fountains = { fountain.provider_id: fountain for fountain in snapshot.fountains() }
+        canaletes = fountains['node:1']
+
+        self.assertEqual((canaletes.lat, canaletes.long, canaletes.name), (41.38, 2.17, 'Canaletes'))
+        self.assertEqual((canaletes.type, canaletes.safe_water, canaletes.legal_water, canaletes.access),
+                         (FountainType.TAP_WATER, SafeWater.YES, None, Access.PERMISSIVE))
+        self.assertEqual((canaletes.access_bottles, canaletes.fee, canaletes.access_pets), (True, False, None))
+        self.assertIsNone(fountains['way:2'].name)
+
+        areas = { snapshot.provider_id(index): snapshot.fountain_area(index) for index in range(len(snapshot)) }
+
+        self.assertEqual(areas, { 'node:1': 'Barcelona', 'way:2': None })
+
+    def test_within_bbox(self):
+        rng = random.Random(1)
+        clustered = [(41.38 + rng.gauss(0, 0.05), 2.17 + rng.gauss(0, 0.05)) for _ in range(3000)]
+        spread = [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(2000)]
+        borders = [(90, 180), (-90, -180), (0, 0), (41.4, 2.2)]
+
+        snapshot = self.snapshot([fountain(f'node:{index}', lat, long)
+                                  for index, (lat, long) in enumerate(clustered + spread + borders)])
+
+        self.assertGreater(snapshot.grid_level, 0)
+
+        lats, longs = snapshot.columns["lat"], snapshot.columns["long"]
+
+        bboxes = [(41.3, 2.1, 41.4, 2.2), (41.38, 2.17, 41.38, 2.17), (-90, -180, 90, 180), (-10, -10, 10, 10),
+                  (0, 0, 0, 0), (89, 179, 90, 180), (10, 10, 0, 0)]
+
+        for _ in range(20):
+            south_lat, north_lat = sorted((rng.uniform(-90, 90), rng.uniform(-90, 90)))
+            west_long, east_long = sorted((rng.uniform(-180, 180), rng.uniform(-180, 180)))
+            bboxes.append((south_lat, west_long, north_lat, east_long))
+
+        for south_lat, west_long, north_lat, east_long in bboxes:
+            expected = [index for index in range(len(snapshot))
+                        if south_lat <= lats[index] <= north_lat and west_long <= longs[index] <= east_long]
+
+            self.assertEqual(list(snapshot.within_bbox(south_lat, west_long, north_lat, east_long)), expected,
+                             (south_lat, west_long, north_lat, east_long))
+
+    def test_empty(self):
+        snapshot = self.snapshot([])
+
+        self.assertEqual(len(snapshot), 0)
+        self.assertEqual(list(snapshot.within_bbox(-90, -180, 90, 180)), [])
+
+if __name__ == '__main__':
+    unittest.main()
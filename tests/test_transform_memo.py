@@ -0,0 +1,41 @@
+import unittest
+
+from app.services.transform_fountains import PROJECTED_ELEMENT_TYPE, transform_fountains_osm
+from app.services.transform_memo import TransformMemo
+
+TAGS = { "amenity": "drinking_water", "name": "Font", "access": "yes" }
+
+ELEMENT = { "type": "node", "id": 1, "lat": 41.38, "lon": 2.17, "timestamp": "2024-01-01T00:00:00Z", "version": 2, "tags": TAGS }
+
+PROJECTED_ELEMENT = {
+    "type": PROJECTED_ELEMENT_TYPE, "id": 1, "geometry": { "type": "Point", "coordinates": [2.17, 41.38] },
+    "tags": { "@type": "node", "@version": "2", "@timestamp": "2024-01-01T00:00:00Z", "amenity": "drinking_water", "access": "" },
+}
+
+class TransformMemoTest(unittest.TestCase):
+
+    def test_same_version(self):
+        memo = TransformMemo()
+
+        first, = transform_fountains_osm({ "elements": [ELEMENT] }, memo=memo)
+        second, = transform_fountains_osm({ "elements": [ELEMENT] }, memo=memo)
+
+        self.assertEqual((memo.hits, memo.misses), (1, 1))
+        self.assertEqual(first, second)
+
+    def test_projection_mode(self):
+        memo = TransformMemo()
+
+        all_tags, = transform_fountains_osm({ "elements": [ELEMENT] }, memo=memo)
+        projected, = transform_fountains_osm({ "elements": [PROJECTED_ELEMENT] }, memo=memo)
+
+        self.assertEqual((memo.hits, memo.misses), (0, 2))
+        self.assertEqual((all_tags.name, projected.name), ("Font", None))
+        self.assertEqual(projected.access, None)
+
+        transform_fountains_osm({ "elements": [PROJECTED_ELEMENT] }, memo=memo)
+
+        self.assertEqual(memo.hits, 1)
+
+if __name__ == '__main__':
+    unittest.main()